@@ -1,4 +1,8 @@
 from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from app.services import model_preload
+from app.utils import utils
 
 router = APIRouter()
 
@@ -11,3 +15,15 @@ router = APIRouter()
 )
 def ping(request: Request) -> str:
     return "pong"
+
+
+@router.get(
+    "/health/ready",
+    tags=["Health Check"],
+    description="检查预加载模型是否已就绪，加载中或加载失败时返回 503",
+    response_description="preload state of every configured model",
+)
+def ready(request: Request):
+    status = model_preload.status()
+    status_code = 200 if status["ready"] else 503
+    return JSONResponse(status_code=status_code, content=utils.get_response(status_code, status))
@@ -28,6 +28,7 @@ from app.models.schema import (
 )
 from app.services import state as sm
 from app.services import task as tm
+from app.services import voice
 from app.utils import utils
 
 # 认证依赖项
@@ -69,9 +70,31 @@ def create_subtitle(
 def create_audio(
     background_tasks: BackgroundTasks, request: Request, body: AudioRequest
 ):
+    if body.stream:
+        return stream_audio(request, body)
     return create_task(request, body, stop_at="audio")
 
 
+def stream_audio(request: Request, body: AudioRequest):
+    """Stream the speech of a Chatterbox voice as WAV with chunked transfer, while it is being synthesized"""
+    request_id = base.get_task_id(request)
+    if not voice.is_chatterbox_voice(body.voice_name):
+        raise HttpException(
+            "", status_code=400, message=f"{request_id}: streaming is only supported for Chatterbox voices"
+        )
+    if not voice.CHATTERBOX_AVAILABLE:
+        raise HttpException(
+            "", status_code=400, message=f"{request_id}: Chatterbox TTS is not installed"
+        )
+    if not body.video_script.strip():
+        raise HttpException("", status_code=400, message=f"{request_id}: video_script is empty")
+
+    logger.info(f"streaming audio: {body.voice_name}, {len(body.video_script)} chars")
+    return StreamingResponse(
+        voice.chatterbox_tts_stream(body.video_script, body.voice_name), media_type="audio/wav"
+    )
+
+
 def create_task(
     request: Request,
     body: Union[TaskVideoRequest, SubtitleRequest, AudioRequest],
@@ -28,6 +28,12 @@ class VideoTransitionMode(str, Enum):
     slide_out = "SlideOut"
 
 
+class EncoderProfile(str, Enum):
+    draft = "draft"
+    standard = "standard"
+    archive = "archive"
+
+
 class VideoAspect(str, Enum):
     landscape = "16:9"
     portrait = "9:16"
@@ -132,6 +138,8 @@ class VideoParams(BaseModel):
     image_provider: Optional[str] = "wikimedia"  # wikimedia | flickr | openverse | google | same_energy
 
     n_threads: Optional[int] = 2
+    # x264 settings of the final encode: draft (fast previews), standard, archive
+    encoder_profile: Optional[EncoderProfile] = EncoderProfile.standard.value
     paragraph_number: Optional[int] = 1
 
 
@@ -171,6 +179,8 @@ class AudioRequest(BaseModel):
     bgm_file: Optional[str] = ""
     bgm_volume: Optional[float] = 0.2
     video_source: Optional[str] = "local"
+    # Chatterbox voices only: return the speech as a WAV stream while it is synthesized instead of creating a task
+    stream: Optional[bool] = False
 
 
 class VideoScriptParams:
@@ -9,9 +9,12 @@ Resources:
 
 from fastapi import APIRouter
 
+from app.controllers import ping
 from app.controllers.v1 import llm, video
 
 root_api_router = APIRouter()
+# health checks
+root_api_router.include_router(ping.router)
 # v1
 root_api_router.include_router(video.router)
 root_api_router.include_router(llm.router)
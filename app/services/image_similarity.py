@@ -6,11 +6,13 @@ Uses CLIP models for multimodal text-image similarity
 
 import os
 import requests
+from requests.adapters import HTTPAdapter
 import warnings
 import time
 import gc
 import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor
 try:
     import psutil  # For memory monitoring
     PSUTIL_AVAILABLE = True
@@ -22,30 +24,55 @@ import io
 import numpy as np
 from loguru import logger
 from app.config import config
+from app.services.utils import embedding_store, ffmpeg_renderer, material_catalog, model_registry
+from app.services.utils.embedding_cache import EmbeddingCache
 
 # Suppress transformers warnings about slow processors
 warnings.filterwarnings("ignore", message=".*slow.*processor.*")
 warnings.filterwarnings("ignore", message=".*use_fast.*")
 
-# Global model cache
-_clip_model = None
-_clip_processor = None
+# CLIP models and processors live in the model registry
 _model_load_fails = 0  # Track model loading failures
 _max_load_retries = 3  # Maximum retries before giving up
 _force_cpu_only = True  # Force CPU-only mode to avoid GPU issues
 
 # Add embedding cache to avoid reprocessing same images/text
-_image_embedding_cache = {}
-_text_embedding_cache = {}
-_cache_max_size = 100  # Limit cache size to prevent memory issues
+_cache_max_bytes = int(config.app.get("clip_embedding_cache_mb", 64)) * 1024 * 1024  # Per cache, to prevent memory issues
 _caching_enabled = True  # Can be disabled for testing or if memory is limited
 
+def _image_disk_store():
+    """Image embeddings are also kept on disk, by hash of model and thumbnail URL"""
+    if not config.app.get("enable_clip_disk_cache", True):
+        return None
+    try:
+        return embedding_store.get_store()
+    except Exception as e:
+        logger.warning(f"CLIP disk cache unavailable: {e}")
+        return None
+
+def _tensor_to_array(embeds):
+    return embeds.detach().cpu().numpy().ravel()
+
+def _array_to_tensor(array):
+    import torch
+    return torch.from_numpy(array.astype(np.float32)).unsqueeze(0)
+
+_text_embedding_cache = EmbeddingCache("clip-text", _cache_max_bytes)
+_image_embedding_cache = EmbeddingCache(
+    "clip-image", _cache_max_bytes, disk_store=_image_disk_store, to_array=_tensor_to_array, from_array=_array_to_tensor
+)
+
 # Rate limiting to prevent memory issues
 _last_inference_time = 0
 _inference_count = 0
 INFERENCE_DELAY = 0.15  # Slightly increased delay for stability
 MAX_BATCH_SIZE = 10    # Process in smaller batches
 
+# Concurrent thumbnail downloads of the batched similarity API
+THUMBNAIL_WORKERS = 8
+_http_session = None
+_http_session_lock = threading.Lock()
+
 def check_image_similarity_dependencies() -> bool:
     """Check if image similarity dependencies are available"""
     try:
@@ -97,84 +124,25 @@ def timeout_wrapper(timeout_seconds=30):
         return wrapper
     return decorator
 
+def _registry_name(model_name: str) -> str:
+    return f"clip:{model_name}"
+
 def load_clip_model(model_name: str = "clip-vit-base-patch32"):
-    """Load CLIP model for text-image similarity"""
-    global _clip_model, _clip_processor, _model_load_fails
+    """Load CLIP model for text-image similarity, shared through the model registry"""
+    global _model_load_fails
     
     # Check if we've had too many failures
     if _model_load_fails >= _max_load_retries:
         safe_log("error", f"❌ Maximum model loading retries ({_max_load_retries}) exceeded")
         raise Exception(f"Model loading failed {_model_load_fails} times, giving up")
     
-    if _clip_model is not None:
-        return _clip_model, _clip_processor
-    
     try:
-        import torch
-        from transformers import CLIPProcessor, CLIPModel
-        
-        # Map model names to HuggingFace model IDs
-        model_mapping = {
-            "clip-vit-base-patch32": "openai/clip-vit-base-patch32",
-            "clip-vit-base-patch16": "openai/clip-vit-base-patch16", 
-            "clip-vit-large-patch14": "openai/clip-vit-large-patch14"
-        }
-        
-        hf_model_name = model_mapping.get(model_name, model_name)
-        
-        safe_log("info", f"🖼️  Loading CLIP model: {model_name}")
-        
-        # Set up cache directory for persistent storage
-        cache_dir = os.path.expanduser("~/.cache/huggingface/transformers")
-        os.makedirs(cache_dir, exist_ok=True)
-        
-        # Load processor with slow tokenizer for compatibility
-        try:
-            _clip_processor = CLIPProcessor.from_pretrained(
-                hf_model_name,
-                cache_dir=cache_dir,
-                use_fast=False  # Use slow processor to avoid CLIPImageProcessorFast attribute errors
-            )
-        except Exception as processor_error:
-            safe_log("warning", f"⚠️  Could not load processor with cache ({processor_error}), trying without cache")
-            _clip_processor = CLIPProcessor.from_pretrained(
-                hf_model_name,
-                use_fast=False
-            )
-        
-        # Try to load with safetensors first, fallback to regular loading
-        try:
-            _clip_model = CLIPModel.from_pretrained(
-                hf_model_name,
-                cache_dir=cache_dir,
-                use_safetensors=True
-            )
-            safe_log("info", "✅ Loaded model using safetensors format")
-        except Exception as safetensor_error:
-            safe_log("warning", f"⚠️  Could not load with safetensors ({safetensor_error}), falling back to regular loading")
-            _clip_model = CLIPModel.from_pretrained(
-                hf_model_name,
-                cache_dir=cache_dir
-            )
-            safe_log("info", "✅ Loaded model using regular format")
-        
-        # Keep model on CPU to avoid memory issues
-        _clip_model = _clip_model.to("cpu")
-        
-        # Force CPU-only mode if enabled
-        if _force_cpu_only:
-            safe_log("info", "🖥️  Forcing CPU-only mode for CLIP model")
-            _clip_model = _clip_model.to("cpu")
-            # Ensure no CUDA operations
-            if hasattr(torch.backends, 'cudnn'):
-                torch.backends.cudnn.enabled = False
-        
-        safe_log("success", f"✅ CLIP model loaded successfully: {model_name} (device: {'CPU-only' if _force_cpu_only else 'auto'})")
+        model, processor = model_registry.get_model(_registry_name(model_name), lambda: _load_clip_model(model_name))
         
         # Reset failure count on successful load
         _model_load_fails = 0
         
-        return _clip_model, _clip_processor
+        return model, processor
         
     except Exception as e:
         _model_load_fails += 1
@@ -186,15 +154,102 @@ def load_clip_model(model_name: str = "clip-vit-base-patch32"):
         
         raise
 
-@timeout_wrapper(timeout_seconds=30)  # Re-enable timeout protection
+def _load_clip_model(model_name: str):
+    import torch
+    from transformers import CLIPProcessor, CLIPModel
+    
+    # Map model names to HuggingFace model IDs
+    model_mapping = {
+        "clip-vit-base-patch32": "openai/clip-vit-base-patch32",
+        "clip-vit-base-patch16": "openai/clip-vit-base-patch16", 
+        "clip-vit-large-patch14": "openai/clip-vit-large-patch14"
+    }
+    
+    hf_model_name = model_mapping.get(model_name, model_name)
+    
+    safe_log("info", f"🖼️  Loading CLIP model: {model_name}")
+    
+    # Set up cache directory for persistent storage
+    cache_dir = os.path.expanduser("~/.cache/huggingface/transformers")
+    os.makedirs(cache_dir, exist_ok=True)
+    
+    # Load processor with slow tokenizer for compatibility
+    try:
+        processor = CLIPProcessor.from_pretrained(
+            hf_model_name,
+            cache_dir=cache_dir,
+            use_fast=False  # Use slow processor to avoid CLIPImageProcessorFast attribute errors
+        )
+    except Exception as processor_error:
+        safe_log("warning", f"⚠️  Could not load processor with cache ({processor_error}), trying without cache")
+        processor = CLIPProcessor.from_pretrained(
+            hf_model_name,
+            use_fast=False
+        )
+    
+    # Try to load with safetensors first, fallback to regular loading
+    try:
+        model = CLIPModel.from_pretrained(
+            hf_model_name,
+            cache_dir=cache_dir,
+            use_safetensors=True
+        )
+        safe_log("info", "✅ Loaded model using safetensors format")
+    except Exception as safetensor_error:
+        safe_log("warning", f"⚠️  Could not load with safetensors ({safetensor_error}), falling back to regular loading")
+        model = CLIPModel.from_pretrained(
+            hf_model_name,
+            cache_dir=cache_dir
+        )
+        safe_log("info", "✅ Loaded model using regular format")
+    
+    # Keep model on CPU to avoid memory issues
+    model = model.to("cpu")
+    
+    # Force CPU-only mode if enabled
+    if _force_cpu_only:
+        safe_log("info", "🖥️  Forcing CPU-only mode for CLIP model")
+        model = model.to("cpu")
+        # Ensure no CUDA operations
+        if hasattr(torch.backends, 'cudnn'):
+            torch.backends.cudnn.enabled = False
+    
+    safe_log("success", f"✅ CLIP model loaded successfully: {model_name} (device: {'CPU-only' if _force_cpu_only else 'auto'})")
+    return model, processor
+
+def _cosine_similarity(text_embeds, image_embeds) -> float:
+    """Cosine similarity of two normalized embeddings, mapped from (-1, 1) to (0, 1)"""
+    import torch
+    
+    with torch.no_grad():
+        similarity = torch.cosine_similarity(text_embeds, image_embeds, dim=-1).item()
+    return float((similarity + 1) / 2)
+
 def calculate_text_image_similarity(text: str, image_url: str, model_name: str = "clip-vit-base-patch32") -> float:
     """Calculate similarity between text and image using CLIP"""
-    global _last_inference_time, _inference_count, _image_embedding_cache, _text_embedding_cache
-    
     if not IMAGE_SIMILARITY_AVAILABLE:
         safe_log("warning", "Image similarity not available - missing dependencies")
         return 0.0
     
+    text_embeds = image_embeds = None
+    if _caching_enabled:
+        text_embeds = _text_embedding_cache.get(f"{model_name}:{text}")
+        image_embeds = _image_embedding_cache.get(f"{model_name}:{image_url}")
+        # cache hits are scored right away, only inference runs under the timeout thread
+        if text_embeds is not None and image_embeds is not None:
+            try:
+                return _cosine_similarity(text_embeds, image_embeds)
+            except Exception as cache_error:
+                safe_log("error", f"❌ Error calculating from cache: {cache_error}")
+    
+    # keep the model resident while it is in use
+    with model_registry.pinned(_registry_name(model_name)):
+        return _calculate_text_image_similarity(text, image_url, model_name, text_embeds, image_embeds)
+
+@timeout_wrapper(timeout_seconds=30)  # Re-enable timeout protection
+def _calculate_text_image_similarity(text: str, image_url: str, model_name: str, text_embeds=None, image_embeds=None) -> float:
+    global _last_inference_time, _inference_count
+    
     try:
         # Minimal logging - only log device info once per session
         if not hasattr(calculate_text_image_similarity, '_device_logged'):
@@ -205,25 +260,9 @@ def calculate_text_image_similarity(text: str, image_url: str, model_name: str =
         
         import torch
         
-        # Check cache first
         text_cache_key = f"{model_name}:{text}"
         image_cache_key = f"{model_name}:{image_url}"
         
-        # If both embeddings are cached, calculate similarity directly
-        if _caching_enabled and text_cache_key in _text_embedding_cache and image_cache_key in _image_embedding_cache:
-            try:
-                text_embeds = _text_embedding_cache[text_cache_key]
-                image_embeds = _image_embedding_cache[image_cache_key]
-                
-                with torch.no_grad():
-                    similarity = torch.cosine_similarity(text_embeds, image_embeds, dim=-1).item()
-                    similarity = (similarity + 1) / 2  # Convert from (-1, 1) to (0, 1)
-                    
-                return float(similarity)
-            except Exception as cache_error:
-                safe_log("error", f"❌ Error calculating from cache: {cache_error}")
-                # Continue with fresh calculation
-        
         # Rate limiting to prevent overwhelming the system
         current_time = time.time()
         if current_time - _last_inference_time < INFERENCE_DELAY:
@@ -234,7 +273,6 @@ def calculate_text_image_similarity(text: str, image_url: str, model_name: str =
         # Periodic cleanup every 200 inferences - minimal logging
         if _inference_count % 200 == 0:
             try:
-                clear_cache_if_needed()
                 gc.collect()
                 if torch.cuda.is_available():
                     torch.cuda.empty_cache()
@@ -258,14 +296,10 @@ def calculate_text_image_similarity(text: str, image_url: str, model_name: str =
                 return 0.0
         
         # Download and process image with timeout and size limits (only if not cached)
-        image_embeds = None
         image = None
         
-        if _caching_enabled and image_cache_key in _image_embedding_cache:
-            image_embeds = _image_embedding_cache[image_cache_key]
-        
         # Always download image if we don't have cached embeddings or if we need it for processing
-        if image_embeds is None or not _caching_enabled or text_cache_key not in _text_embedding_cache:
+        if image_embeds is None or text_embeds is None:
             try:
                 # Use shorter timeout and add more robust error handling
                 response = requests.get(
@@ -319,11 +353,6 @@ def calculate_text_image_similarity(text: str, image_url: str, model_name: str =
                 safe_log("error", f"❌ Failed to load image {image_url}: {img_error}")
                 return 0.0
         
-        # Process text (only if not cached)
-        text_embeds = None
-        if _caching_enabled and text_cache_key in _text_embedding_cache:
-            text_embeds = _text_embedding_cache[text_cache_key]
-        
         # Process inputs with error handling - minimal logging
         try:
             if text_embeds is None or image_embeds is None:
@@ -334,10 +363,8 @@ def calculate_text_image_similarity(text: str, image_url: str, model_name: str =
         except AttributeError as attr_error:
             if "_valid_processor_keys" in str(attr_error):
                 safe_log("warning", f"⚠️  Processor compatibility issue ({attr_error}), reloading model...")
-                # Clear global cache and reload
-                global _clip_model, _clip_processor
-                _clip_model = None
-                _clip_processor = None
+                # Drop the registered model and reload
+                model_registry.unload(_registry_name(model_name))
                 model, processor = load_clip_model(model_name)
                 inputs = processor(text=[text], images=image, return_tensors="pt", padding=True)
             else:
@@ -364,13 +391,13 @@ def calculate_text_image_similarity(text: str, image_url: str, model_name: str =
                         text_embeds = outputs.text_embeds / outputs.text_embeds.norm(p=2, dim=-1, keepdim=True)
                         # Cache the text embedding
                         if _caching_enabled:
-                            _text_embedding_cache[text_cache_key] = text_embeds.clone()
+                            _text_embedding_cache.put(text_cache_key, text_embeds.clone())
                         
                     if image_embeds is None:
                         image_embeds = outputs.image_embeds / outputs.image_embeds.norm(p=2, dim=-1, keepdim=True)
                         # Cache the image embedding
                         if _caching_enabled:
-                            _image_embedding_cache[image_cache_key] = image_embeds.clone()
+                            _image_embedding_cache.put(image_cache_key, image_embeds.clone())
                 
                 # Calculate cosine similarity
                 similarity = torch.cosine_similarity(text_embeds, image_embeds, dim=-1).item()
@@ -400,10 +427,6 @@ def calculate_text_image_similarity(text: str, image_url: str, model_name: str =
                     del inputs
                 if 'outputs' in locals():
                     del outputs
-                if 'text_embeds' in locals() and text_cache_key not in _text_embedding_cache:
-                    del text_embeds
-                if 'image_embeds' in locals() and image_cache_key not in _image_embedding_cache:
-                    del image_embeds
                 if 'image' in locals():
                     del image
                 if 'image_data' in locals():
@@ -437,9 +460,21 @@ def calculate_text_image_similarity(text: str, image_url: str, model_name: str =
         return 0.0
 
 def calculate_video_image_similarity(text: str, video_metadata: Dict, model_name: str = "clip-vit-base-patch32") -> float:
-    """Calculate similarity between text and video images (thumbnail + preview frames)"""
+    """Calculate similarity between text and video images (sampled keyframes, or thumbnail + preview frames)"""
     if not IMAGE_SIMILARITY_AVAILABLE:
         return 0.0
+    
+    # Keyframes sampled from the video file need no network and cover every source
+    video_path = video_metadata.get('video_path')
+    if video_path:
+        try:
+            # scored once per sentence, only use frames that were sampled already
+            frames = video_frame_embeddings([video_path], model_name, max_missing=0).get(os.path.abspath(video_path))
+            if frames is not None:
+                text_embeds = encode_texts([text], model_name).cpu().numpy()
+                return float(((text_embeds @ frames.T).max() + 1) / 2)
+        except Exception as e:
+            logger.warning(f"Failed to score keyframes of {video_path}: {e}")
         
     # Get image URLs from video metadata
     image_urls = []
@@ -473,6 +508,211 @@ def calculate_video_image_similarity(text: str, video_metadata: Dict, model_name
     
     return max_similarity
 
+def _get_session() -> requests.Session:
+    """Shared HTTP session, so thumbnail downloads reuse pooled connections"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=THUMBNAIL_WORKERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = "Mozilla/5.0 (compatible; ImageBot/1.0)"
+            _http_session = session
+        return _http_session
+
+def fetch_thumbnail(image_url: str, max_bytes: int = 10 * 1024 * 1024, max_side: int = 512) -> Optional[Image.Image]:
+    """Download an image with the shared session, size limited and scaled down for CLIP"""
+    try:
+        with _get_session().get(image_url, timeout=(5, 10), stream=True, proxies=config.proxy) as response:
+            response.raise_for_status()
+            image_data = bytearray()
+            for chunk in response.iter_content(chunk_size=65536):
+                image_data.extend(chunk)
+                if len(image_data) > max_bytes:
+                    logger.warning(f"Image larger than {max_bytes} bytes, skipping: {image_url}")
+                    return None
+        image = Image.open(io.BytesIO(image_data)).convert('RGB')
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        return image
+    except Exception as e:
+        logger.warning(f"Failed to download image from {image_url}: {e}")
+        return None
+
+def prefetch_thumbnails(image_urls: List[str], max_workers: int = THUMBNAIL_WORKERS) -> Dict[str, Image.Image]:
+    """Download images concurrently, by URL; failed downloads are left out"""
+    image_urls = list(dict.fromkeys(url for url in image_urls if url))
+    if not image_urls:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(image_urls))) as executor:
+        images = executor.map(fetch_thumbnail, image_urls)
+        return {url: image for url, image in zip(image_urls, images) if image is not None}
+
+def _features(output):
+    # transformers 5 returns a model output with the projected embeddings as pooler_output
+    return getattr(output, "pooler_output", output)
+
+def encode_texts(texts: List[str], model_name: str = "clip-vit-base-patch32", batch_size: int = 64):
+    """Normalized CLIP text embeddings, one row per text, cached per text"""
+    import torch
+    
+    embeds_by_text = {}
+    for text in dict.fromkeys(texts):
+        embeds = _text_embedding_cache.get(f"{model_name}:{text}")
+        if embeds is not None:
+            embeds_by_text[text] = embeds
+    missing = [text for text in dict.fromkeys(texts) if text not in embeds_by_text]
+    if missing:
+        with model_registry.pinned(_registry_name(model_name)):
+            model, processor = load_clip_model(model_name)
+            for i in range(0, len(missing), batch_size):
+                batch = missing[i:i + batch_size]
+                inputs = processor(text=batch, return_tensors="pt", padding=True, truncation=True)
+                with torch.no_grad():
+                    embeds = _features(model.get_text_features(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"]))
+                embeds = embeds / embeds.norm(p=2, dim=-1, keepdim=True)
+                for text, embed in zip(batch, embeds):
+                    embeds_by_text[text] = embed.unsqueeze(0)
+                    _text_embedding_cache.put(f"{model_name}:{text}", embeds_by_text[text])
+    return torch.cat([embeds_by_text[text] for text in texts]) if texts else torch.zeros((0, 0))
+
+def encode_images(image_urls: List[str], model_name: str = "clip-vit-base-patch32", batch_size: int = 32):
+    """Normalized CLIP image embeddings by URL, prefetching the images that are not cached yet"""
+    import torch
+    
+    embeds_by_url = {}
+    for url in dict.fromkeys(image_urls):
+        embeds = _image_embedding_cache.get(f"{model_name}:{url}")
+        if embeds is not None:
+            embeds_by_url[url] = embeds
+    missing = [url for url in dict.fromkeys(image_urls) if url not in embeds_by_url]
+    if missing:
+        images = prefetch_thumbnails(missing)
+        fetched = [url for url in missing if url in images]
+        if fetched:
+            with model_registry.pinned(_registry_name(model_name)):
+                model, processor = load_clip_model(model_name)
+                for i in range(0, len(fetched), batch_size):
+                    batch = fetched[i:i + batch_size]
+                    inputs = processor(images=[images[url] for url in batch], return_tensors="pt")
+                    with torch.no_grad():
+                        embeds = _features(model.get_image_features(pixel_values=inputs["pixel_values"]))
+                    embeds = embeds / embeds.norm(p=2, dim=-1, keepdim=True)
+                    for url, embed in zip(batch, embeds):
+                        embeds_by_url[url] = embed.unsqueeze(0)
+                        _image_embedding_cache.put(f"{model_name}:{url}", embeds_by_url[url])
+    return embeds_by_url
+
+def frame_sampling_enabled() -> bool:
+    return config.app.get("enable_clip_frame_sampling", True)
+
+def selection_frame_budget() -> int:
+    """Videos without keyframe embeddings that one selection may sample, the others are scored by thumbnail"""
+    return int(config.app.get("clip_frame_max_missing", 8))
+
+def encode_frames(frames: np.ndarray, model_name: str = "clip-vit-base-patch32", batch_size: int = 32) -> np.ndarray:
+    """Normalized CLIP image embeddings of RGB frames (frames x height x width x 3), one row per frame"""
+    import torch
+    
+    blocks = []
+    with model_registry.pinned(_registry_name(model_name)):
+        model, processor = load_clip_model(model_name)
+        for i in range(0, len(frames), batch_size):
+            inputs = processor(images=[Image.fromarray(frame) for frame in frames[i:i + batch_size]], return_tensors="pt")
+            with torch.no_grad():
+                embeds = _features(model.get_image_features(pixel_values=inputs["pixel_values"]))
+            blocks.append((embeds / embeds.norm(p=2, dim=-1, keepdim=True)).cpu().numpy())
+    return np.vstack(blocks).astype(np.float32)
+
+def embed_video_frames(video_path: str, model_name: str = "clip-vit-base-patch32", count: Optional[int] = None) -> Optional[np.ndarray]:
+    """Sample keyframes of a video, encode them with CLIP and record them in the material catalog"""
+    if count is None:
+        count = int(config.app.get("clip_frame_count", 4))
+    try:
+        frames = ffmpeg_renderer.sample_keyframes(video_path, count=count)
+        if not len(frames):
+            logger.warning(f"no keyframes decoded from {video_path}")
+            return None
+        embeddings = encode_frames(frames, model_name)
+        material_catalog.save_frame_embeddings(video_path, model_name, embeddings)
+        return embeddings
+    except Exception as e:
+        logger.warning(f"failed to embed keyframes of {video_path}: {e}")
+        return None
+
+def video_frame_embeddings(video_paths: List[str], model_name: str = "clip-vit-base-patch32", max_missing: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """Keyframe embeddings of videos by absolute path, sampling up to `max_missing` videos that have none yet (all by default)"""
+    if not frame_sampling_enabled():
+        return {}
+    found = material_catalog.frame_embeddings(video_paths, model_name)
+    missing = [
+        video_path for video_path in dict.fromkeys(os.path.abspath(path) for path in video_paths)
+        if video_path not in found and os.path.exists(video_path)
+    ]
+    if max_missing is not None and len(missing) > max_missing:
+        logger.info(f"sampling keyframes of {max_missing} of {len(missing)} videos without frame embeddings")
+        missing = missing[:max(0, max_missing)]
+    for video_path in missing:
+        embeddings = embed_video_frames(video_path, model_name)
+        if embeddings is not None:
+            found[video_path] = embeddings
+    return found
+
+def video_similarity_matrix(texts: List[str], video_metadata: List[Dict], model_name: str = "clip-vit-base-patch32") -> np.ndarray:
+    """Image similarity of every text (rows) with the representative image of every video (columns)
+
+    Videos are represented by their best matching sampled keyframe. Thumbnails of videos
+    without keyframe embeddings are downloaded concurrently, texts and images are encoded
+    in batches, and the scores, mapped to (0, 1) like calculate_text_image_similarity,
+    come from matrix products. Videos without a usable image score 0.
+    """
+    import torch
+    
+    scores = np.zeros((len(texts), len(video_metadata)))
+    if not texts or not video_metadata or not IMAGE_SIMILARITY_AVAILABLE:
+        return scores
+    
+    try:
+        video_paths = [os.path.abspath(meta['video_path']) for meta in video_metadata if meta.get('video_path')]
+        frames = video_frame_embeddings(video_paths, model_name, max_missing=selection_frame_budget())
+        if frames:
+            text_matrix = encode_texts(texts, model_name).cpu().numpy()
+            for i, video_meta in enumerate(video_metadata):
+                video_frames = frames.get(os.path.abspath(video_meta.get('video_path') or ''))
+                if video_frames is not None:
+                    scores[:, i] = ((text_matrix @ video_frames.T).max(axis=1) + 1) / 2
+    except Exception as e:
+        safe_log("error", f"❌ Failed to score keyframe embeddings: {e}")
+        frames = {}
+    
+    video_urls = []
+    for video_meta in video_metadata:
+        if os.path.abspath(video_meta.get('video_path') or '') in frames:
+            video_urls.append(None)
+            continue
+        image_urls = []
+        if video_meta.get('thumbnail_url'):
+            image_urls.append(video_meta['thumbnail_url'])
+        if video_meta.get('preview_images'):
+            image_urls.extend(video_meta['preview_images'])
+        selected = select_representative_images(image_urls, max_images=1)
+        video_urls.append(selected[0] if selected else None)
+    
+    try:
+        image_embeds = encode_images([url for url in video_urls if url], model_name)
+        columns = [i for i, url in enumerate(video_urls) if url in image_embeds]
+        if not columns:
+            return scores
+        text_embeds = encode_texts(texts, model_name)
+        image_matrix = torch.cat([image_embeds[video_urls[i]] for i in columns])
+        with torch.no_grad():
+            similarity = (text_embeds @ image_matrix.T).cpu().numpy()
+        scores[:, columns] = (similarity + 1) / 2
+    except Exception as e:
+        safe_log("error", f"❌ Failed to calculate image similarity matrix: {e}")
+    return scores
+
 def download_image(image_url: str) -> Optional[Image.Image]:
     """Download and load image from URL"""
     try:
@@ -529,28 +769,8 @@ def select_representative_images(image_urls: List[str], max_images: int = 1) ->
     
     return selected[:max_images]
 
-def clear_cache_if_needed():
-    """Clear caches if they exceed maximum size"""
-    global _image_embedding_cache, _text_embedding_cache
-    
-    if len(_image_embedding_cache) > _cache_max_size:
-        # Remove oldest entries (simple FIFO)
-        to_remove = len(_image_embedding_cache) - _cache_max_size + 10  # Remove a few extra
-        for _ in range(to_remove):
-            if _image_embedding_cache:
-                _image_embedding_cache.popitem(last=False)
-    
-    if len(_text_embedding_cache) > _cache_max_size:
-        # Remove oldest entries (simple FIFO)
-        to_remove = len(_text_embedding_cache) - _cache_max_size + 10  # Remove a few extra
-        for _ in range(to_remove):
-            if _text_embedding_cache:
-                _text_embedding_cache.popitem(last=False)
-
 def clear_all_caches():
     """Clear all embedding caches"""
-    global _image_embedding_cache, _text_embedding_cache
-    
     logger.info(f"🧹 Clearing all caches (image: {len(_image_embedding_cache)}, text: {len(_text_embedding_cache)})")
     _image_embedding_cache.clear()
     _text_embedding_cache.clear()
@@ -560,7 +780,9 @@ def get_cache_stats():
     return {
         'text_cache_size': len(_text_embedding_cache),
         'image_cache_size': len(_image_embedding_cache),
-        'cache_max_size': _cache_max_size,
+        'cache_max_bytes': _cache_max_bytes,
+        'text_cache': _text_embedding_cache.stats(),
+        'image_cache': _image_embedding_cache.stats(),
         'caching_enabled': _caching_enabled,
         'inference_count': _inference_count,
         'model_load_fails': _model_load_fails
@@ -605,31 +827,12 @@ def log_memory_usage(context: str = ""):
 
 def reset_clip_model():
     """Reset the global CLIP model if it gets into a bad state"""
-    global _clip_model, _clip_processor, _model_load_fails
+    global _model_load_fails
     safe_log("warning", "🔄 Resetting CLIP model due to errors")
     
     try:
-        # Clear any existing model
-        if _clip_model is not None:
-            del _clip_model
-        if _clip_processor is not None:
-            del _clip_processor
-            
-        _clip_model = None
-        _clip_processor = None
-        
-        # Force garbage collection
-        import gc
-        gc.collect()
-        
-        # Clear CUDA cache if available
-        try:
-            import torch
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
-        except:
-            pass
-            
+        # Unloading collects garbage and clears the CUDA cache
+        model_registry.get_registry().unload_prefix(_registry_name(""))
         safe_log("info", "✅ CLIP model reset completed")
         
     except Exception as e:
@@ -638,7 +841,7 @@ def reset_clip_model():
 
 def is_model_healthy() -> bool:
     """Check if the model is in a healthy state"""
-    global _model_load_fails, _clip_model, _clip_processor
+    global _model_load_fails
     
     # Check if we've had too many failures
     if _model_load_fails >= _max_load_retries:
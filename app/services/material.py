@@ -1,3 +1,4 @@
+import math
 import os
 import random
 from typing import List
@@ -5,12 +6,12 @@ from urllib.parse import urlencode
 
 import requests
 from loguru import logger
-from moviepy.video.io.VideoFileClip import VideoFileClip
 
 from app.config import config
 from app.models.schema import MaterialInfo, VideoAspect, VideoConcatMode
 from app.utils import utils
-from app.services import semantic_video
+from app.services import image_similarity, semantic_video
+from app.services.utils import ffmpeg_renderer, material_index
 
 requested_count = 0
 
@@ -153,7 +154,24 @@ def search_videos_pixabay(
     return []
 
 
-def save_video(video_url: str, save_dir: str = "", search_term: str = "", thumbnail_url: str = "", preview_images: list = None) -> str:
+def _embed_frames(video_path: str, frame_model: str):
+    """Sample and embed the keyframes of a downloaded video for image similarity, once per video"""
+    if not frame_model or not image_similarity.IMAGE_SIMILARITY_AVAILABLE or not image_similarity.frame_sampling_enabled():
+        return
+    try:
+        image_similarity.video_frame_embeddings([video_path], frame_model)
+    except Exception as e:
+        logger.warning(f"failed to sample keyframes of {video_path}: {str(e)}")
+
+
+def save_video(
+    video_url: str,
+    save_dir: str = "",
+    search_term: str = "",
+    thumbnail_url: str = "",
+    preview_images: list = None,
+    frame_model: str = "",
+) -> str:
     if not save_dir:
         save_dir = utils.storage_dir("cache_videos")
 
@@ -170,12 +188,13 @@ def save_video(video_url: str, save_dir: str = "", search_term: str = "", thumbn
         logger.info(f"video already exists: {video_path}")
         # Save metadata if search_term is provided and metadata doesn't exist
         if search_term and not semantic_video.load_video_metadata(video_path):
-            additional_info = {}
+            additional_info = {"source_url": url_without_query}
             if thumbnail_url:
                 additional_info["thumbnail_url"] = thumbnail_url
             if preview_images:
                 additional_info["preview_images"] = preview_images
             semantic_video.save_video_metadata(video_path, search_term, additional_info)
+        _embed_frames(video_path, frame_model)
         return video_path
 
     headers = {
@@ -196,19 +215,20 @@ def save_video(video_url: str, save_dir: str = "", search_term: str = "", thumbn
 
     if os.path.exists(video_path) and os.path.getsize(video_path) > 0:
         try:
-            clip = VideoFileClip(video_path)
-            duration = clip.duration
-            fps = clip.fps
-            clip.close()
+            # probing records duration, resolution, fps and codec in the material catalog
+            info = ffmpeg_renderer.probe_video(video_path)
+            duration = info["duration"]
+            fps = info["fps"]
             if duration > 0 and fps > 0:
                 # Save metadata with search term and image data
                 if search_term:
-                    additional_info = {}
+                    additional_info = {"source_url": url_without_query}
                     if thumbnail_url:
                         additional_info["thumbnail_url"] = thumbnail_url
                     if preview_images:
                         additional_info["preview_images"] = preview_images
                     semantic_video.save_video_metadata(video_path, search_term, additional_info)
+                _embed_frames(video_path, frame_model)
                 return video_path
         except Exception as e:
             try:
@@ -227,6 +247,8 @@ def download_videos(
     video_contact_mode: VideoConcatMode = VideoConcatMode.random,
     audio_duration: float = 0.0,
     max_clip_duration: int = 5,
+    image_similarity_model: str = "",
+    semantic_model: str = "",
 ) -> List[str]:
     # Group videos by search term for balanced sampling
     videos_by_term = {}
@@ -237,8 +259,36 @@ def download_videos(
 
     # Global URL tracking to prevent duplicates across all search terms
     global_video_urls = set()
+
+    # In semantic mode, videos already in the local library that match a search term
+    # are used first, and the API is only searched for terms they do not cover
+    local_videos = []
+    use_local_index = video_contact_mode.value == VideoConcatMode.semantic.value and material_index.enabled()
+    needed_clips = math.ceil(audio_duration / max_clip_duration) if max_clip_duration > 0 else 0
+    clips_per_term = max(1, math.ceil(needed_clips / len(search_terms))) if search_terms else 0
     
     for search_term in search_terms:
+        if use_local_index:
+            try:
+                matches = material_index.find_local_videos(
+                    search_term,
+                    video_aspect=video_aspect,
+                    minimum_duration=max_clip_duration,
+                    top_k=clips_per_term,
+                    exclude={path for path, _ in local_videos},
+                    semantic_model=semantic_model or None,
+                )
+            except Exception as e:
+                logger.warning(f"local material index unavailable, searching online only: {str(e)}")
+                use_local_index = False
+                matches = []
+            if matches:
+                logger.info(f"found {len(matches)} local videos for '{search_term}'")
+                local_videos.extend(matches)
+            if len(matches) >= clips_per_term:
+                logger.info(f"skipping online search for '{search_term}', covered by local videos")
+                continue
+
         video_items = search_videos(
             search_term=search_term,
             minimum_duration=max_clip_duration,
@@ -320,6 +370,11 @@ def download_videos(
 
     total_duration = 0.0
     downloaded_urls = set()  # Track downloaded URLs to prevent runtime duplicates
+
+    for video_path, similarity in local_videos:
+        logger.info(f"using local video: {video_path} (similarity: {similarity:.3f})")
+        video_paths.append(video_path)
+        total_duration += min(max_clip_duration, ffmpeg_renderer.probe_video(video_path)["duration"])
     
     for item in valid_video_items:
         try:
@@ -332,8 +387,12 @@ def download_videos(
             # Use the search term associated with this specific video item
             item_search_term = getattr(item, 'search_term', 'unknown')
             saved_video_path = save_video(
-                video_url=item.url, save_dir=material_directory, search_term=item_search_term, thumbnail_url=item.thumbnail_url, preview_images=item.preview_images
+                video_url=item.url, save_dir=material_directory, search_term=item_search_term, thumbnail_url=item.thumbnail_url, preview_images=item.preview_images,
+                frame_model=image_similarity_model,
             )
+            if saved_video_path in video_paths:
+                downloaded_urls.add(item.url)
+                continue
             if saved_video_path:
                 logger.info(f"video saved: {saved_video_path} (search_term: '{item_search_term}')")
                 video_paths.append(saved_video_path)
@@ -0,0 +1,144 @@
+"""
+Load and warm up models in the background when the API server starts.
+
+The models named in `preload_models` are loaded through the model registry
+one after another, each followed by a dummy forward pass so weights are paged
+in and kernels are initialized before the first task needs them. Progress is
+reported by `status()`, which backs the `/health/ready` endpoint.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List
+
+from loguru import logger
+
+from app.config import config
+
+# the default models of VideoParams
+semantic_model = "all-mpnet-base-v2"
+clip_model = "clip-vit-base-patch32"
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+_status: Dict[str, Dict] = {}
+_lock = threading.Lock()
+_thread = None
+
+
+def _warm_up_semantic():
+    from app.services import semantic_video
+
+    model = semantic_video.load_model(semantic_model)
+    model.encode(["warm up"], show_progress_bar=False)
+
+
+def _warm_up_clip():
+    import torch
+    from PIL import Image
+
+    from app.services import image_similarity
+
+    model, processor = image_similarity.load_clip_model(clip_model)
+    inputs = processor(text=["warm up"], images=[Image.new("RGB", (224, 224))], return_tensors="pt", padding=True)
+    with torch.no_grad():
+        model(**inputs)
+
+
+def _silence(seconds: float = 1.0):
+    import numpy as np
+
+    return np.zeros(int(16000 * seconds), dtype=np.float32)
+
+
+def _warm_up_whisper():
+    from app.services import subtitle
+
+    model = subtitle.load_model()
+    if not model:
+        raise RuntimeError("faster-whisper model could not be loaded")
+    segments, _ = model.transcribe(_silence(), beam_size=1)
+    list(segments)
+
+
+def _warm_up_chatterbox():
+    from app.services import voice
+
+    if not voice.CHATTERBOX_AVAILABLE:
+        raise RuntimeError("chatterbox is not installed")
+    voice.load_chatterbox_model().generate("Hello.")
+
+
+def _warm_up_whisperx():
+    from app.services import voice
+
+    if not voice.CHATTERBOX_AVAILABLE:
+        raise RuntimeError("whisperx is not installed")
+    voice.load_whisperx_model().transcribe(_silence(), batch_size=1)
+
+
+warm_ups: Dict[str, Callable[[], None]] = {
+    "semantic": _warm_up_semantic,
+    "clip": _warm_up_clip,
+    "whisper": _warm_up_whisper,
+    "chatterbox": _warm_up_chatterbox,
+    "whisperx": _warm_up_whisperx,
+}
+
+
+def preload_models() -> List[str]:
+    names = []
+    for name in config.app.get("preload_models", []):
+        if name not in warm_ups:
+            logger.warning(f"unknown model in preload_models: {name}, supported: {', '.join(warm_ups)}")
+        elif name not in names:
+            names.append(name)
+    return names
+
+
+def _set_status(name: str, **values):
+    with _lock:
+        _status[name].update(values)
+
+
+def _run(names: List[str]):
+    for name in names:
+        _set_status(name, state=LOADING)
+        start = time.time()
+        try:
+            warm_ups[name]()
+            _set_status(name, state=READY, seconds=round(time.time() - start, 1))
+            logger.success(f"model preloaded: {name} ({time.time() - start:.1f} seconds)")
+        except Exception as e:
+            _set_status(name, state=FAILED, seconds=round(time.time() - start, 1), error=str(e))
+            logger.error(f"failed to preload model {name}: {e}")
+
+
+def start():
+    """Preload the configured models in a background thread"""
+    global _thread
+    names = preload_models()
+    with _lock:
+        if _thread is not None or not names:
+            return
+        for name in names:
+            _status[name] = {"state": PENDING}
+        _thread = threading.Thread(target=_run, args=(names,), name="model-preload", daemon=True)
+    logger.info(f"preloading models in the background: {', '.join(names)}")
+    _thread.start()
+
+
+def status() -> Dict:
+    """Preload state of every configured model
+
+    Ready once every model is loaded. Failed models keep it not ready (and
+    `degraded`), since the first task would otherwise pay for their load.
+    """
+    with _lock:
+        models = {name: dict(values) for name, values in _status.items()}
+    failed = [name for name, values in models.items() if values["state"] == FAILED]
+    ready = all(values["state"] == READY for values in models.values())
+    return {"ready": ready, "degraded": bool(failed), "failed": failed, "models": models}
@@ -4,20 +4,21 @@ Semantic video selection service for intelligent video-text matching
 """
 
 import os
-import json
 import itertools
 import math
 from typing import List, Dict, Optional, Tuple
 from loguru import logger
 import re
+import numpy as np
 from sentence_transformers import SentenceTransformer
+from scipy.optimize import linear_sum_assignment
 from sklearn.metrics.pairwise import cosine_similarity
 
 # Import config to check verbose flag
 from app.config import config
+from app.services.utils import embedding_store, material_catalog, model_registry
 
-# Global model instance
-_model = None
+# Name of the model loaded last, the instance itself lives in the model registry
 _model_name = None
 _model_load_fails = 0
 _max_model_retries = 3
@@ -30,41 +31,45 @@ except ImportError:
     logger.warning("Image similarity service not available - install transformers, torch, and pillow for image similarity features")
 
 def load_model(model_name: str = "all-mpnet-base-v2"):
-    """Load the semantic search model"""
-    global _model, _model_name, _model_load_fails
+    """Load the semantic search model, shared through the model registry"""
+    global _model_name, _model_load_fails
     
     # Check if we've had too many failures
     if _model_load_fails >= _max_model_retries:
         logger.error(f"❌ Maximum model loading retries ({_max_model_retries}) exceeded for semantic model")
         raise Exception(f"Semantic model loading failed {_model_load_fails} times, giving up")
     
-    if _model is None or _model_name != model_name:
-        try:
-            logger.info(f"🤖 Loading semantic search model: {model_name}")
-            logger.info("📦 This may take a moment on first run (downloading model)...")
-            
-            # Force CPU usage to avoid GPU hanging issues
-            logger.info("🖥️  Forcing CPU-only mode for SentenceTransformer to avoid GPU issues")
-            _model = SentenceTransformer(model_name, device='cpu')
-            _model_name = model_name
-            
-            # Reset failure count on successful load
-            _model_load_fails = 0
-            
-            logger.success(f"✅ Semantic search model loaded successfully: {model_name} (CPU-only)")
-            logger.info(f"🔧 Model max sequence length: {_model.max_seq_length}")
-            
-        except Exception as e:
-            _model_load_fails += 1
-            logger.error(f"Failed to load semantic model {model_name} (attempt {_model_load_fails}/{_max_model_retries}): {e}")
-            
-            # Try resetting if we have failures
-            if _model_load_fails < _max_model_retries:
-                reset_semantic_model()
-            
-            raise
+    def load():
+        logger.info(f"🤖 Loading semantic search model: {model_name}")
+        logger.info("📦 This may take a moment on first run (downloading model)...")
+        
+        # Force CPU usage to avoid GPU hanging issues
+        logger.info("🖥️  Forcing CPU-only mode for SentenceTransformer to avoid GPU issues")
+        model = SentenceTransformer(model_name, device='cpu')
+        logger.success(f"✅ Semantic search model loaded successfully: {model_name} (CPU-only)")
+        logger.info(f"🔧 Model max sequence length: {model.max_seq_length}")
+        return model
     
-    return _model
+    try:
+        model = model_registry.get_model(_registry_name(model_name), load)
+        _model_name = model_name
+        
+        # Reset failure count on successful load
+        _model_load_fails = 0
+    except Exception as e:
+        _model_load_fails += 1
+        logger.error(f"Failed to load semantic model {model_name} (attempt {_model_load_fails}/{_max_model_retries}): {e}")
+        
+        # Try resetting if we have failures
+        if _model_load_fails < _max_model_retries:
+            reset_semantic_model()
+        
+        raise
+    
+    return model
+
+def _registry_name(model_name: str) -> str:
+    return f"sentence-transformers:{model_name}"
 
 def segment_script_into_sentences(script: str, min_length: int = 25, max_length: int = 150) -> List[str]:
     """Segment script into sentences with minimum and maximum length"""
@@ -155,6 +160,11 @@ def segment_script_into_sentences(script: str, min_length: int = 25, max_length:
 
 def calculate_similarity(sentence: str, video_text: str) -> float:
     """Calculate semantic similarity between sentence and video text"""
+    # keep the model resident while it is in use
+    with model_registry.pinned(_registry_name("all-mpnet-base-v2")):
+        return _calculate_similarity(sentence, video_text)
+
+def _calculate_similarity(sentence: str, video_text: str) -> float:
     try:
         model = load_model()
         
@@ -200,6 +210,60 @@ def calculate_similarity(sentence: str, video_text: str) -> float:
         logger.error(f"❌ Text similarity traceback: {traceback.format_exc()}")
         return 0.1
 
+def _encode_batch(model, texts: List[str], batch_size: int = 32) -> np.ndarray:
+    try:
+        return model.encode(texts, batch_size=batch_size, device='cpu', normalize_embeddings=True, convert_to_numpy=True)
+    except Exception as encode_error:
+        logger.warning(f"⚠️ Encoding error, trying without explicit device: {encode_error}")
+        return model.encode(texts, batch_size=batch_size, normalize_embeddings=True, convert_to_numpy=True)
+
+def current_model_name() -> str:
+    """Name of the semantic model loaded last, the default model if none was loaded yet"""
+    return _model_name or "all-mpnet-base-v2"
+
+def encode_texts(texts: List[str], batch_size: int = 32, model_name: Optional[str] = None) -> np.ndarray:
+    """Encode texts in batches into L2-normalized embeddings, one row per text
+
+    Texts are encoded with `model_name`, or the model loaded last. Embeddings of
+    texts seen before, by any task, come from the persistent embedding store.
+    """
+    model_name = model_name or current_model_name()
+    with model_registry.pinned(_registry_name(model_name)):
+        model = load_model(model_name)
+        if not embedding_store.enabled():
+            return _encode_batch(model, texts, batch_size)
+        return embedding_store.get_store().encode(
+            model_name, texts, lambda missing: _encode_batch(model, missing, batch_size)
+        )
+
+def similarity_matrix(sentences: List[str], video_metadata: List[Dict], model_name: Optional[str] = None) -> Optional[np.ndarray]:
+    """Cosine similarity of every sentence (rows) with the search term of every video (columns)
+
+    Each distinct sentence and search term is encoded once with `model_name`, and all
+    similarities come from a single matrix product of the normalized embeddings.
+    Returns None on failure.
+    """
+    try:
+        unique_sentences = list(dict.fromkeys(sentences))
+        search_terms = [video_meta.get('search_term', '') for video_meta in video_metadata]
+        unique_terms = list(dict.fromkeys(search_terms))
+
+        sentence_embeddings = encode_texts(unique_sentences, model_name=model_name)
+        term_embeddings = encode_texts(unique_terms, model_name=model_name)
+        term_similarities = sentence_embeddings @ term_embeddings.T
+
+        sentence_rows = {sentence: row for row, sentence in enumerate(unique_sentences)}
+        term_columns = {term: column for column, term in enumerate(unique_terms)}
+        rows = [sentence_rows[sentence] for sentence in sentences]
+        columns = [term_columns[term] for term in search_terms]
+        matrix = term_similarities[np.ix_(rows, columns)].astype(np.float64)
+
+        logger.info(f"🧮 Similarity matrix: {len(unique_sentences)} segments x {len(unique_terms)} search terms encoded once")
+        return matrix
+    except Exception as e:
+        logger.error(f"❌ Error calculating similarity matrix, falling back to pairwise similarity: {e}")
+        return None
+
 def find_best_video_for_sentence(
     sentence: str, 
     video_metadata: List[Dict], 
@@ -209,15 +273,23 @@ def find_best_video_for_sentence(
     max_video_reuse: int = 2,
     enable_image_similarity: bool = False,
     image_similarity_threshold: float = 0.7,
-    image_similarity_model: str = "clip-vit-base-patch32"
+    image_similarity_model: str = "clip-vit-base-patch32",
+    text_similarities: Optional[List[float]] = None,
+    image_similarities: Optional[List[float]] = None
 ) -> Optional[Dict]:
-    """Find the best video for a given sentence with strong diversity controls"""
+    """Find the best video for a given sentence with strong diversity controls
+
+    `text_similarities` and `image_similarities` are precomputed similarities of the sentence
+    with each video's search term and images, in `video_metadata` order; without them every
+    pair is scored on the fly.
+    """
     if config.app.get('verbose', False):
         logger.info(f"🔍 Finding best video for sentence: '{sentence[:60]}...'")
         logger.info(f"📊 Analyzing {len(video_metadata)} available videos")
     
     # Calculate all similarities and scores once
     video_scores = []
+    unused_videos_available = any(used_videos.get(v['video_path'], 0) == 0 for v in video_metadata)
     
     for i, video_meta in enumerate(video_metadata, 1):
         try:
@@ -225,13 +297,18 @@ def find_best_video_for_sentence(
             search_term = video_meta.get('search_term', '')
             
             # Calculate text similarity
-            similarity = calculate_similarity(sentence, search_term)
+            if text_similarities is not None:
+                similarity = float(text_similarities[i - 1])
+            else:
+                similarity = calculate_similarity(sentence, search_term)
             
             # Initialize image similarity
             image_similarity_score = 0.0
             
             # Calculate image similarity if enabled
-            if enable_image_similarity and IMAGE_SIMILARITY_AVAILABLE:
+            if enable_image_similarity and IMAGE_SIMILARITY_AVAILABLE and image_similarities is not None:
+                image_similarity_score = float(image_similarities[i - 1])
+            elif enable_image_similarity and IMAGE_SIMILARITY_AVAILABLE:
                 try:
                     image_similarity_score = image_similarity.calculate_video_image_similarity(
                         sentence, 
@@ -269,9 +346,6 @@ def find_best_video_for_sentence(
             
             # Special handling for max_video_reuse = 1
             if max_video_reuse == 1:
-                # Check if there are any unused videos available
-                unused_videos_available = any(used_videos.get(v['video_path'], 0) == 0 for v in video_metadata)
-                
                 if usage_count == 0:
                     diversity_penalty = 0.0  # No penalty for unused videos
                 elif usage_count >= 1 and unused_videos_available:
@@ -393,6 +467,35 @@ def find_best_video_for_sentence(
     # Return both the video and its detailed scores
     return best_video, selected_video_scores
 
+def image_similarity_matrix(sentences: List[str], video_metadata: List[Dict], model_name: str) -> np.ndarray:
+    """Image similarity of every sentence (rows) with the images of every video (columns)"""
+    unique_sentences = list(dict.fromkeys(sentences))
+    scores = image_similarity.video_similarity_matrix(unique_sentences, video_metadata, model_name)
+    rows = {sentence: row for row, sentence in enumerate(unique_sentences)}
+    return scores[[rows[sentence] for sentence in sentences]]
+
+def assign_videos(similarity: np.ndarray, max_video_reuse: int, reuse_penalty: float = 0.2) -> List[Optional[int]]:
+    """Video (column) for every selection (row) maximizing the total similarity
+
+    Each video offers `max_video_reuse` slots and its k-th reuse costs `k * reuse_penalty`,
+    the same tiers as the greedy diversity penalty, so a video is only reused where that is
+    worth more than the best unused one. Solved as a rectangular min-cost assignment; rows
+    left over when all slots are taken get None.
+    """
+    selections, videos = similarity.shape
+    if selections == 0 or videos == 0 or max_video_reuse < 1:
+        return [None] * selections
+    
+    slot_video = np.tile(np.arange(videos), max_video_reuse)
+    slot_use = np.repeat(np.arange(max_video_reuse), videos)
+    cost = reuse_penalty * slot_use[np.newaxis, :] - similarity[:, slot_video]
+    rows, slots = linear_sum_assignment(cost)
+    
+    assignment = [None] * selections
+    for row, slot in zip(rows, slots):
+        assignment[row] = int(slot_video[slot])
+    return assignment
+
 def select_videos_for_script(
     script: str,
     video_metadata: List[Dict],
@@ -497,59 +600,109 @@ def select_videos_for_script(
     
     # Create video selections - repeat segments cyclically if we need more videos than segments
     video_selections_needed = needed_video_clips
-    segment_cycle = itertools.cycle(segments) if segments else []
-    
-    for i in range(video_selections_needed):
-        # Get the next segment from the cycle
-        segment = next(segment_cycle) if segments else "Generic content"
+    if not segments:
+        segments = ["Generic content"]
+    segment_cycle = itertools.cycle(range(len(segments)))
+    
+    # Encode every segment and search term once and score all pairs in one matrix product
+    text_similarity_matrix = similarity_matrix(segments, video_metadata, model_name=semantic_model)
+    
+    # Score every segment against every video thumbnail in batches as well
+    image_matrix = None
+    if enable_image_similarity and IMAGE_SIMILARITY_AVAILABLE:
+        image_matrix = image_similarity_matrix(segments, video_metadata, image_similarity_model)
+    
+    selection_method = config.app.get('semantic_selection_method', 'assignment')
+    if selection_method == 'assignment' and text_similarity_matrix is not None:
+        logger.info("🧩 Selecting videos with a min-cost assignment over the similarity matrix")
+        selection_segments = [next(segment_cycle) for _ in range(video_selections_needed)]
         
-        if config.app.get('verbose', False):
-            logger.info(f"🔄 PROCESSING VIDEO SELECTION {i+1}/{video_selections_needed}")
-        else:
-            # Show progress every 10 selections in non-verbose mode
-            if (i+1) % 10 == 1 or (i+1) == video_selections_needed:
-                logger.info(f"🔄 PROCESSING VIDEO SELECTION {i+1}/{video_selections_needed}")
+        combined_matrix = text_similarity_matrix
+        if image_matrix is not None:
+            # Weight: 30% text similarity, 70% image similarity
+            combined_matrix = (0.3 * text_similarity_matrix) + (0.7 * image_matrix)
         
-        best_video, selected_video_scores = find_best_video_for_sentence(
-            segment, 
-            video_metadata, 
-            used_videos,
-            similarity_threshold,
-            diversity_threshold,
-            actual_max_reuse,  # Use calculated actual max reuse
-            enable_image_similarity,
-            image_similarity_threshold,
-            image_similarity_model
-        )
+        assignment = assign_videos(combined_matrix[selection_segments], actual_max_reuse)
         
-        if best_video:
+        for i, (segment_index, video_index) in enumerate(zip(selection_segments, assignment)):
+            if video_index is None:
+                logger.error(f"❌ VIDEO SELECTION {i+1} FAILED: No suitable video found")
+                segments_without_videos += 1
+                continue
+            
+            best_video = video_metadata[video_index]
             selected_videos.append({
                 'video_path': best_video['video_path'],
-                'segment': segment,
+                'segment': segments[segment_index],
                 'search_term': best_video['search_term'],
                 'duration': duration_per_video
             })
-            
-            # Update usage count
             video_path = best_video['video_path']
             used_videos[video_path] = used_videos.get(video_path, 0) + 1
             
-            # Enhanced logging with both similarity scores
+            similarity = combined_matrix[segment_index, video_index]
+            if similarity < similarity_threshold:
+                logger.warning(f"⚠️  Similarity of selection {i+1} ({similarity:.3f}) below threshold ({similarity_threshold}), using anyway")
             if config.app.get('verbose', False):
-                if selected_video_scores and enable_image_similarity and IMAGE_SIMILARITY_AVAILABLE:
-                    logger.success(f"✅ VIDEO {i+1} COMPLETED: Selected {os.path.basename(best_video['video_path'])} (text: {selected_video_scores['text_similarity']:.3f}, image: {selected_video_scores['image_similarity']:.3f}, combined: {selected_video_scores['combined_similarity']:.3f})")
+                if image_matrix is not None:
+                    logger.success(f"✅ VIDEO {i+1} COMPLETED: Selected {os.path.basename(video_path)} (text: {text_similarity_matrix[segment_index, video_index]:.3f}, image: {image_matrix[segment_index, video_index]:.3f}, combined: {similarity:.3f})")
                 else:
-                    logger.success(f"✅ VIDEO {i+1} COMPLETED: Selected {os.path.basename(best_video['video_path'])} (text similarity: {selected_video_scores['text_similarity']:.3f})")
+                    logger.success(f"✅ VIDEO {i+1} COMPLETED: Selected {os.path.basename(video_path)} (text similarity: {similarity:.3f})")
+    else:
+        for i in range(video_selections_needed):
+            # Get the next segment from the cycle
+            segment_index = next(segment_cycle)
+            segment = segments[segment_index]
+        
+            if config.app.get('verbose', False):
+                logger.info(f"🔄 PROCESSING VIDEO SELECTION {i+1}/{video_selections_needed}")
             else:
-                # Show completion every 10 selections in non-verbose mode
+                # Show progress every 10 selections in non-verbose mode
                 if (i+1) % 10 == 1 or (i+1) == video_selections_needed:
+                    logger.info(f"🔄 PROCESSING VIDEO SELECTION {i+1}/{video_selections_needed}")
+        
+            best_video, selected_video_scores = find_best_video_for_sentence(
+                segment, 
+                video_metadata, 
+                used_videos,
+                similarity_threshold,
+                diversity_threshold,
+                actual_max_reuse,  # Use calculated actual max reuse
+                enable_image_similarity,
+                image_similarity_threshold,
+                image_similarity_model,
+                text_similarity_matrix[segment_index] if text_similarity_matrix is not None else None,
+                image_matrix[segment_index] if image_matrix is not None else None
+            )
+        
+            if best_video:
+                selected_videos.append({
+                    'video_path': best_video['video_path'],
+                    'segment': segment,
+                    'search_term': best_video['search_term'],
+                    'duration': duration_per_video
+                })
+            
+                # Update usage count
+                video_path = best_video['video_path']
+                used_videos[video_path] = used_videos.get(video_path, 0) + 1
+            
+                # Enhanced logging with both similarity scores
+                if config.app.get('verbose', False):
                     if selected_video_scores and enable_image_similarity and IMAGE_SIMILARITY_AVAILABLE:
                         logger.success(f"✅ VIDEO {i+1} COMPLETED: Selected {os.path.basename(best_video['video_path'])} (text: {selected_video_scores['text_similarity']:.3f}, image: {selected_video_scores['image_similarity']:.3f}, combined: {selected_video_scores['combined_similarity']:.3f})")
                     else:
                         logger.success(f"✅ VIDEO {i+1} COMPLETED: Selected {os.path.basename(best_video['video_path'])} (text similarity: {selected_video_scores['text_similarity']:.3f})")
-        else:
-            logger.error(f"❌ VIDEO SELECTION {i+1} FAILED: No suitable video found")
-            segments_without_videos += 1
+                else:
+                    # Show completion every 10 selections in non-verbose mode
+                    if (i+1) % 10 == 1 or (i+1) == video_selections_needed:
+                        if selected_video_scores and enable_image_similarity and IMAGE_SIMILARITY_AVAILABLE:
+                            logger.success(f"✅ VIDEO {i+1} COMPLETED: Selected {os.path.basename(best_video['video_path'])} (text: {selected_video_scores['text_similarity']:.3f}, image: {selected_video_scores['image_similarity']:.3f}, combined: {selected_video_scores['combined_similarity']:.3f})")
+                        else:
+                            logger.success(f"✅ VIDEO {i+1} COMPLETED: Selected {os.path.basename(best_video['video_path'])} (text similarity: {selected_video_scores['text_similarity']:.3f})")
+            else:
+                logger.error(f"❌ VIDEO SELECTION {i+1} FAILED: No suitable video found")
+                segments_without_videos += 1
     
     # Handle any unmatched segments (shouldn't happen with proper logic above)
     if segments_without_videos > 0:
@@ -591,88 +744,79 @@ def select_videos_for_script(
         else:
             logger.warning("⚠️  Low diversity - recommend more diverse search terms or larger video pool")
     
+    material_catalog.touch(used_videos)
+    
     return selected_videos
 
 def get_metadata_path(video_path: str) -> str:
-    """Get metadata file path for a video"""
+    """Get the legacy metadata sidecar path for a video, imported into the material catalog on first lookup"""
     video_dir = os.path.dirname(video_path)
     video_name = os.path.splitext(os.path.basename(video_path))[0]
     return os.path.join(video_dir, f"{video_name}_metadata.json")
 
 def save_video_metadata(video_path: str, search_term: str, additional_info: Dict = None):
     """Save metadata for a video file"""
-    metadata = {
-        'video_path': video_path,
-        'search_term': search_term,
-        'file_size': os.path.getsize(video_path) if os.path.exists(video_path) else 0,
-        'created_at': os.path.getctime(video_path) if os.path.exists(video_path) else 0
-    }
-    
-    if additional_info:
-        metadata.update(additional_info)
-    
-    metadata_path = get_metadata_path(video_path)
-    
     try:
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        material_catalog.save_metadata(video_path, search_term, additional_info)
         logger.debug(f"Saved metadata for {video_path}")
     except Exception as e:
         logger.error(f"Failed to save metadata for {video_path}: {e}")
 
+def _default_metadata(video_path: str) -> Dict:
+    filename = os.path.splitext(os.path.basename(video_path))[0]
+    return {
+        'video_path': video_path,
+        'search_term': filename,
+        'file_size': os.path.getsize(video_path) if os.path.exists(video_path) else 0,
+        'created_at': os.path.getctime(video_path) if os.path.exists(video_path) else 0
+    }
+
 def load_video_metadata(video_path: str) -> Optional[Dict]:
     """Load metadata for a video file"""
-    metadata_path = get_metadata_path(video_path)
-    
-    if not os.path.exists(metadata_path):
-        return None
-    
     try:
-        with open(metadata_path, 'r', encoding='utf-8') as f:
-            metadata = json.load(f)
-        logger.debug(f"Loaded metadata for {video_path}")
-        return metadata
+        item = material_catalog.get(video_path)
     except Exception as e:
         logger.error(f"Failed to load metadata for {video_path}: {e}")
         return None
+    
+    if not item or item.get('search_term') is None:
+        return None
+    
+    metadata = material_catalog.metadata(item)
+    metadata['video_path'] = video_path
+    return metadata
 
 def get_video_metadata_list(video_paths: List[str]) -> List[Dict]:
-    """Get metadata for a list of video files"""
-    metadata_list = []
+    """Get metadata for a list of video files with a single catalog lookup"""
+    try:
+        items = material_catalog.get_many(video_paths)
+    except Exception as e:
+        logger.error(f"Failed to load metadata from the material catalog: {e}")
+        items = {}
     
+    metadata_list = []
     for video_path in video_paths:
-        metadata = load_video_metadata(video_path)
-        if metadata:
+        item = items.get(os.path.abspath(video_path))
+        if item and item.get('search_term') is not None:
+            metadata = material_catalog.metadata(item)
+            metadata['video_path'] = video_path
             metadata_list.append(metadata)
         else:
             # Create default metadata if none exists
             logger.warning(f"No metadata found for {video_path}, using filename as search term")
-            filename = os.path.splitext(os.path.basename(video_path))[0]
-            metadata = {
-                'video_path': video_path,
-                'search_term': filename,
-                'file_size': os.path.getsize(video_path) if os.path.exists(video_path) else 0,
-                'created_at': os.path.getctime(video_path) if os.path.exists(video_path) else 0
-            }
-            metadata_list.append(metadata)
+            metadata_list.append(_default_metadata(video_path))
     
     return metadata_list
 
 def reset_semantic_model():
     """Reset the semantic model if it gets into a bad state"""
-    global _model, _model_name, _model_load_fails
+    global _model_name, _model_load_fails
     logger.warning("🔄 Resetting semantic model due to errors")
     
     try:
-        if _model is not None:
-            del _model
-        _model = None
+        model_registry.get_registry().unload_prefix(_registry_name(""))
         _model_name = None
         
-        # Force garbage collection
-        import gc
-        gc.collect()
-        
         logger.info("✅ Semantic model reset completed")
         
     except Exception as e:
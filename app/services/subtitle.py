@@ -7,39 +7,58 @@ from faster_whisper import WhisperModel
 from loguru import logger
 
 from app.config import config
+from app.services.utils import model_registry
 from app.utils import utils
 
 model_size = config.whisper.get("model_size", "large-v3")
 device = config.whisper.get("device", "cpu")
 compute_type = config.whisper.get("compute_type", "int8")
-model = None
 
 
-def create(audio_file, subtitle_file: str = ""):
-    global model
-    if not model:
-        model_path = f"{utils.root_dir()}/models/whisper-{model_size}"
-        model_bin_file = f"{model_path}/model.bin"
-        if not os.path.isdir(model_path) or not os.path.isfile(model_bin_file):
-            model_path = model_size
+def _load_model():
+    model_path = f"{utils.root_dir()}/models/whisper-{model_size}"
+    model_bin_file = f"{model_path}/model.bin"
+    if not os.path.isdir(model_path) or not os.path.isfile(model_bin_file):
+        model_path = model_size
+
+    logger.info(
+        f"loading model: {model_path}, device: {device}, compute_type: {compute_type}"
+    )
+    return WhisperModel(
+        model_size_or_path=model_path, device=device, compute_type=compute_type
+    )
 
-        logger.info(
-            f"loading model: {model_path}, device: {device}, compute_type: {compute_type}"
+
+def _registry_name() -> str:
+    return f"faster-whisper:{model_size}"
+
+
+def load_model():
+    """The faster-whisper model, shared through the model registry, or None if it cannot be loaded"""
+    try:
+        return model_registry.get_model(_registry_name(), _load_model)
+    except Exception as e:
+        logger.error(
+            f"failed to load model: {e} \n\n"
+            f"********************************************\n"
+            f"this may be caused by network issue. \n"
+            f"please download the model manually and put it in the 'models' folder. \n"
+            f"see [README.md FAQ](https://github.com/harry0703/MoneyPrinterTurbo) for more details.\n"
+            f"********************************************\n\n"
         )
-        try:
-            model = WhisperModel(
-                model_size_or_path=model_path, device=device, compute_type=compute_type
-            )
-        except Exception as e:
-            logger.error(
-                f"failed to load model: {e} \n\n"
-                f"********************************************\n"
-                f"this may be caused by network issue. \n"
-                f"please download the model manually and put it in the 'models' folder. \n"
-                f"see [README.md FAQ](https://github.com/harry0703/MoneyPrinterTurbo) for more details.\n"
-                f"********************************************\n\n"
-            )
-            return None
+        return None
+
+
+def create(audio_file, subtitle_file: str = ""):
+    # transcription runs while the segments are iterated, keep the model resident until the end
+    with model_registry.pinned(_registry_name()):
+        return _create(audio_file, subtitle_file)
+
+
+def _create(audio_file, subtitle_file: str = ""):
+    model = load_model()
+    if not model:
+        return None
 
     logger.info(f"start, output file: {subtitle_file}")
     if not subtitle_file:
@@ -303,32 +322,16 @@ def create_enhanced_subtitles(audio_file, subtitle_file: str = "", params=None):
     """
     Create enhanced subtitles with word-level timing for word highlighting
     """
+    with model_registry.pinned(_registry_name()):
+        return _create_enhanced_subtitles(audio_file, subtitle_file, params)
+
+
+def _create_enhanced_subtitles(audio_file, subtitle_file: str = "", params=None):
     from app.models.schema import WordTiming, EnhancedSubtitle
     
-    global model
+    model = load_model()
     if not model:
-        model_path = f"{utils.root_dir()}/models/whisper-{model_size}"
-        model_bin_file = f"{model_path}/model.bin"
-        if not os.path.isdir(model_path) or not os.path.isfile(model_bin_file):
-            model_path = model_size
-
-        logger.info(
-            f"loading model: {model_path}, device: {device}, compute_type: {compute_type}"
-        )
-        try:
-            model = WhisperModel(
-                model_size_or_path=model_path, device=device, compute_type=compute_type
-            )
-        except Exception as e:
-            logger.error(
-                f"failed to load model: {e} \n\n"
-                f"********************************************\n"
-                f"this may be caused by network issue. \n"
-                f"please download the model manually and put it in the 'models' folder. \n"
-                f"see [README.md FAQ](https://github.com/harry0703/MoneyPrinterTurbo) for more details.\n"
-                f"********************************************\n\n"
-            )
-            return None
+        return None
 
     logger.info(f"start enhanced subtitle generation, output file: {subtitle_file}")
     if not subtitle_file:
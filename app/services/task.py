@@ -195,6 +195,12 @@ def get_video_materials(task_id, params, video_terms, audio_duration):
             video_contact_mode=params.video_concat_mode,
             audio_duration=audio_duration * params.video_count,
             max_clip_duration=params.video_clip_duration,
+            image_similarity_model=(
+                params.image_similarity_model
+                if params.video_concat_mode.value == VideoConcatMode.semantic.value and params.enable_image_similarity
+                else ""
+            ),
+            semantic_model=params.semantic_model or "",
         )
         if not downloaded_videos:
             sm.state.update_task(task_id, state=const.TASK_STATE_FAILED)
@@ -229,19 +235,36 @@ def generate_final_videos(
         )
         logger.info(f"\n\n## combining video: {index} => {combined_video_path}")
         is_image_mode = getattr(params, 'background_media_type', 'video') == 'image'
-        video.combine_videos(
-            combined_video_path=combined_video_path,
-            video_paths=downloaded_videos,
-            audio_file=audio_file,
-            video_aspect=params.video_aspect,
-            video_concat_mode=video_concat_mode,
-            video_transition_mode=video_transition_mode,
-            max_clip_duration=params.video_clip_duration,
-            threads=params.n_threads,
-            script=video_script,
-            params=params,
-            is_image_mode=is_image_mode,
-        )
+        clip_plan = None
+        if is_image_mode:
+            video.combine_videos(
+                combined_video_path=combined_video_path,
+                video_paths=downloaded_videos,
+                audio_file=audio_file,
+                video_aspect=params.video_aspect,
+                video_concat_mode=video_concat_mode,
+                video_transition_mode=video_transition_mode,
+                max_clip_duration=params.video_clip_duration,
+                threads=params.n_threads,
+                script=video_script,
+                params=params,
+                is_image_mode=is_image_mode,
+            )
+        else:
+            # the final video is rendered straight from the plan, combined-N.mp4 is only
+            # written if that fails
+            clip_plan = video.plan_clips(
+                video_paths=downloaded_videos,
+                audio_file=audio_file,
+                video_concat_mode=video_concat_mode,
+                video_transition_mode=video_transition_mode,
+                max_clip_duration=params.video_clip_duration,
+                script=video_script,
+                params=params,
+            )
+            if not clip_plan:
+                logger.error("no clips available for the video")
+                continue
 
         _progress += 50 / params.video_count / 2
         sm.state.update_task(task_id, progress=_progress)
@@ -255,13 +278,15 @@ def generate_final_videos(
             subtitle_path=subtitle_path,
             output_file=final_video_path,
             params=params,
+            clip_plan=clip_plan,
         )
 
         _progress += 50 / params.video_count / 2
         sm.state.update_task(task_id, progress=_progress)
 
         final_video_paths.append(final_video_path)
-        combined_video_paths.append(combined_video_path)
+        if path.exists(combined_video_path):
+            combined_video_paths.append(combined_video_path)
 
     return final_video_paths, combined_video_paths
 
@@ -0,0 +1,255 @@
+"""
+Write subtitles as an ASS script, to be burned in by FFmpeg's libass based `subtitles` filter.
+
+Word-level subtitles (subtitle_enhanced.json) compile to one event per cue,
+with per-word color switches or `\\kf` karaoke tags, so libass renders the
+highlighting natively instead of one image per spoken word.
+"""
+
+import json
+import re
+import struct
+from typing import Dict, List, Optional, Tuple
+
+from PIL import ImageFont
+
+from app.config import config
+from app.models.schema import VideoParams
+
+
+def _hex_to_ass(hex_color: str, alpha: int = 0) -> str:
+    """#RRGGBB -> &HAABBGGRR"""
+    hex_color = (hex_color or "#000000").lstrip("#")
+    r, g, b = (int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
+    return f"&H{alpha:02X}{b:02X}{g:02X}{r:02X}"
+
+
+def _override_color(hex_color: str) -> str:
+    """#RRGGBB -> &HBBGGRR& as used in override tags"""
+    return f"{_hex_to_ass(hex_color)[:2]}{_hex_to_ass(hex_color)[4:]}&"
+
+
+def format_time(seconds: float) -> str:
+    """ASS timestamps are H:MM:SS.cc"""
+    centiseconds = int(round(max(0.0, seconds) * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+
+def escape_text(text: str) -> str:
+    # braces start override blocks in ASS, there is no escape for them
+    text = text.replace("\\", "/").replace("{", "(").replace("}", ")")
+    return text.replace("\r", "").replace("\n", "\\N")
+
+
+def font_family(font_path: str) -> str:
+    """Family name libass uses to find the font file in `fontsdir`"""
+    try:
+        return ImageFont.truetype(font_path, 10).getname()[0]
+    except Exception:
+        return "Arial"
+
+
+def _win_line_height(font_path: str) -> float:
+    """(usWinAscent + usWinDescent) / unitsPerEm of the first font of a TTF/OTF/TTC file"""
+    with open(font_path, "rb") as f:
+        data = f.read()
+    offset = 0
+    if data[:4] == b"ttcf":
+        offset = struct.unpack(">I", data[12:16])[0]
+    num_tables = struct.unpack(">H", data[offset + 4:offset + 6])[0]
+    tables = {}
+    for i in range(num_tables):
+        record = offset + 12 + i * 16
+        tag = data[record:record + 4]
+        tables[tag] = struct.unpack(">I", data[record + 8:record + 12])[0]
+    units_per_em = struct.unpack(">H", data[tables[b"head"] + 18:tables[b"head"] + 20])[0]
+    win_ascent, win_descent = struct.unpack(">HH", data[tables[b"OS/2"] + 74:tables[b"OS/2"] + 78])
+    return (win_ascent + win_descent) / units_per_em
+
+
+def font_size(font_path: str, size: int) -> int:
+    """ASS font size matching a PIL/MoviePy (em) font size
+
+    libass scales a font so that its Windows line height (usWinAscent + usWinDescent)
+    equals the ASS font size.
+    """
+    try:
+        return int(round(size * _win_line_height(font_path)))
+    except Exception:
+        try:
+            ascent, descent = ImageFont.truetype(font_path, size).getmetrics()
+            return ascent + descent
+        except Exception:
+            return size
+
+
+def _alignment(params: VideoParams, video_width: int, video_height: int) -> Tuple[int, int, str]:
+    """(Alignment, MarginV, per event override) for the subtitle position"""
+    margin = int(video_height * 0.05)
+    if params.subtitle_position == "top":
+        return 8, margin, ""
+    if params.subtitle_position == "center":
+        return 5, 0, ""
+    if params.subtitle_position == "custom":
+        return 2, margin, f"{{\\an5\\pos({video_width // 2},{int(video_height * params.custom_position / 100)})}}"
+    return 2, margin, ""
+
+
+def build_header(params: VideoParams, font_path: str, video_width: int, video_height: int) -> str:
+    alignment, margin_v, _ = _alignment(params, video_width, video_height)
+    margin_h = int(video_width * 0.05)
+
+    background = params.text_background_color
+    if isinstance(background, str) and background.startswith("#"):
+        # opaque box behind the text, drawn with the outline color
+        border_style, outline, outline_color = 3, max(1, int(params.font_size * 0.1)), _hex_to_ass(background)
+    else:
+        border_style, outline, outline_color = 1, params.stroke_width, _hex_to_ass(params.stroke_color)
+
+    style = ",".join(str(v) for v in [
+        "Default", font_family(font_path), font_size(font_path, int(params.font_size)),
+        _hex_to_ass(params.text_fore_color),
+        _hex_to_ass(getattr(params, "word_highlight_color", None) or params.text_fore_color),
+        outline_color, "&H80000000",
+        0, 0, 0, 0, 100, 100, 0, 0,
+        border_style, outline, 0, alignment, margin_h, margin_h, margin_v, 1,
+    ])
+    return "\n".join([
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {video_width}",
+        f"PlayResY: {video_height}",
+        "WrapStyle: 0",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, "
+        "BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding",
+        f"Style: {style}",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ])
+
+
+def dialogue(start: float, end: float, text: str) -> str:
+    return f"Dialogue: 0,{format_time(start)},{format_time(end)},Default,,0,0,0,,{text}"
+
+
+def write_ass(
+    subtitles: List[Tuple[Tuple[float, float], str]],
+    ass_file: str,
+    params: VideoParams,
+    font_path: str,
+    video_width: int,
+    video_height: int,
+) -> str:
+    """Write ((start, end), text) cues, e.g. SubtitlesClip.subtitles, as an ASS script"""
+    _, _, position = _alignment(params, video_width, video_height)
+
+    lines = [build_header(params, font_path, video_width, video_height)]
+    for (start, end), text in subtitles:
+        # same cleanup as the rasterized subtitles: commas only mark pauses
+        text = text.replace(", ", " ").replace(",", " ").strip()
+        lines.append(dialogue(start, end, position + escape_text(text)))
+
+    with open(ass_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return ass_file
+
+
+def _clean_word(word: str) -> str:
+    return re.sub(r"[.,!?]", "", word).strip().lower()
+
+
+def _match_timings(tokens: List[str], words: List[Dict]) -> List[Optional[Dict]]:
+    """Pair every displayed token with its word timing, in spoken order"""
+    timings = sorted(words, key=lambda w: w["start"])
+    matched = []
+    cursor = 0
+    for token in tokens:
+        clean = _clean_word(token)
+        found = None
+        for i in range(cursor, len(timings)):
+            if _clean_word(timings[i]["word"]) == clean:
+                found = timings[i]
+                cursor = i + 1
+                break
+        matched.append(found)
+    return matched
+
+
+def karaoke_text(subtitle: Dict, normal_color: str, highlight_color: str, fill: bool = False) -> str:
+    """Event text of an enhanced subtitle cue
+
+    By default only the word being spoken is highlighted, with instant color
+    switches (`\\t`) at the start and end of the word. With `fill`, words are
+    progressively filled with `\\kf` karaoke tags and stay highlighted.
+    """
+    lines = subtitle.get("lines") or [subtitle["text"]]
+    tokens_by_line = [line.split() for line in lines]
+    timings = _match_timings([t for line in tokens_by_line for t in line], subtitle.get("words") or [])
+    start = subtitle["start_time"]
+    normal, highlight = _override_color(normal_color), _override_color(highlight_color)
+
+    parts = [f"{{\\1c{highlight}\\2c{normal}}}"] if fill else []
+    cursor = start
+    index = 0
+    for line_index, tokens in enumerate(tokens_by_line):
+        if line_index > 0:
+            parts.append("\\N")
+        for token in tokens:
+            timing = timings[index]
+            index += 1
+            text = escape_text(token) + " "
+            if fill:
+                if timing is None:
+                    parts.append(f"{{\\k0}}{text}")
+                    continue
+                gap = max(0.0, timing["start"] - cursor)
+                if gap >= 0.01:
+                    parts.append(f"{{\\k{int(round(gap * 100))}}}")
+                parts.append(f"{{\\kf{max(1, int(round((timing['end'] - max(cursor, timing['start'])) * 100)))}}}{text}")
+                cursor = max(cursor, timing["end"])
+            else:
+                if timing is None:
+                    parts.append(f"{{\\1c{normal}}}{text}")
+                    continue
+                t1 = int(round((timing["start"] - start) * 1000))
+                t2 = int(round((timing["end"] - start) * 1000))
+                parts.append(
+                    f"{{\\1c{normal}\\t({t1},{t1 + 1},\\1c{highlight})\\t({t2},{t2 + 1},\\1c{normal})}}{text}"
+                )
+    return "".join(parts).rstrip()
+
+
+def write_karaoke_ass(
+    enhanced_subtitle_path: str,
+    ass_file: str,
+    params: VideoParams,
+    font_path: str,
+    video_width: int,
+    video_height: int,
+    fill: Optional[bool] = None,
+) -> str:
+    """Compile subtitle_enhanced.json to an ASS script with word-level highlighting"""
+    with open(enhanced_subtitle_path, "r", encoding="utf-8") as f:
+        enhanced_data = json.load(f)
+    if fill is None:
+        fill = config.app.get("word_highlight_style", "word") == "karaoke"
+
+    _, _, position = _alignment(params, video_width, video_height)
+    highlight_color = getattr(params, "word_highlight_color", None) or params.text_fore_color
+
+    lines = [build_header(params, font_path, video_width, video_height)]
+    for subtitle in enhanced_data:
+        text = karaoke_text(subtitle, params.text_fore_color, highlight_color, fill)
+        lines.append(dialogue(subtitle["start_time"], subtitle["end_time"], position + text))
+
+    with open(ass_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return ass_file
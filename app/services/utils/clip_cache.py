@@ -0,0 +1,144 @@
+"""
+Content-addressed cache of normalized subclips, shared across tasks.
+
+A normalized subclip is keyed on the source content fingerprint, the cut
+(start, duration), the target resolution and fps, the transition and the
+encoder settings. Entries are written atomically and evicted least recently
+used first once the cache exceeds its size budget.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import List, Optional
+
+from loguru import logger
+
+from app.config import config
+from app.utils import utils
+
+_fingerprints = {}
+_lock = threading.Lock()
+
+# bytes read from the head and the tail of a source to fingerprint it
+_fingerprint_chunk = 1024 * 1024
+
+
+def enabled() -> bool:
+    return config.app.get("enable_clip_cache", True)
+
+
+def cache_dir() -> str:
+    return utils.storage_dir("cache_clips", create=True)
+
+
+def max_size() -> int:
+    return int(config.app.get("clip_cache_max_size_mb", 10240)) * 1024 * 1024
+
+
+def source_fingerprint(file_path: str) -> str:
+    """Hash of the size, head and tail of a file, memoized per (path, size, mtime)"""
+    stat = os.stat(file_path)
+    memo_key = (file_path, stat.st_size, stat.st_mtime)
+    if memo_key in _fingerprints:
+        return _fingerprints[memo_key]
+
+    h = hashlib.sha1(str(stat.st_size).encode("utf-8"))
+    with open(file_path, "rb") as f:
+        h.update(f.read(_fingerprint_chunk))
+        if stat.st_size > _fingerprint_chunk:
+            f.seek(max(_fingerprint_chunk, stat.st_size - _fingerprint_chunk))
+            h.update(f.read(_fingerprint_chunk))
+    _fingerprints[memo_key] = h.hexdigest()
+    return _fingerprints[memo_key]
+
+
+def segment_key(item, width: int, height: int, fps: int, encoder_args: List[str], segment_format: str) -> str:
+    parts = {
+        "source": source_fingerprint(item.file_path),
+        "start": round(item.start_time or 0, 3),
+        "duration": round(item.duration, 3),
+        "resolution": [width, height],
+        "fps": fps,
+        "transition": getattr(item, "transition", None),
+        "side": getattr(item, "side", None) if getattr(item, "transition", None) else None,
+        "encoder": encoder_args,
+        "format": segment_format,
+    }
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _entry_path(key: str, ext: str) -> str:
+    return os.path.join(cache_dir(), f"seg-{key}.{ext}")
+
+
+def get(key: str, ext: str) -> Optional[str]:
+    """Return the cached segment for `key` and mark it as recently used"""
+    path = _entry_path(key, ext)
+    try:
+        if os.path.getsize(path) > 0:
+            os.utime(path, None)
+            return path
+    except OSError:
+        pass
+    return None
+
+
+def put(key: str, ext: str, segment_file: str) -> str:
+    """Move a freshly rendered segment into the cache and return its cached path"""
+    path = _entry_path(key, ext)
+    # os.replace is atomic, readers never see a partially written entry
+    os.replace(segment_file, path)
+    evict()
+    return path
+
+
+def temp_path(key: str, ext: str) -> str:
+    """Unique scratch file inside the cache dir, so that `put` stays a same-volume rename"""
+    return os.path.join(cache_dir(), f"tmp-{key}-{os.getpid()}-{threading.get_ident()}.{ext}")
+
+
+def evict():
+    """Remove least recently used entries until the cache fits its size budget"""
+    budget = max_size()
+    with _lock:
+        entries = []
+        total = 0
+        for name in os.listdir(cache_dir()):
+            path = os.path.join(cache_dir(), name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if name.startswith("tmp-"):
+                # leftovers of renders that crashed before `put`
+                if time.time() - stat.st_mtime > 3600:
+                    delete_quietly(path)
+                continue
+            if not name.startswith("seg-"):
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        if total <= budget:
+            return
+
+        entries.sort()
+        removed = 0
+        for _, size, path in entries:
+            if total <= budget:
+                break
+            if delete_quietly(path):
+                total -= size
+                removed += 1
+        logger.info(f"clip cache: evicted {removed} segments, {total / 1024 / 1024:.1f} MB left")
+
+
+def delete_quietly(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,125 @@
+"""
+Cache of Chatterbox speaker conditionals, shared across tasks.
+
+Conditioning on a reference voice loads and resamples the audio, embeds it
+with S3Gen (mel, x-vector, speech tokens) and the voice encoder. The result
+only depends on the reference audio, the exaggeration and the model, so it is
+computed once per (reference file hash, exaggeration, model version), saved
+with `Conditionals.save` to ./storage/cache_conditionals and kept in a small
+in-memory LRU on top.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from loguru import logger
+
+from app.config import config
+from app.utils import utils
+
+# conditionals kept in memory, a few MB each
+max_memory_entries = 16
+
+_memory = OrderedDict()
+_file_hashes: Dict[Tuple[str, int, float], str] = {}
+_key_locks: Dict[str, threading.Lock] = {}
+_lock = threading.Lock()
+stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+
+def enabled() -> bool:
+    return config.app.get("enable_voice_conditionals_cache", True)
+
+
+def cache_dir() -> str:
+    return utils.storage_dir("cache_conditionals", create=True)
+
+
+def model_version() -> str:
+    try:
+        import chatterbox
+
+        return f"chatterbox-{chatterbox.__version__}"
+    except Exception:
+        return "chatterbox"
+
+
+def file_hash(path: str) -> str:
+    """Content hash of a reference audio file, remembered while its size and mtime are unchanged"""
+    stat = os.stat(path)
+    stamp = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    with _lock:
+        if stamp in _file_hashes:
+            return _file_hashes[stamp]
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    with _lock:
+        _file_hashes[stamp] = digest.hexdigest()
+    return digest.hexdigest()
+
+
+def cache_key(wav_path: str, exaggeration: float) -> str:
+    return f"{file_hash(wav_path)}-{exaggeration:.3f}-{model_version()}"
+
+
+def _remember(key: str, conds):
+    with _lock:
+        _memory[key] = conds
+        _memory.move_to_end(key)
+        while len(_memory) > max_memory_entries:
+            _memory.popitem(last=False)
+
+
+def get_conditionals(model, wav_path: str, exaggeration: float = 0.5):
+    """Conditionals of `model` for a reference voice, computed at most once per voice"""
+    if not enabled():
+        return model.get_conditionals(wav_path, exaggeration=exaggeration)
+
+    key = cache_key(wav_path, exaggeration)
+    with _lock:
+        if key in _memory:
+            _memory.move_to_end(key)
+            stats["hits"] += 1
+            return _memory[key]
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    # chunks of one script ask for the same voice at once, only the first one computes it
+    with key_lock:
+        with _lock:
+            if key in _memory:
+                stats["hits"] += 1
+                return _memory[key]
+
+        from chatterbox.tts import Conditionals
+
+        cache_file = os.path.join(cache_dir(), f"{key}.pt")
+        if os.path.exists(cache_file):
+            try:
+                conds = Conditionals.load(cache_file, map_location="cpu").to(model.device)
+                _remember(key, conds)
+                stats["disk_hits"] += 1
+                return conds
+            except Exception as e:
+                logger.warning(f"failed to load cached conditionals {cache_file}: {e}")
+
+        logger.info(f"computing speaker conditionals of {wav_path}")
+        conds = model.get_conditionals(wav_path, exaggeration=exaggeration)
+        stats["misses"] += 1
+        _remember(key, conds)
+        try:
+            temp_file = f"{cache_file}.{os.getpid()}.tmp"
+            conds.save(temp_file)
+            os.replace(temp_file, cache_file)
+        except Exception as e:
+            logger.warning(f"failed to cache conditionals of {wav_path}: {e}")
+        return conds
+
+
+def clear():
+    with _lock:
+        _memory.clear()
@@ -0,0 +1,130 @@
+"""
+In-memory LRU cache of embeddings with a byte budget and an optional disk tier.
+
+Entries are evicted least recently used first once their total size exceeds
+the budget. With a disk tier, every entry is also written to the persistent
+embedding store, and a memory miss is looked up there before it counts as a
+miss, so embeddings survive restarts and are shared between processes.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+from loguru import logger
+
+from app.services.utils.embedding_store import EmbeddingStore
+
+
+def nbytes(value) -> int:
+    """Size of a numpy array or torch tensor"""
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if hasattr(value, "element_size"):
+        return value.element_size() * value.nelement()
+    return 0
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        name: str,
+        max_bytes: int,
+        disk_store: Optional[Callable[[], Optional[EmbeddingStore]]] = None,
+        to_array: Callable[[Any], np.ndarray] = np.asarray,
+        from_array: Callable[[np.ndarray], Any] = lambda array: array,
+    ):
+        self.name = name
+        self.max_bytes = max_bytes
+        # the disk tier is opened on first use, so importing a module with a cache has no side effects
+        self._disk_store_factory = disk_store
+        self._disk_store = None
+        self.to_array = to_array
+        self.from_array = from_array
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def disk_store(self) -> Optional[EmbeddingStore]:
+        if self._disk_store_factory is not None:
+            factory, self._disk_store_factory = self._disk_store_factory, None
+            self._disk_store = factory()
+        return self._disk_store
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        disk_store = self.disk_store
+        if disk_store is not None:
+            try:
+                stored = disk_store.get_many(self.name, [key]).get(key)
+            except Exception as e:
+                logger.debug(f"{self.name} disk cache lookup failed: {e}")
+                stored = None
+            if stored is not None:
+                value = self.from_array(stored)
+                self._put_memory(key, value)
+                with self._lock:
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def put(self, key: str, value):
+        self._put_memory(key, value)
+        disk_store = self.disk_store
+        if disk_store is not None:
+            try:
+                disk_store.put_many(self.name, {key: self.to_array(value)})
+            except Exception as e:
+                logger.debug(f"{self.name} disk cache update failed: {e}")
+
+    def _put_memory(self, key: str, value):
+        size = nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= nbytes(self._entries.pop(key))
+            self._entries[key] = value
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= nbytes(evicted)
+                self.evictions += 1
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,153 @@
+"""
+Persistent store of text embeddings, shared by all tasks and worker processes.
+
+Embeddings are kept in SQLite (WAL mode, so readers never block each other or
+the writer) as float32 blobs keyed by (model name, hash of the normalized
+text). The store holds at most `embedding_store_max_entries` vectors and drops
+the least recently used ones beyond that.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from app.config import config
+from app.services.utils.sqlite_db import LocalConnection, batches, placeholders
+from app.utils import utils
+
+_schema = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    key TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model, key)
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def enabled() -> bool:
+    return config.app.get("enable_embedding_store", True)
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, db_path: str, max_entries: int = 200000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._conn = LocalConnection(db_path, _schema)
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._conn.get()
+
+    def get_many(self, model_name: str, texts: List[str]) -> Dict[str, np.ndarray]:
+        """Stored embeddings of `texts`, by text, marking them as recently used"""
+        keys = {text: text_key(text) for text in texts}
+        if not keys:
+            return {}
+        conn = self._connection()
+        found = {}
+        for batch in batches(list(set(keys.values()))):
+            rows = conn.execute(
+                f"SELECT key, dim, vector FROM embeddings WHERE model = ? AND key IN ({placeholders(len(batch))})",
+                [model_name, *batch],
+            ).fetchall()
+            for key, dim, vector in rows:
+                found[key] = np.frombuffer(vector, dtype=np.float32, count=dim)
+        if found:
+            self._touch(model_name, list(found))
+        return {text: found[key] for text, key in keys.items() if key in found}
+
+    def put_many(self, model_name: str, embeddings: Dict[str, np.ndarray]):
+        if not embeddings:
+            return
+        now = time.time()
+        rows = []
+        for text, vector in embeddings.items():
+            vector = np.ascontiguousarray(vector, dtype=np.float32).ravel()
+            rows.append((model_name, text_key(text), vector.size, vector.tobytes(), now))
+        with self._conn.transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+        self.evict()
+
+    def _touch(self, model_name: str, keys: List[str]):
+        now = time.time()
+        try:
+            with self._conn.transaction() as conn:
+                for batch in batches(keys):
+                    conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE model = ? AND key IN ({placeholders(len(batch))})",
+                        [now, model_name, *batch],
+                    )
+        except sqlite3.OperationalError as e:
+            # recency is best effort, a busy writer must not fail the lookup
+            logger.debug(f"embedding store: failed to update last used time: {e}")
+
+    def evict(self):
+        """Drop the least recently used embeddings beyond `max_entries`"""
+        conn = self._connection()
+        count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        with self._conn.transaction() as conn:
+            conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+        logger.info(f"embedding store: evicted {excess} embeddings")
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def encode(self, model_name: str, texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Embeddings of `texts`, one row per text, encoding only the ones not stored yet"""
+        try:
+            cached = self.get_many(model_name, texts)
+        except sqlite3.Error as e:
+            logger.warning(f"embedding store lookup failed: {e}")
+            cached = {}
+
+        missing = list(dict.fromkeys(text for text in texts if text not in cached))
+        if missing:
+            vectors = np.asarray(encode(missing), dtype=np.float32)
+            fresh = dict(zip(missing, vectors))
+            try:
+                self.put_many(model_name, fresh)
+            except sqlite3.Error as e:
+                logger.warning(f"embedding store update failed: {e}")
+            cached.update(fresh)
+
+        if texts:
+            distinct = len(set(texts))
+            logger.debug(f"embedding store: {distinct - len(missing)}/{distinct} embeddings reused")
+        return np.stack([cached[text] for text in texts]) if texts else np.zeros((0, 0), dtype=np.float32)
+
+
+_store: Optional[EmbeddingStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> EmbeddingStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            db_path = os.path.join(utils.storage_dir("cache_embeddings", create=True), "embeddings.db")
+            _store = EmbeddingStore(db_path, int(config.app.get("embedding_store_max_entries", 200000)))
+        return _store
@@ -0,0 +1,109 @@
+"""
+x264 encoder profiles and encode timing reports.
+
+The final video is encoded with the profile of the task (draft, standard or
+archive). Intermediate files, which are decoded and encoded again later on,
+are written at a visually transparent quality with a fast x264 preset instead.
+They are 4:2:0 High profile, like the stream-copied source clips they are
+concatenated with, and small enough to keep many minutes in the clip cache.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from app.models.schema import EncoderProfile
+from app.services.utils import ffmpeg_renderer
+
+video_codec = "libx264"
+
+profiles = {
+    # previews: roughly 3-4x faster than standard, slightly softer
+    EncoderProfile.draft.value: {"preset": "veryfast", "crf": 23, "tune": "fastdecode", "bitrate": "4000k"},
+    EncoderProfile.standard.value: {"preset": "medium", "crf": 18, "tune": None, "bitrate": "8000k"},
+    EncoderProfile.archive.value: {"preset": "slow", "crf": 16, "tune": "film", "bitrate": "12000k"},
+}
+
+# near-transparent, every frame of an intermediate is re-encoded by the final pass anyway;
+# lossless (-qp 0) would produce High 4:4:4 Predictive streams that cannot be joined with
+# stream-copied High profile clips, and ultrafast would drop to Constrained Baseline
+intermediate_params = ["-preset", "veryfast", "-crf", "14", "-profile:v", "high", "-pix_fmt", "yuv420p"]
+
+
+def profile_name(name) -> str:
+    """Profile name of an EncoderProfile or a plain string, standard by default"""
+    return getattr(name, "value", name) or EncoderProfile.standard.value
+
+
+def get_profile(name) -> Dict:
+    name = profile_name(name)
+    if name not in profiles:
+        logger.warning(f"unknown encoder profile: {name}, using {EncoderProfile.standard.value}")
+        name = EncoderProfile.standard.value
+    return profiles[name]
+
+
+def quality_params(name) -> List[str]:
+    profile = get_profile(name)
+    params = ["-crf", str(profile["crf"]), "-preset", profile["preset"]]
+    if profile["tune"]:
+        params += ["-tune", profile["tune"]]
+    return params + [
+        "-profile:v", "high",
+        "-level", "4.1",
+        "-pix_fmt", "yuv420p",
+        "-movflags", "+faststart",
+    ]
+
+
+def encoder_settings(name=None) -> Dict:
+    """`codec`, `bitrate` and `ffmpeg_params` for MoviePy's write_videofile
+
+    Without a profile name, the settings of the intermediate format.
+    """
+    if name is None:
+        return {"codec": video_codec, "bitrate": None, "ffmpeg_params": list(intermediate_params)}
+    return {"codec": video_codec, "bitrate": get_profile(name)["bitrate"], "ffmpeg_params": quality_params(name)}
+
+
+def ffmpeg_args(settings: Dict, fps: int) -> List[str]:
+    """The same settings as FFmpeg command line arguments"""
+    args = ["-c:v", settings["codec"]]
+    if settings["bitrate"]:
+        args += ["-b:v", settings["bitrate"]]
+    return args + ["-r", str(fps), *settings["ffmpeg_params"]]
+
+
+def encode_stats(output_file: str, wall_time: float) -> Optional[Dict]:
+    """Wall time, achieved fps and bitrate of an encoded file"""
+    try:
+        info = ffmpeg_renderer.probe_video(output_file, cache=False)
+    except Exception as e:
+        logger.debug(f"failed to probe {output_file}: {e}")
+        return None
+    duration = info.get("duration") or 0
+    frames = duration * (info.get("fps") or 0)
+    size = os.path.getsize(output_file)
+    return {
+        "wall_time": wall_time,
+        "fps": frames / wall_time if wall_time > 0 else 0,
+        "bitrate": size * 8 / duration / 1000 if duration > 0 else 0,
+        "duration": duration,
+        "size": size,
+    }
+
+
+@contextmanager
+def timed_encode(stage: str, output_file: str):
+    """Log wall time, fps and bitrate of the encode running in the `with` block"""
+    started = time.time()
+    yield
+    stats = encode_stats(output_file, time.time() - started)
+    if stats:
+        logger.info(
+            f"⏱️ {stage}: {stats['wall_time']:.1f}s for {stats['duration']:.1f}s of video, "
+            f"{stats['fps']:.1f} fps, {stats['bitrate']:.0f} kb/s, {stats['size'] / 1024 / 1024:.1f} MB"
+        )
@@ -0,0 +1,761 @@
+"""
+Render a clip plan with FFmpeg.
+
+Every subclip of the plan becomes one trimmed FFmpeg input. Scaling, padding
+and transitions are expressed as filters, and the segments are joined with the
+concat filter. `render_video` feeds that graph, the ASS subtitles and the final
+audio into a single encode of the output video, and `ClipPlanReader` hands its
+frames to MoviePy when the subtitles are rasterized instead, so every output
+frame is encoded once, with the task's encoder profile.
+
+`render_clip_plan` writes the plan into an intermediate video, for the
+fallbacks that need a file. Subclips that already match the target resolution,
+codec and frame rate are cut on a keyframe with stream copy there, and joined
+with the concat demuxer together with the (individually encoded) remaining
+subclips.
+"""
+
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+from moviepy.config import FFMPEG_BINARY
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+from app.models.schema import VideoTransitionMode
+from app.services.utils import clip_cache, material_catalog
+
+# Duration (seconds) of the fade / slide transitions, same as the MoviePy path
+transition_duration = 1
+
+# Codecs / pixel formats that can be stream-copied into the combined video
+copyable_codecs = ["h264"]
+copyable_pix_fmts = ["yuv420p", "yuvj420p"]
+# Intermediate segments are MPEG-TS so every segment carries its own SPS/PPS in-band,
+# which keeps stream-copied and re-encoded H.264 segments decodable after concat
+segment_format = "mpegts"
+segment_ext = "ts"
+
+# option keeping the source timestamps of decoded frames, detected on first use
+_passthrough_option = None
+
+
+def run_ffmpeg(args: List[str], loglevel: str = "error") -> str:
+    cmd = [FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", loglevel, *args]
+    logger.debug(f"running ffmpeg: {' '.join(cmd)}")
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = proc.stderr.decode("utf-8", errors="ignore").strip()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with code {proc.returncode}: {stderr[-2000:]}")
+    return stderr
+
+
+def _ffprobe_binary() -> Optional[str]:
+    """ffprobe next to the configured ffmpeg, or from PATH"""
+    name = "ffprobe.exe" if os.name == "nt" else "ffprobe"
+    candidate = os.path.join(os.path.dirname(FFMPEG_BINARY), name)
+    if os.path.isfile(candidate):
+        return candidate
+    return shutil.which("ffprobe")
+
+
+def _parse_rate(rate: str) -> float:
+    num, _, den = (rate or "0/1").partition("/")
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _probe_stream(video_path: str) -> Dict:
+    ffprobe = _ffprobe_binary()
+    if ffprobe:
+        proc = subprocess.run(
+            [
+                ffprobe, "-v", "error", "-select_streams", "v:0",
+                "-show_entries", "stream=codec_name,width,height,pix_fmt,avg_frame_rate,r_frame_rate:format=duration",
+                "-of", "json", video_path,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        data = json.loads(proc.stdout or b"{}")
+        stream = (data.get("streams") or [{}])[0]
+        return {
+            "duration": float(data.get("format", {}).get("duration") or 0),
+            "width": int(stream.get("width") or 0),
+            "height": int(stream.get("height") or 0),
+            "fps": _parse_rate(stream.get("avg_frame_rate")) or _parse_rate(stream.get("r_frame_rate")),
+            "codec": stream.get("codec_name"),
+            "pix_fmt": stream.get("pix_fmt"),
+        }
+
+    # no ffprobe available (imageio-ffmpeg only ships ffmpeg), parse `ffmpeg -i` instead
+    infos = ffmpeg_parse_infos(video_path)
+    width, height = infos.get("video_size") or (0, 0)
+    return {
+        "duration": float(infos.get("duration") or 0),
+        "width": int(width),
+        "height": int(height),
+        "fps": float(infos.get("video_fps") or 0),
+        "codec": infos.get("video_codec_name"),
+        "pix_fmt": None,
+    }
+
+
+def _load_probe(video_path: str) -> Optional[Dict]:
+    try:
+        return material_catalog.probe_info(video_path)
+    except sqlite3.Error as e:
+        logger.debug(f"failed to load probe info for {video_path}: {e}")
+        return None
+
+
+def _save_probe(video_path: str, info: Dict):
+    try:
+        material_catalog.save_probe(video_path, info)
+    except sqlite3.Error as e:
+        logger.warning(f"failed to save probe info for {video_path}: {e}")
+
+
+def probe_video(video_path: str, cache: bool = True) -> Dict:
+    """Return duration, size, fps, codec and pixel format of a video, cached in the material catalog"""
+    if not cache:
+        return _probe_stream(video_path)
+
+    info = _load_probe(video_path)
+    if info:
+        return info
+
+    info = _probe_stream(video_path)
+    stat = os.stat(video_path)
+    info["file_size"] = stat.st_size
+    info["mtime"] = stat.st_mtime
+    _save_probe(video_path, info)
+    return info
+
+
+def keyframe_times(video_path: str) -> List[float]:
+    """Presentation times of the keyframes of a video, cached with the probe info"""
+    info = probe_video(video_path)
+    if info.get("keyframes") is not None:
+        return info["keyframes"]
+
+    ffprobe = _ffprobe_binary()
+    if ffprobe:
+        proc = subprocess.run(
+            [
+                ffprobe, "-v", "error", "-select_streams", "v:0",
+                "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        keyframes = []
+        for line in proc.stdout.decode("utf-8", errors="ignore").splitlines():
+            pts_time, _, flags = line.partition(",")
+            if "K" in flags and pts_time not in ("", "N/A"):
+                keyframes.append(float(pts_time))
+    else:
+        # decode keyframes only and read their timestamps from showinfo
+        stderr = run_ffmpeg(
+            ["-skip_frame", "nokey", "-i", video_path, "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-"],
+            loglevel="info",
+        )
+        keyframes = [float(t) for t in re.findall(r"pts_time:([0-9.]+)", stderr)]
+
+    info["keyframes"] = sorted(keyframes)
+    _save_probe(video_path, info)
+    return info["keyframes"]
+
+
+def passthrough_args() -> List[str]:
+    """Output every decoded frame as is: `-fps_mode` needs ffmpeg 5.1, older builds only know `-vsync`"""
+    global _passthrough_option
+    if _passthrough_option is None:
+        proc = subprocess.run([FFMPEG_BINARY, "-hide_banner", "-h", "full"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        _passthrough_option = "-fps_mode" if b"-fps_mode" in proc.stdout else "-vsync"
+    return [_passthrough_option, "passthrough"]
+
+
+def sample_keyframes(video_path: str, count: int = 4, size: int = 224) -> np.ndarray:
+    """Up to `count` keyframes spread over a video, center-cropped to size x size RGB
+
+    Only keyframes are decoded (`-skip_frame nokey`), already scaled down by FFmpeg,
+    so sampling costs a fraction of decoding the video.
+    """
+    cmd = [
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "error",
+        "-skip_frame", "nokey", "-i", video_path, "-map", "0:v:0",
+        "-vf", f"scale={size}:{size}:force_original_aspect_ratio=increase,crop={size}:{size}",
+        *passthrough_args(), "-f", "rawvideo", "-pix_fmt", "rgb24", "-",
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        stderr = proc.stderr.decode("utf-8", errors="ignore").strip()
+        raise RuntimeError(f"ffmpeg exited with code {proc.returncode}: {stderr[-2000:]}")
+
+    frame_size = size * size * 3
+    frames = np.frombuffer(proc.stdout, dtype=np.uint8)
+    frames = frames[: len(frames) // frame_size * frame_size].reshape(-1, size, size, 3)
+    if len(frames) > count:
+        frames = frames[np.linspace(0, len(frames) - 1, count).round().astype(int)]
+    return frames
+
+
+def can_stream_copy(item, width: int, height: int, fps: int) -> bool:
+    """Whether a planned subclip can be cut without re-encoding"""
+    if getattr(item, "transition", None):
+        return False
+    try:
+        info = probe_video(item.file_path)
+    except Exception as e:
+        logger.debug(f"failed to probe {item.file_path}: {e}")
+        return False
+    return (
+        info.get("codec") in copyable_codecs
+        and (info.get("pix_fmt") is None or info.get("pix_fmt") in copyable_pix_fmts)
+        and info.get("width") == width
+        and info.get("height") == height
+        and abs(info.get("fps", 0) - fps) < 0.01
+    )
+
+
+def _snap_to_keyframe(item):
+    """Move the start of a stream-copied subclip back onto the preceding keyframe"""
+    keyframes = keyframe_times(item.file_path)
+    start = item.start_time or 0
+    candidates = [t for t in keyframes if t <= start + 1e-3]
+    snapped = candidates[-1] if candidates else 0.0
+    item.start_time = snapped
+    item.end_time = snapped + item.duration
+
+
+def _slide_offsets(transition: str, side: str, duration: float):
+    """Overlay x/y expressions reproducing MoviePy's SlideIn / SlideOut"""
+    d = transition_duration
+    if transition == VideoTransitionMode.slide_in.value:
+        # 1 -> 0 over the first `d` seconds
+        remaining = f"(1-min(t/{d},1))"
+    else:
+        # 0 -> 1 over the last `d` seconds
+        remaining = f"max(0,(t-{max(0.0, duration - d):.3f})/{d})"
+
+    if side == "left":
+        return f"-W*{remaining}", "0"
+    if side == "right":
+        return f"W*{remaining}", "0"
+    if side == "top":
+        return "0", f"-H*{remaining}"
+    return "0", f"H*{remaining}"
+
+
+def build_clip_filter(index: int, item, width: int, height: int, fps: int, normalized: bool = False) -> str:
+    """Filter chain turning input `index` into a normalized segment labelled [v{index}]
+
+    A `normalized` input is a segment that is already scaled, padded and transitioned.
+    """
+    if normalized:
+        return f"[{index}:v]setsar=1,fps={fps},setpts=PTS-STARTPTS,format=yuv420p[v{index}]"
+
+    duration = item.duration
+    chain = [
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease",
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:color=black",
+        "setsar=1",
+        f"fps={fps}",
+        "setpts=PTS-STARTPTS",
+    ]
+
+    transition = getattr(item, "transition", None)
+    if transition == VideoTransitionMode.fade_in.value:
+        chain.append(f"fade=t=in:st=0:d={transition_duration}")
+    elif transition == VideoTransitionMode.fade_out.value:
+        chain.append(f"fade=t=out:st={max(0.0, duration - transition_duration):.3f}:d={transition_duration}")
+
+    if transition in (VideoTransitionMode.slide_in.value, VideoTransitionMode.slide_out.value):
+        x, y = _slide_offsets(transition, getattr(item, "side", "left"), duration)
+        return (
+            f"[{index}:v]{','.join(chain)}[fg{index}];"
+            f"color=c=black:s={width}x{height}:r={fps}:d={duration:.3f}[bg{index}];"
+            f"[bg{index}][fg{index}]overlay=x='{x}':y='{y}':eval=frame:shortest=1,format=yuv420p[v{index}]"
+        )
+
+    chain.append("format=yuv420p")
+    return f"[{index}:v]{','.join(chain)}[v{index}]"
+
+
+def build_filter_graph(plan: List, width: int, height: int, fps: int, segments: Optional[Dict[int, str]] = None) -> str:
+    """Build the complete filter graph for a clip plan, output labelled [outv]
+
+    `segments` maps the id of plan items to their already normalized segment files.
+    """
+    segments = segments or {}
+    graph = [
+        build_clip_filter(i, item, width, height, fps, normalized=id(item) in segments)
+        for i, item in enumerate(plan)
+    ]
+    labels = "".join(f"[v{i}]" for i in range(len(plan)))
+    graph.append(f"{labels}concat=n={len(plan)}:v=1:a=0[outv]")
+    return ";".join(graph)
+
+
+def build_input_args(plan: List, segments: Optional[Dict[int, str]] = None) -> List[str]:
+    segments = segments or {}
+    args = []
+    for item in plan:
+        if id(item) in segments:
+            args += ["-i", segments[id(item)]]
+            continue
+        start = item.start_time or 0
+        args += ["-ss", f"{start:.3f}", "-t", f"{item.duration:.3f}", "-i", item.file_path]
+    return args
+
+
+def _segment_encoder_args(encoder_args: List[str]) -> List[str]:
+    """Drop mp4-only muxer flags, they do not apply to the segment container"""
+    args = []
+    skip = False
+    for arg in encoder_args:
+        if skip:
+            skip = False
+            continue
+        if arg == "-movflags":
+            skip = True
+            continue
+        args.append(arg)
+    return args
+
+
+def render_segment(item, segment_file: str, width: int, height: int, fps: int, encoder_args: List[str], threads: int = 2) -> str:
+    """Write one planned subclip as a standalone segment file"""
+    start = item.start_time or 0
+    if getattr(item, "stream_copy", False):
+        args = [
+            "-ss", f"{start:.3f}", "-i", item.file_path, "-t", f"{item.duration:.3f}",
+            "-map", "0:v:0", "-an", "-c:v", "copy",
+            "-bsf:v", "h264_mp4toannexb", "-avoid_negative_ts", "make_zero",
+        ]
+    else:
+        args = build_input_args([item]) + [
+            "-filter_complex", build_clip_filter(0, item, width, height, fps),
+            "-map", "[v0]", "-an",
+            "-threads", str(threads or 2),
+            *_segment_encoder_args(encoder_args),
+        ]
+    run_ffmpeg(args + ["-f", segment_format, segment_file])
+    return segment_file
+
+
+def _cached_render_segment(item, segment_file: str, width: int, height: int, fps: int, encoder_args: List[str], threads: int):
+    """Render a segment through the shared clip cache, returns (path, is_temporary)"""
+    if getattr(item, "stream_copy", False) or not clip_cache.enabled():
+        # stream copies are cheaper to redo than to store
+        return render_segment(item, segment_file, width, height, fps, encoder_args, threads), True
+
+    key = clip_cache.segment_key(item, width, height, fps, encoder_args, segment_format)
+    cached = clip_cache.get(key, segment_ext)
+    if cached:
+        logger.debug(f"clip cache hit: {os.path.basename(item.file_path)} @ {item.start_time or 0:.2f}s")
+        return cached, False
+
+    temp_file = clip_cache.temp_path(key, segment_ext)
+    try:
+        render_segment(item, temp_file, width, height, fps, encoder_args, threads)
+        return clip_cache.put(key, segment_ext, temp_file), False
+    except Exception:
+        clip_cache.delete_quietly(temp_file)
+        raise
+
+
+def concat_segments(segment_files: List[str], output_file: str, list_file: str) -> str:
+    """Join segments with the concat demuxer, without re-encoding"""
+    with open(list_file, "w", encoding="utf-8") as f:
+        for segment_file in segment_files:
+            escaped = os.path.abspath(segment_file).replace("\\", "/").replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    run_ffmpeg([
+        "-f", "concat", "-safe", "0", "-i", list_file,
+        "-map", "0:v:0", "-c", "copy", "-movflags", "+faststart",
+        output_file,
+    ])
+    return output_file
+
+
+def _normalize_segments(
+    plan: List,
+    work_dir: str,
+    width: int,
+    height: int,
+    fps: int,
+    encoder_args: List[str],
+    threads: int,
+    workers: int = 1,
+):
+    """Render the distinct items of `plan` as segments, returns ({id(item): segment file}, temporary files)
+
+    Clips that fail to render are logged and left out.
+    """
+    # looped plan items share the same object, render them only once
+    unique_items = list({id(item): item for item in plan}.values())
+    workers = max(1, min(workers, len(unique_items)))
+    # split the thread budget between the concurrent encoders
+    job_threads = max(1, (threads or 2) // workers)
+
+    rendered = {}
+    temporary_files = []
+    # every job is an ffmpeg process, a thread per job is enough to keep them all busy
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for i, item in enumerate(unique_items):
+            segment_file = os.path.join(work_dir, f"temp-segment-{i+1}.{segment_ext}")
+            futures[id(item)] = executor.submit(
+                _cached_render_segment, item, segment_file, width, height, fps, encoder_args, job_threads
+            )
+        for i, item in enumerate(unique_items):
+            try:
+                rendered[id(item)], is_temporary = futures[id(item)].result()
+                if is_temporary:
+                    temporary_files.append(rendered[id(item)])
+            except Exception as e:
+                logger.error(f"failed to render segment {i+1} ({os.path.basename(item.file_path)}), skipping it: {str(e)}")
+    return rendered, temporary_files
+
+
+def _render_segments(
+    plan: List,
+    output_file: str,
+    width: int,
+    height: int,
+    fps: int,
+    encoder_args: List[str],
+    threads: int,
+    workers: int = 1,
+) -> str:
+    output_dir = os.path.dirname(output_file)
+    list_file = os.path.join(output_dir, "temp-segments.txt")
+    temporary_files = [list_file]
+    try:
+        rendered, segment_temporaries = _normalize_segments(
+            plan, output_dir, width, height, fps, encoder_args, threads, workers
+        )
+        temporary_files += segment_temporaries
+        # keep the plan order, dropping the clips that failed
+        segment_files = [rendered[id(item)] for item in plan if id(item) in rendered]
+        if not segment_files:
+            raise RuntimeError("all segments failed to render")
+        concat_segments(segment_files, output_file, list_file)
+    finally:
+        # cached segments stay in the shared cache
+        for f in temporary_files:
+            clip_cache.delete_quietly(f)
+    return output_file
+
+
+def _prepare_inputs(
+    plan: List,
+    work_dir: str,
+    width: int,
+    height: int,
+    fps: int,
+    segment_encoder_args: List[str],
+    threads: int,
+    workers: int,
+):
+    """Inputs of the filter graph of `plan`, returns (plan, segments, temporary files)
+
+    With more than one worker the clips are normalized in parallel first, as
+    segments that the graph only concatenates. Otherwise the graph decodes the
+    sources itself, except for the clips found in the clip cache, and for the
+    clips used more than once, which are normalized once into the cache.
+    """
+    if workers > 1:
+        logger.info(f"normalizing {len(plan)} clips as segments with {workers} workers")
+        segments, temporary_files = _normalize_segments(
+            plan, work_dir, width, height, fps, segment_encoder_args, threads, workers
+        )
+        plan = [item for item in plan if id(item) in segments]
+        if not plan:
+            raise RuntimeError("all segments failed to render")
+        return plan, segments, temporary_files
+
+    if not clip_cache.enabled():
+        return plan, {}, []
+
+    uses = Counter(id(item) for item in plan)
+    segments = {}
+    repeated = []
+    for item in {id(item): item for item in plan}.values():
+        if getattr(item, "stream_copy", False):
+            continue
+        try:
+            key = clip_cache.segment_key(item, width, height, fps, segment_encoder_args, segment_format)
+        except OSError as e:
+            logger.debug(f"failed to fingerprint {item.file_path}: {e}")
+            continue
+        cached = clip_cache.get(key, segment_ext)
+        if cached:
+            segments[id(item)] = cached
+        elif uses[id(item)] > 1:
+            repeated.append(item)
+
+    hits = len(segments)
+    temporary_files = []
+    if repeated:
+        # a repeated clip that fails to normalize is decoded from its source instead
+        rendered, temporary_files = _normalize_segments(
+            repeated, work_dir, width, height, fps, segment_encoder_args, threads
+        )
+        segments.update(rendered)
+    if segments:
+        logger.info(f"clip cache: {hits} clips reused, {len(repeated)} repeated clips normalized once")
+    return plan, segments, temporary_files
+
+
+def render_video(
+    plan: List,
+    audio_file: str,
+    output_file: str,
+    width: int,
+    height: int,
+    fps: int,
+    encoder_args: List[str],
+    subtitle_file: str = "",
+    fonts_dir: str = "",
+    duration: float = 0,
+    threads: int = 2,
+    segment_encoder_args: Optional[List[str]] = None,
+    workers: int = 1,
+) -> str:
+    """Render the clips of `plan`, the subtitles and the final audio into the output video, in one encode
+
+    `segment_encoder_args` encode the clips that are normalized as segments
+    first (see `_prepare_inputs`), `encoder_args` the output video.
+    """
+    if not plan:
+        raise ValueError("cannot render an empty clip plan")
+
+    plan, segments, temporary_files = _prepare_inputs(
+        plan, os.path.dirname(output_file), width, height, fps, segment_encoder_args or encoder_args, threads, workers
+    )
+    try:
+        graph = build_filter_graph(plan, width, height, fps, segments)
+        video_label = "[outv]"
+        if subtitle_file:
+            graph += f";[outv]{subtitles_filter(subtitle_file, fonts_dir)}[subv]"
+            video_label = "[subv]"
+
+        logger.info(f"rendering {len(plan)} clips into the final video with a single ffmpeg filter graph")
+        args = build_input_args(plan, segments) + ["-i", audio_file]
+        if duration:
+            args += ["-t", f"{duration:.3f}"]
+        args += [
+            "-filter_complex", graph,
+            "-map", video_label, "-map", f"{len(plan)}:a:0",
+            "-threads", str(threads or 2),
+            *encoder_args,
+            "-c:a", "copy",
+            output_file,
+        ]
+        run_ffmpeg(args)
+    finally:
+        for f in temporary_files:
+            clip_cache.delete_quietly(f)
+    return output_file
+
+
+class ClipPlanReader:
+    """RGB frames of a clip plan, decoded and normalized by the filter graph in an ffmpeg subprocess
+
+    Frames are read in order, the way MoviePy requests them while writing a
+    video. Going back to an earlier frame restarts the decoder.
+    """
+
+    def __init__(
+        self,
+        plan: List,
+        width: int,
+        height: int,
+        fps: int,
+        threads: int = 2,
+        work_dir: str = "",
+        segment_encoder_args: Optional[List[str]] = None,
+        workers: int = 1,
+    ):
+        if not plan:
+            raise ValueError("cannot read an empty clip plan")
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.threads = threads
+        self.plan, self.segments, self.temporary_files = _prepare_inputs(
+            plan, work_dir or tempfile.gettempdir(), width, height, fps, segment_encoder_args or [], threads, workers
+        )
+        self.proc = None
+        self.index = -1
+        self.frame = None
+
+    def _start(self):
+        self._stop()
+        cmd = [
+            FFMPEG_BINARY, "-hide_banner", "-loglevel", "error",
+            *build_input_args(self.plan, self.segments),
+            "-filter_complex", build_filter_graph(self.plan, self.width, self.height, self.fps, self.segments),
+            "-map", "[outv]", "-an",
+            "-threads", str(self.threads or 2),
+            # the graph already outputs `fps`, rawvideo would otherwise be resampled to 25 fps
+            *passthrough_args(), "-f", "rawvideo", "-pix_fmt", "rgb24", "-",
+        ]
+        logger.debug(f"reading clip plan: {' '.join(cmd)}")
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=10**8)
+        self.index = -1
+        self.frame = None
+
+    def get_frame(self, t: float) -> np.ndarray:
+        index = int(t * self.fps + 1e-6)
+        if self.proc is None or index < self.index:
+            self._start()
+
+        frame_size = self.width * self.height * 3
+        while self.index < index:
+            data = self.proc.stdout.read(frame_size)
+            if len(data) < frame_size:
+                # past the last frame, keep showing it unless ffmpeg failed
+                if self.proc.wait() != 0 or self.frame is None:
+                    stderr = self.proc.stderr.read().decode("utf-8", errors="ignore").strip()
+                    raise RuntimeError(f"ffmpeg exited with code {self.proc.returncode}: {stderr[-2000:]}")
+                break
+            self.frame = np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)
+            self.index += 1
+        return self.frame
+
+    def _stop(self):
+        if self.proc is None:
+            return
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self.proc.stdout.close()
+        self.proc.stderr.close()
+        self.proc = None
+
+    def close(self):
+        self._stop()
+        for f in self.temporary_files:
+            clip_cache.delete_quietly(f)
+        self.temporary_files = []
+
+
+def render_clip_plan(
+    plan: List,
+    output_file: str,
+    width: int,
+    height: int,
+    fps: int,
+    encoder_args: List[str],
+    threads: int = 2,
+    workers: int = 1,
+) -> str:
+    """Decode, normalize and concatenate all clips of `plan` into an intermediate video
+
+    The final video is rendered from the plan directly (`render_video`), this
+    file is only written when that is not possible, and its frames are encoded
+    a second time for the final video.
+
+    By default the plan is rendered with a single filter graph, which reads
+    cached and repeated clips through the clip cache (see `_prepare_inputs`).
+    Plans with stream-copyable clips, or renders with more than one worker,
+    are normalized as independent segments instead (in parallel, through the
+    clip cache) and joined without re-encoding.
+    """
+    if not plan:
+        raise ValueError("cannot render an empty clip plan")
+
+    copyable = 0
+    for item in {id(item): item for item in plan}.values():
+        item.stream_copy = can_stream_copy(item, width, height, fps)
+        if item.stream_copy:
+            try:
+                _snap_to_keyframe(item)
+                copyable += 1
+            except Exception as e:
+                logger.debug(f"failed to read keyframes of {item.file_path}: {e}")
+                item.stream_copy = False
+
+    if copyable or workers > 1:
+        logger.info(
+            f"rendering {len(plan)} clips as segments with {workers} workers, "
+            f"{copyable} unique clips stream-copied without re-encoding"
+        )
+        return _render_segments(plan, output_file, width, height, fps, encoder_args, threads, workers)
+
+    plan, segments, temporary_files = _prepare_inputs(
+        plan, os.path.dirname(output_file), width, height, fps, encoder_args, threads, workers
+    )
+    try:
+        logger.info(f"rendering {len(plan)} clips with a single ffmpeg filter graph")
+        args = build_input_args(plan, segments)
+        args += [
+            "-filter_complex", build_filter_graph(plan, width, height, fps, segments),
+            "-map", "[outv]",
+            "-an",
+            "-threads", str(threads or 2),
+            *encoder_args,
+            output_file,
+        ]
+        run_ffmpeg(args)
+    finally:
+        for f in temporary_files:
+            clip_cache.delete_quietly(f)
+    return output_file
+
+
+def escape_filter_path(path: str) -> str:
+    """Escape a file path used as a filter option value"""
+    path = os.path.abspath(path).replace("\\", "/")
+    for char in ":',;[]":
+        path = path.replace(char, f"\\{char}")
+    return path
+
+
+def subtitles_filter(subtitle_file: str, fonts_dir: str = "") -> str:
+    """libass filter rendering an ASS/SRT subtitle file"""
+    subtitles = f"subtitles=filename={escape_filter_path(subtitle_file)}"
+    if fonts_dir:
+        subtitles += f":fontsdir={escape_filter_path(fonts_dir)}"
+    return subtitles
+
+
+def burn_subtitles(
+    video_file: str,
+    audio_file: str,
+    subtitle_file: str,
+    output_file: str,
+    encoder_args: List[str],
+    fonts_dir: str = "",
+    duration: float = 0,
+    threads: int = 2,
+) -> str:
+    """Render an ASS/SRT subtitle file onto a video with libass and mux the final audio, in one encode"""
+    args = ["-i", video_file, "-i", audio_file]
+    if duration:
+        args += ["-t", f"{duration:.3f}"]
+    args += [
+        "-vf", subtitles_filter(subtitle_file, fonts_dir),
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-threads", str(threads or 2),
+        *encoder_args,
+        "-c:a", "copy",
+        output_file,
+    ]
+    run_ffmpeg(args)
+    return output_file
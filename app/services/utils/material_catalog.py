@@ -0,0 +1,271 @@
+"""
+Catalog of downloaded video materials, in a single SQLite database.
+
+One row per video file records where it came from (source URL, search term,
+thumbnails), its stream properties (duration, resolution, fps, codec, pixel
+format, keyframes, valid while the file size and mtime are unchanged), the
+key of its search term embedding in the embedding store, and when it was
+last used. CLIP embeddings of keyframes sampled at download time are kept in a
+separate table, so listing the catalog does not read them. Looking up the metadata of a whole material list is one indexed
+query instead of one JSON sidecar per file.
+
+Sidecars written by earlier versions (`*_metadata.json`, `*_probe.json`) are
+imported the first time a video is looked up.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from app.services.utils.embedding_store import text_key
+from app.services.utils.sqlite_db import LocalConnection, batches, placeholders
+from app.utils import utils
+
+_schema = """
+CREATE TABLE IF NOT EXISTS materials (
+    video_path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    source_url TEXT,
+    search_term TEXT,
+    search_terms TEXT,
+    thumbnail_url TEXT,
+    preview_images TEXT,
+    embedding_key TEXT,
+    extra TEXT,
+    created_at REAL,
+    duration REAL,
+    width INTEGER,
+    height INTEGER,
+    fps REAL,
+    codec TEXT,
+    pix_fmt TEXT,
+    keyframes TEXT,
+    file_size INTEGER,
+    mtime REAL,
+    probed_at REAL,
+    updated_at REAL NOT NULL,
+    last_used REAL
+);
+CREATE INDEX IF NOT EXISTS materials_directory ON materials (directory, updated_at);
+CREATE INDEX IF NOT EXISTS materials_search_term ON materials (search_term);
+CREATE INDEX IF NOT EXISTS materials_last_used ON materials (last_used);
+CREATE TABLE IF NOT EXISTS material_frames (
+    video_path TEXT NOT NULL,
+    model TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    dim INTEGER NOT NULL,
+    vectors BLOB NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (video_path, model)
+);
+"""
+
+_probe_columns = ["duration", "width", "height", "fps", "codec", "pix_fmt", "keyframes", "file_size", "mtime"]
+_json_columns = {"search_terms", "preview_images", "keyframes", "extra"}
+
+_conn: Optional[LocalConnection] = None
+_conn_lock = threading.Lock()
+
+
+def db_path() -> str:
+    return os.path.join(utils.storage_dir("cache_videos", create=True), "materials.db")
+
+
+def _connection() -> LocalConnection:
+    global _conn
+    with _conn_lock:
+        if _conn is None:
+            _conn = LocalConnection(db_path(), _schema)
+        return _conn
+
+
+def _key(video_path: str) -> str:
+    return os.path.abspath(video_path)
+
+
+def _row_to_dict(row) -> Dict:
+    item = {}
+    for column, value in zip(row.keys(), row):
+        if value is not None and column in _json_columns:
+            value = json.loads(value)
+        item[column] = value
+    return item
+
+
+def _select(where: str, args: list) -> List[Dict]:
+    conn = _connection().get()
+    conn.row_factory = sqlite3.Row
+    return [_row_to_dict(row) for row in conn.execute(f"SELECT * FROM materials WHERE {where}", args)]
+
+
+def _upsert(video_path: str, values: Dict):
+    video_path = _key(video_path)
+    values = {
+        column: json.dumps(value, ensure_ascii=False) if column in _json_columns and value is not None else value
+        for column, value in values.items()
+    }
+    values["updated_at"] = time.time()
+    columns = ["video_path", "directory", *values]
+    updates = ", ".join(f"{column} = excluded.{column}" for column in values)
+    with _connection().transaction() as conn:
+        conn.execute(
+            f"INSERT INTO materials ({', '.join(columns)}) VALUES ({placeholders(len(columns))}) "
+            f"ON CONFLICT (video_path) DO UPDATE SET {updates}",
+            [video_path, os.path.dirname(video_path), *values.values()],
+        )
+
+
+def metadata(item: Dict) -> Dict:
+    """The metadata dict semantic selection works with, from a catalog row"""
+    result = dict(item.get("extra") or {})
+    result.update(
+        {
+            "video_path": item["video_path"],
+            "search_term": item.get("search_term") or "",
+            "file_size": item.get("file_size") or 0,
+            "created_at": item.get("created_at") or 0,
+        }
+    )
+    for column in ("source_url", "thumbnail_url", "preview_images", "duration", "width", "height", "fps"):
+        if item.get(column):
+            result[column] = item[column]
+    return result
+
+
+def save_metadata(video_path: str, search_term: str, additional_info: Optional[Dict] = None):
+    """Record where a video came from and what it was searched for"""
+    info = dict(additional_info or {})
+    values = {
+        "search_term": search_term,
+        "embedding_key": text_key(search_term) if search_term else None,
+        "created_at": os.path.getctime(video_path) if os.path.exists(video_path) else 0,
+    }
+    for column in ("source_url", "thumbnail_url", "preview_images"):
+        if column in info:
+            values[column] = info.pop(column)
+    if "search_terms" in info:
+        values["search_terms"] = info.pop("search_terms")
+    for column in ("video_path", "file_size"):
+        info.pop(column, None)
+    values["extra"] = info or None
+    _upsert(video_path, values)
+
+
+def save_probe(video_path: str, info: Dict):
+    """Record the stream properties of a video, valid for its current size and mtime"""
+    values = {column: info.get(column) for column in _probe_columns}
+    values["probed_at"] = time.time()
+    _upsert(video_path, values)
+
+
+def _import_sidecars(video_path: str) -> Optional[Dict]:
+    """Import the JSON sidecars of earlier versions into the catalog"""
+    name = os.path.splitext(video_path)[0]
+    imported = False
+    for suffix, save in (("_metadata.json", None), ("_probe.json", save_probe)):
+        sidecar = f"{name}{suffix}"
+        if not os.path.exists(sidecar):
+            continue
+        try:
+            with open(sidecar, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"failed to import {sidecar}: {e}")
+            continue
+        if save is None:
+            save_metadata(video_path, data.get("search_term", ""), data)
+        else:
+            save(video_path, data)
+        imported = True
+    return get_many([video_path], import_sidecars=False).get(_key(video_path)) if imported else None
+
+
+def get(video_path: str) -> Optional[Dict]:
+    return get_many([video_path]).get(_key(video_path))
+
+
+def get_many(video_paths: Iterable[str], import_sidecars: bool = True) -> Dict[str, Dict]:
+    """Catalog rows of the given videos, by absolute path"""
+    keys = list(dict.fromkeys(_key(path) for path in video_paths))
+    found = {}
+    for batch in batches(keys):
+        for item in _select(f"video_path IN ({placeholders(len(batch))})", batch):
+            found[item["video_path"]] = item
+    if import_sidecars:
+        for key in keys:
+            if key not in found:
+                item = _import_sidecars(key)
+                if item:
+                    found[key] = item
+    return found
+
+
+def list_directory(directory: str, since: float = 0) -> List[Dict]:
+    """Catalog rows of the videos in a directory, updated after `since`"""
+    return _select("directory = ? AND updated_at > ?", [_key(directory), since])
+
+
+def probe_info(video_path: str) -> Optional[Dict]:
+    """Recorded stream properties, if the file has not changed since it was probed"""
+    item = get(video_path)
+    if not item or not item.get("probed_at"):
+        return None
+    stat = os.stat(video_path)
+    if item.get("file_size") != stat.st_size or item.get("mtime") != stat.st_mtime:
+        return None
+    return {column: item.get(column) for column in _probe_columns}
+
+
+def save_frame_embeddings(video_path: str, model_name: str, embeddings: np.ndarray):
+    """Record the image embeddings of the keyframes sampled from a video, one row per frame"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    with _connection().transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO material_frames (video_path, model, count, dim, vectors, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [_key(video_path), model_name, embeddings.shape[0], embeddings.shape[1], embeddings.tobytes(), time.time()],
+        )
+
+
+def frame_embeddings(video_paths: Iterable[str], model_name: str) -> Dict[str, np.ndarray]:
+    """Keyframe embeddings (frames x dim) of the given videos, by absolute path"""
+    keys = list(dict.fromkeys(_key(path) for path in video_paths))
+    conn = _connection().get()
+    found = {}
+    for batch in batches(keys):
+        rows = conn.execute(
+            f"SELECT video_path, count, dim, vectors FROM material_frames "
+            f"WHERE model = ? AND video_path IN ({placeholders(len(batch))})",
+            [model_name, *batch],
+        )
+        for video_path, count, dim, vectors in rows:
+            found[video_path] = np.frombuffer(vectors, dtype=np.float32, count=count * dim).reshape(count, dim)
+    return found
+
+
+def touch(video_paths: Iterable[str]):
+    """Mark videos as used now"""
+    keys = list(dict.fromkeys(_key(path) for path in video_paths))
+    now = time.time()
+    try:
+        with _connection().transaction() as conn:
+            for batch in batches(keys):
+                conn.execute(
+                    f"UPDATE materials SET last_used = ? WHERE video_path IN ({placeholders(len(batch))})",
+                    [now, *batch],
+                )
+    except Exception as e:
+        logger.debug(f"failed to update last used time of materials: {e}")
+
+
+def remove(video_paths: Iterable[str]):
+    keys = list(dict.fromkeys(_key(path) for path in video_paths))
+    with _connection().transaction() as conn:
+        for batch in batches(keys):
+            conn.execute(f"DELETE FROM materials WHERE video_path IN ({placeholders(len(batch))})", batch)
+            conn.execute(f"DELETE FROM material_frames WHERE video_path IN ({placeholders(len(batch))})", batch)
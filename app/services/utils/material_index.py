@@ -0,0 +1,189 @@
+"""
+Vector index over the local library of downloaded videos.
+
+Every cached `vid-*.mp4` with a search term in the material catalog is indexed
+by the text embedding of its search term, computed with one semantic model
+(the index is rebuilt when another model is requested). The index is refreshed
+incrementally: only catalog rows that are new or changed since the last
+refresh are embedded, and their embeddings usually come straight from the
+persistent embedding store. Queries are a brute-force matrix product over the
+normalized embeddings, which stays in the millisecond range for libraries of
+tens of thousands of videos.
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.config import config
+from app.models.schema import VideoAspect
+from app.services import semantic_video
+from app.services.utils import ffmpeg_renderer, material_catalog
+from app.utils import utils
+
+
+def enabled() -> bool:
+    return config.app.get("enable_local_material_index", True)
+
+
+def library_dir() -> str:
+    return utils.storage_dir("cache_videos")
+
+
+class MaterialIndex:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.metadata: List[Dict] = []
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        # semantic model the embeddings were computed with
+        self.model_name: Optional[str] = None
+        # catalog update time of the most recent change already indexed
+        self._updated_at = 0.0
+        self._imported = False
+        self._lock = threading.Lock()
+
+    def _import_sidecars(self):
+        """Import the metadata sidecars of videos downloaded by earlier versions into the catalog"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        material_catalog.get_many(
+            [os.path.join(self.directory, name) for name in names if name.startswith("vid-") and name.endswith(".mp4")]
+        )
+
+    def refresh(self, model_name: Optional[str] = None) -> int:
+        """Index videos added or changed in the catalog since the last refresh, and return the library size
+
+        The embeddings are computed with `model_name`, or the semantic model loaded
+        last; switching to another model re-indexes the whole library.
+        """
+        model_name = model_name or semantic_video.current_model_name()
+        with self._lock:
+            if not self._imported:
+                self._import_sidecars()
+                self._imported = True
+
+            if model_name != self.model_name:
+                if self.model_name:
+                    logger.info(f"local material index: re-indexing with {model_name} (was {self.model_name})")
+                self.model_name = model_name
+                self.metadata = []
+                self.embeddings = np.zeros((0, 0), dtype=np.float32)
+                self._updated_at = 0.0
+
+            changed = material_catalog.list_directory(self.directory, since=self._updated_at)
+            if not changed:
+                return len(self.metadata)
+            self._updated_at = max(item["updated_at"] for item in changed)
+
+            changed_paths = {item["video_path"] for item in changed}
+            keep = [row for row, meta in enumerate(self.metadata) if meta["video_path"] not in changed_paths]
+            added = [
+                material_catalog.metadata(item) for item in changed
+                if item.get("search_term") and os.path.basename(item["video_path"]).startswith("vid-")
+            ]
+            self._rebuild(keep, added)
+            logger.info(f"local material index: {len(added)} added or updated, {len(self.metadata)} videos indexed")
+            return len(self.metadata)
+
+    def _rebuild(self, keep: List[int], added: List[Dict]):
+        metadata = [self.metadata[row] for row in keep]
+        blocks = [self.embeddings[keep]] if keep else []
+        if added:
+            blocks.append(semantic_video.encode_texts([meta["search_term"] for meta in added], model_name=self.model_name))
+            metadata.extend(added)
+        self.embeddings = np.vstack(blocks).astype(np.float32) if blocks else np.zeros((0, 0), dtype=np.float32)
+        self.metadata = metadata
+
+    def remove(self, video_paths: List[str]):
+        """Drop videos that no longer exist from the index and the catalog"""
+        video_paths = set(video_paths)
+        with self._lock:
+            self._rebuild([row for row, meta in enumerate(self.metadata) if meta["video_path"] not in video_paths], [])
+        material_catalog.remove(video_paths)
+
+    def query(self, texts: List[str], top_k: int = 10, min_similarity: float = 0.5) -> List[List[Tuple[Dict, float]]]:
+        """Up to `top_k` (metadata, similarity) matches per text, best first"""
+        if not texts or not self.metadata:
+            return [[] for _ in texts]
+        with self._lock:
+            metadata, embeddings, model_name = self.metadata, self.embeddings, self.model_name
+        # the queries are encoded with the model of the snapshot, never another embedding space
+        scores = semantic_video.encode_texts(texts, model_name=model_name) @ embeddings.T
+        results = []
+        for row in scores:
+            k = min(top_k, len(row))
+            best = np.argpartition(-row, k - 1)[:k]
+            best = best[np.argsort(-row[best])]
+            results.append([(metadata[i], float(row[i])) for i in best if row[i] >= min_similarity])
+        return results
+
+
+_indexes: Dict[str, MaterialIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(directory: str = "") -> MaterialIndex:
+    directory = os.path.abspath(directory or library_dir())
+    with _indexes_lock:
+        if directory not in _indexes:
+            _indexes[directory] = MaterialIndex(directory)
+        return _indexes[directory]
+
+
+def _orientation(width: int, height: int) -> str:
+    if width > height * 1.1:
+        return "landscape"
+    if height > width * 1.1:
+        return "portrait"
+    return "square"
+
+
+def find_local_videos(
+    search_term: str,
+    video_aspect: VideoAspect = VideoAspect.portrait,
+    minimum_duration: float = 0,
+    top_k: Optional[int] = None,
+    min_similarity: Optional[float] = None,
+    exclude: Optional[set] = None,
+    semantic_model: Optional[str] = None,
+) -> List[Tuple[str, float]]:
+    """Cached videos matching a search term, aspect and minimum duration, as (path, similarity)"""
+    if top_k is None:
+        top_k = int(config.app.get("local_material_top_k", 10))
+    if min_similarity is None:
+        min_similarity = float(config.app.get("local_material_min_similarity", 0.6))
+
+    index = get_index()
+    index.refresh(semantic_model)
+    matches = index.query([search_term], top_k + len(exclude or ()), min_similarity)[0]
+
+    target = _orientation(*VideoAspect(video_aspect).to_resolution())
+    videos = []
+    missing = []
+    for meta, similarity in matches:
+        video_path = meta["video_path"]
+        if exclude and video_path in exclude:
+            continue
+        if not os.path.exists(video_path):
+            missing.append(video_path)
+            continue
+        try:
+            info = ffmpeg_renderer.probe_video(video_path)
+        except Exception as e:
+            logger.debug(f"failed to probe local material {video_path}: {e}")
+            continue
+        if _orientation(info["width"], info["height"]) != target:
+            continue
+        if (info.get("duration") or 0) < minimum_duration:
+            continue
+        videos.append((video_path, similarity))
+        if len(videos) >= top_k:
+            break
+    if missing:
+        index.remove(missing)
+    return videos
@@ -0,0 +1,299 @@
+"""
+Registry of the machine learning models loaded by the services.
+
+Models are loaded lazily on first use and shared by every task of the process.
+Each model has its own load lock, so concurrent tasks asking for the same model
+wait for a single load instead of loading it twice. The resident size of every
+model is recorded (parameter and buffer bytes of its torch modules, or the
+growth of the process RSS while it loaded), and the least recently used models
+are unloaded once the total exceeds `model_memory_budget_mb`. Models idle for
+longer than `model_idle_timeout` seconds are unloaded as well, by a background
+sweep and whenever a model is requested.
+
+Services run inference inside `using()` or `pinned()`: a model in use is never
+evicted, since its caller would keep it in memory anyway and the next request
+would load a second copy.
+"""
+
+import gc
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from app.config import config
+
+try:
+    import psutil  # For memory accounting of models without torch modules
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+def _rss() -> int:
+    if not PSUTIL_AVAILABLE:
+        return 0
+    try:
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return 0
+
+
+def _module_nbytes(module) -> int:
+    size = 0
+    for tensor in list(module.parameters()) + list(module.buffers()):
+        size += tensor.element_size() * tensor.nelement()
+    return size
+
+
+def model_nbytes(model) -> int:
+    """Bytes held by the arrays or torch modules of a model, its tuple members or its attributes"""
+    if isinstance(model, (tuple, list)):
+        return sum(model_nbytes(item) for item in model)
+    if isinstance(getattr(model, "nbytes", None), int):
+        return model.nbytes
+    if hasattr(model, "parameters") and hasattr(model, "buffers"):
+        try:
+            return _module_nbytes(model)
+        except Exception:
+            return 0
+    # wrappers such as ChatterboxTTS keep their torch modules as attributes
+    size = 0
+    for value in getattr(model, "__dict__", {}).values():
+        if hasattr(value, "parameters") and hasattr(value, "buffers"):
+            try:
+                size += _module_nbytes(value)
+            except Exception:
+                pass
+    return size
+
+
+def _release_memory():
+    gc.collect()
+    try:
+        import torch
+
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except Exception:
+        pass
+
+
+class _Entry:
+    def __init__(self, name: str):
+        self.name = name
+        self.model = None
+        self.nbytes = 0
+        self.loaded_at = 0.0
+        self.last_used = 0.0
+        self.pins = 0
+        self.loads = 0
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    def __init__(self, max_bytes: int = 0, idle_timeout: float = 0):
+        # 0 means no memory budget / no idle timeout
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._sweeper: Optional[threading.Thread] = None
+        self.evictions = 0
+
+    def _entry(self, name: str) -> _Entry:
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _Entry(name)
+            return self._entries[name]
+
+    def get(self, name: str, loader: Callable[[], Any]) -> Any:
+        """The model registered as `name`, loaded with `loader` if it is not resident"""
+        self.evict_idle(keep=name)
+        entry = self._entry(name)
+        with entry.lock:
+            if entry.model is None:
+                # make room for the model, as large as it was when it was last loaded
+                self._evict_for(entry.nbytes, keep=name)
+                logger.info(f"loading model: {name}")
+                start = time.time()
+                rss = _rss()
+                model = loader()
+                if model is None:
+                    raise RuntimeError(f"loader of model {name} returned nothing")
+                entry.nbytes = model_nbytes(model) or max(0, _rss() - rss)
+                entry.model = model
+                entry.loaded_at = time.time()
+                entry.loads += 1
+                logger.info(
+                    f"model loaded: {name}, {entry.nbytes / 1024 / 1024:.0f} MB, {entry.loaded_at - start:.1f} seconds"
+                )
+                self._evict_for(0, keep=name)
+            entry.last_used = time.time()
+            return entry.model
+
+    @contextmanager
+    def pinned(self, name: str):
+        """Keep the model registered as `name` resident until the `with` block ends, once it is loaded"""
+        entry = self._entry(name)
+        with self._lock:
+            entry.pins += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                entry.pins -= 1
+                entry.last_used = time.time()
+
+    @contextmanager
+    def using(self, name: str, loader: Callable[[], Any]):
+        """Get a model and keep it resident until the `with` block ends"""
+        with self.pinned(name):
+            yield self.get(name, loader)
+
+    def is_loaded(self, name: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(name)
+            return entry is not None and entry.model is not None
+
+    def unload(self, name: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None:
+            return False
+        with entry.lock:
+            return self._unload(entry)
+
+    def unload_prefix(self, prefix: str) -> List[str]:
+        with self._lock:
+            names = [name for name in self._entries if name.startswith(prefix)]
+        return [name for name in names if self.unload(name)]
+
+    def _unload(self, entry: _Entry) -> bool:
+        # callers hold entry.lock
+        if entry.model is None:
+            return False
+        entry.model = None
+        _release_memory()
+        logger.info(f"model unloaded: {entry.name}")
+        return True
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(entry.nbytes for entry in self._entries.values() if entry.model is not None)
+
+    def _candidates(self, keep: str) -> List[_Entry]:
+        """Resident models that may be unloaded, least recently used first"""
+        with self._lock:
+            entries = [
+                entry for entry in self._entries.values()
+                if entry.model is not None and entry.pins == 0 and entry.name != keep
+            ]
+        return sorted(entries, key=lambda entry: entry.last_used)
+
+    def _evict_for(self, nbytes: int, keep: str = ""):
+        """Unload least recently used models until `nbytes` more fit in the budget"""
+        if self.max_bytes <= 0:
+            return
+        for entry in self._candidates(keep):
+            if self.resident_bytes() + nbytes <= self.max_bytes:
+                return
+            # a model being loaded or used right now is skipped instead of waited for
+            if entry.lock.acquire(blocking=False):
+                try:
+                    if entry.pins == 0 and self._unload(entry):
+                        self.evictions += 1
+                        logger.info(f"evicted model {entry.name} to stay within the model memory budget")
+                finally:
+                    entry.lock.release()
+
+    def evict_idle(self, keep: str = "") -> List[str]:
+        """Unload models that have not been used for `idle_timeout` seconds"""
+        if self.idle_timeout <= 0:
+            return []
+        evicted = []
+        now = time.time()
+        for entry in self._candidates(keep):
+            if now - entry.last_used < self.idle_timeout:
+                continue
+            if entry.lock.acquire(blocking=False):
+                try:
+                    if entry.pins == 0 and self._unload(entry):
+                        self.evictions += 1
+                        evicted.append(entry.name)
+                        logger.info(f"evicted model {entry.name}, idle for more than {self.idle_timeout:.0f} seconds")
+                finally:
+                    entry.lock.release()
+        return evicted
+
+    def start_idle_sweep(self, interval: float = 0):
+        """Run `evict_idle` from a daemon thread, so idle models are unloaded even when no model is requested"""
+        if self.idle_timeout <= 0 or self._sweeper is not None:
+            return
+        interval = interval or min(60.0, max(1.0, self.idle_timeout / 2))
+
+        def sweep():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.evict_idle()
+                except Exception as e:
+                    logger.warning(f"failed to unload idle models: {e}")
+
+        self._sweeper = threading.Thread(target=sweep, name="model-idle-sweep", daemon=True)
+        self._sweeper.start()
+
+    def stats(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            models = {
+                entry.name: {
+                    "loaded": entry.model is not None,
+                    "bytes": entry.nbytes,
+                    "loads": entry.loads,
+                    "in_use": entry.pins,
+                    "idle_seconds": round(now - entry.last_used, 1) if entry.last_used else None,
+                }
+                for entry in self._entries.values()
+            }
+        return {
+            "models": models,
+            "resident_bytes": self.resident_bytes(),
+            "max_bytes": self.max_bytes,
+            "idle_timeout": self.idle_timeout,
+            "evictions": self.evictions,
+        }
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ModelRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry(
+                max_bytes=int(config.app.get("model_memory_budget_mb", 0)) * 1024 * 1024,
+                idle_timeout=float(config.app.get("model_idle_timeout", 0)),
+            )
+            _registry.start_idle_sweep()
+        return _registry
+
+
+def get_model(name: str, loader: Callable[[], Any]) -> Any:
+    return get_registry().get(name, loader)
+
+
+def using(name: str, loader: Callable[[], Any]):
+    return get_registry().using(name, loader)
+
+
+def pinned(name: str):
+    return get_registry().pinned(name)
+
+
+def unload(name: str) -> bool:
+    return get_registry().unload(name)
@@ -0,0 +1,54 @@
+"""
+SQLite connections shared safely by threads and worker processes.
+
+Databases are opened in WAL mode, so any number of readers run concurrently
+with one writer, and every thread of every process gets its own connection.
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# sqlite limits the number of host parameters of a statement
+max_parameters = 500
+
+
+class LocalConnection:
+    def __init__(self, db_path: str, schema: str):
+        self.db_path = db_path
+        self.schema = schema
+        self._local = threading.local()
+
+    def get(self) -> sqlite3.Connection:
+        # sqlite connections must not be shared across threads or forked processes
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.schema)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Run the statements of the `with` block atomically, taking the write lock up front"""
+        conn = self.get()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def placeholders(count: int) -> str:
+    return ",".join("?" * count)
+
+
+def batches(items: list, size: int = max_parameters):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
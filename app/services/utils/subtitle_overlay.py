@@ -0,0 +1,128 @@
+"""
+Blend subtitle cues into video frames without per-frame compositing.
+
+Every cue is rasterized once into a premultiplied RGBA sprite, trimmed to its
+visible pixels. Sprites are indexed by start time in a sorted array, so each
+frame only looks up and blends the cues that are on screen at that time, no
+matter how many cues the video has.
+"""
+
+import itertools
+from bisect import bisect_right
+from typing import List
+
+import numpy as np
+from loguru import logger
+from moviepy.tools import compute_position
+
+
+class SubtitleSprite:
+    def __init__(self, start: float, end: float, x: int, y: int, rgba: np.ndarray):
+        """`rgba` is an uint8 (h, w, 4) image placed at (x, y), already clipped to the frame"""
+        self.start = start
+        self.end = end
+        self.x = x
+        self.y = y
+        alpha = rgba[:, :, 3:4].astype(np.uint16)
+        # premultiplied color and inverse alpha, ready for a single multiply-add per pixel
+        self.premultiplied = ((rgba[:, :, :3].astype(np.uint16) * alpha + 127) // 255).astype(np.uint16)
+        self.inverse_alpha = 255 - alpha
+
+    @property
+    def height(self) -> int:
+        return self.premultiplied.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.premultiplied.shape[1]
+
+    def blend(self, frame: np.ndarray):
+        """Alpha-blend the sprite into `frame` in place"""
+        region = frame[self.y:self.y + self.height, self.x:self.x + self.width]
+        blended = (region.astype(np.uint16) * self.inverse_alpha + 127) // 255 + self.premultiplied
+        region[:] = blended.astype(np.uint8)
+
+
+def sprite_from_clip(clip, video_size) -> SubtitleSprite | None:
+    """Rasterize a positioned MoviePy text/image clip once, None if nothing of it is visible"""
+    rgb = clip.get_frame(0)
+    if clip.mask is not None:
+        alpha = np.clip(clip.mask.get_frame(0) * 255 + 0.5, 0, 255).astype(np.uint8)
+    else:
+        alpha = np.full(rgb.shape[:2], 255, dtype=np.uint8)
+    rgba = np.dstack([rgb.astype(np.uint8), alpha])
+
+    h, w = rgba.shape[:2]
+    x, y = compute_position((w, h), video_size, clip.pos(0), clip.relative_pos)
+    x, y = int(x), int(y)
+
+    # clip to the frame
+    frame_w, frame_h = video_size
+    left, top = max(0, -x), max(0, -y)
+    right, bottom = min(w, frame_w - x), min(h, frame_h - y)
+    if right <= left or bottom <= top:
+        return None
+    rgba = rgba[top:bottom, left:right]
+    x, y = x + left, y + top
+
+    # trim the fully transparent margins, they would only cost blending time
+    rows = np.flatnonzero(rgba[:, :, 3].any(axis=1))
+    cols = np.flatnonzero(rgba[:, :, 3].any(axis=0))
+    if len(rows) == 0:
+        return None
+    rgba = rgba[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+
+    end = clip.end if clip.end is not None else float("inf")
+    return SubtitleSprite(clip.start, end, x + int(cols[0]), y + int(rows[0]), np.ascontiguousarray(rgba))
+
+
+class SubtitleTrack:
+    def __init__(self, sprites: List[SubtitleSprite]):
+        self.sprites = sorted(sprites, key=lambda s: s.start)
+        self._starts = [s.start for s in self.sprites]
+        # running maximum of the end times, lets the lookup stop at the first cue that
+        # cannot overlap `t` anymore, even when cues overlap each other
+        self._max_ends = list(itertools.accumulate((s.end for s in self.sprites), max))
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def active(self, t: float) -> List[SubtitleSprite]:
+        """Sprites on screen at time `t`, in start order"""
+        active = []
+        i = bisect_right(self._starts, t)
+        while i > 0 and self._max_ends[i - 1] > t:
+            i -= 1
+            if self.sprites[i].end > t:
+                active.append(self.sprites[i])
+        active.reverse()
+        return active
+
+    def blend(self, frame: np.ndarray, t: float) -> np.ndarray:
+        active = self.active(t)
+        if not active:
+            return frame
+        # decoded frames can be read-only views of the reader buffer
+        frame = frame.copy()
+        for sprite in active:
+            sprite.blend(frame)
+        return frame
+
+    def apply(self, video_clip):
+        """Return `video_clip` with the subtitles burned into its frames"""
+        return video_clip.transform(lambda get_frame, t: self.blend(get_frame(t), t))
+
+
+def overlay_clips(video_clip, text_clips: List):
+    """Burn positioned MoviePy text clips into `video_clip`, rasterizing each of them once"""
+    sprites = []
+    for clip in text_clips:
+        try:
+            sprite = sprite_from_clip(clip, video_clip.size)
+        except Exception as e:
+            logger.error(f"failed to rasterize subtitle clip: {str(e)}")
+            continue
+        if sprite:
+            sprites.append(sprite)
+    logger.info(f"rasterized {len(sprites)} subtitle cues")
+    return SubtitleTrack(sprites).apply(video_clip)
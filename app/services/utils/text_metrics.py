@@ -0,0 +1,68 @@
+"""
+Memoized font loading and text measurement, and linear-time line breaking.
+
+Line breaking sums cached per-word (or per-character) advance widths with
+prefix sums, instead of measuring every candidate line from scratch.
+"""
+
+import itertools
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from PIL import ImageFont
+
+
+@lru_cache(maxsize=32)
+def get_font(font_path: str, font_size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(font_path, font_size)
+
+
+@lru_cache(maxsize=65536)
+def text_size(font_path: str, font_size: int, text: str) -> Tuple[int, int]:
+    """Ink box (width, height) of `text` with surrounding whitespace stripped"""
+    left, top, right, bottom = get_font(font_path, font_size).getbbox(text.strip())
+    return right - left, bottom - top
+
+
+@lru_cache(maxsize=65536)
+def advance(font_path: str, font_size: int, text: str) -> float:
+    """Horizontal advance of `text`, additive across concatenated pieces"""
+    return get_font(font_path, font_size).getlength(text)
+
+
+def font_text_width(font, text: str) -> int:
+    """Cached ink width of `text` for an already loaded font"""
+    font_path = getattr(font, "path", None)
+    if isinstance(font_path, str):
+        return text_size(font_path, font.size, text)[0]
+    left, _, right, _ = font.getbbox(text.strip())
+    return right - left
+
+
+def _greedy_breaks(widths: List[float], separator: float, max_width: float) -> List[Tuple[int, int]]:
+    """(start, end) index ranges of greedily filled lines, using prefix sums of the widths"""
+    prefix = [0.0, *itertools.accumulate(widths)]
+    ranges = []
+    start = 0
+    for end in range(1, len(widths) + 1):
+        line_width = prefix[end] - prefix[start] + separator * (end - start - 1)
+        if line_width > max_width and end - 1 > start:
+            ranges.append((start, end - 1))
+            start = end - 1
+    ranges.append((start, len(widths)))
+    return ranges
+
+
+def break_words(words: List[str], font_path: str, font_size: int, max_width: float) -> Optional[List[str]]:
+    """Greedily fill lines with whole words, None when a single word is wider than `max_width`"""
+    widths = [advance(font_path, font_size, word) for word in words]
+    if any(width > max_width for width in widths):
+        return None
+    separator = advance(font_path, font_size, " ")
+    return [" ".join(words[start:end]) for start, end in _greedy_breaks(widths, separator, max_width)]
+
+
+def break_chars(text: str, font_path: str, font_size: int, max_width: float) -> List[str]:
+    """Greedily fill lines character by character, for scripts without spaces"""
+    widths = [advance(font_path, font_size, char) for char in text]
+    return [text[start:end] for start, end in _greedy_breaks(widths, 0.0, max_width)]
@@ -0,0 +1,121 @@
+"""
+Cached rendering of word-highlighted subtitle images.
+
+Every word is drawn once per style (font, size, fill, stroke) into a small
+RGBA sprite. A cue is laid out once, its normal state is assembled by pasting
+sprites, and each highlighted state is a copy of it with the highlighted words
+pasted over in the highlight color.
+"""
+
+from functools import lru_cache
+from typing import FrozenSet, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from app.services.utils import text_metrics
+
+Color = Tuple[int, int, int]
+
+# padding around the text block, same as the original word highlight renderer
+padding = 20
+
+
+def get_font(font_path: str, font_size: int):
+    try:
+        return text_metrics.get_font(font_path, font_size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=4096)
+def word_sprite(
+    word: str,
+    font_path: str,
+    font_size: int,
+    fill: Color,
+    stroke_fill: Optional[Color],
+    stroke_width: int,
+) -> Tuple[Image.Image, int, int]:
+    """A word drawn with its stroke, and the offset of the sprite from the text anchor"""
+    font = get_font(font_path, font_size)
+    stroke_width = stroke_width if stroke_fill else 0
+    left, top, right, bottom = ImageDraw.Draw(Image.new("RGBA", (1, 1))).textbbox(
+        (0, 0), word, font=font, stroke_width=stroke_width
+    )
+    sprite = Image.new("RGBA", (max(1, right - left), max(1, bottom - top)), (0, 0, 0, 0))
+    ImageDraw.Draw(sprite).text(
+        (-left, -top), word, font=font, fill=fill, stroke_width=stroke_width, stroke_fill=stroke_fill
+    )
+    return sprite, left, top
+
+
+@lru_cache(maxsize=256)
+def layout(wrapped_text: str, font_path: str, font_size: int, max_width: int):
+    """Anchor position of every word of an already wrapped text, and the image size"""
+    font = get_font(font_path, font_size)
+
+    def advance(word):
+        left, _, right, _ = font.getbbox(word + " ")
+        return right - left
+
+    lines = wrapped_text.split("\n")
+    line_height = int(font_size * 1.3)
+    img_width = max_width + 2 * padding
+    img_height = len(lines) * line_height + 2 * padding
+
+    positions = []
+    y_pos = padding
+    for line in lines:
+        words = line.split()
+        line_width = sum(advance(word) for word in words)
+        # center the line, keeping the minimum padding
+        x_pos = max(padding, (img_width - line_width) // 2)
+        for word in words:
+            positions.append((word, x_pos, y_pos))
+            x_pos += advance(word)
+        y_pos += line_height
+    return tuple(positions), (img_width, img_height)
+
+
+def _paste_word(img: Image.Image, word: str, x: int, y: int, font_path, font_size, fill, stroke_fill, stroke_width):
+    sprite, left, top = word_sprite(word, font_path, font_size, fill, stroke_fill, stroke_width)
+    x, y = x + left, y + top
+    if x < 0 or y < 0:
+        # alpha_composite does not accept negative destinations
+        sprite = sprite.crop((max(0, -x), max(0, -y), sprite.width, sprite.height))
+        x, y = max(0, x), max(0, y)
+    img.alpha_composite(sprite, (x, y))
+
+
+@lru_cache(maxsize=16)
+def _normal_image(wrapped_text, font_path, font_size, max_width, fill, stroke_fill, stroke_width) -> Image.Image:
+    positions, size = layout(wrapped_text, font_path, font_size, max_width)
+    img = Image.new("RGBA", size, (0, 0, 0, 0))
+    for word, x, y in positions:
+        _paste_word(img, word, x, y, font_path, font_size, fill, stroke_fill, stroke_width)
+    return img
+
+
+def render_highlighted(
+    wrapped_text: str,
+    highlighted_word_indices: FrozenSet[int],
+    font_path: str,
+    font_size: int,
+    max_width: int,
+    normal_color: Color,
+    highlight_color: Color,
+    stroke_color: Optional[Color],
+    stroke_width: int,
+) -> Image.Image:
+    """Image of a wrapped cue with the given word indices in the highlight color"""
+    img = _normal_image(wrapped_text, font_path, font_size, max_width, normal_color, stroke_color, stroke_width)
+    if not highlighted_word_indices:
+        return img.copy()
+
+    img = img.copy()
+    positions, _ = layout(wrapped_text, font_path, font_size, max_width)
+    for index in highlighted_word_indices:
+        if 0 <= index < len(positions):
+            word, x, y = positions[index]
+            _paste_word(img, word, x, y, font_path, font_size, highlight_color, stroke_color, stroke_width)
+    return img
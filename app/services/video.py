@@ -17,60 +17,60 @@ from moviepy import (
     CompositeVideoClip,
     ImageClip,
     TextClip,
+    VideoClip,
     VideoFileClip,
     afx,
+    vfx,
     concatenate_videoclips,
 )
 from moviepy.video.tools.subtitles import SubtitlesClip
 from PIL import ImageFont, ImageDraw, Image
 
+from app.config import config
 from app.models import const
 from app.models.schema import (
+    EncoderProfile,
     MaterialInfo,
     VideoAspect,
     VideoConcatMode,
     VideoParams,
     VideoTransitionMode,
 )
-from app.services.utils import video_effects
+from app.services.utils import (
+    ass_subtitles,
+    encoder_profiles,
+    ffmpeg_renderer,
+    subtitle_overlay,
+    text_metrics,
+    video_effects,
+    word_sprites,
+)
 from app.utils import utils
 from app.services import semantic_video
 
-# High-quality video encoding settings
+# Encoding settings. The x264 settings of the final encode come from the task's
+# encoder profile, intermediate files use a near-transparent High profile (see encoder_profiles)
 audio_codec = "aac"
-video_codec = "libx264"
 fps = 30
-
-# High-quality encoding parameters
-video_bitrate = "8000k"  # High bitrate for excellent quality
 audio_bitrate = "320k"   # High audio bitrate
-crf = 18                 # Constant Rate Factor - lower = higher quality (18-23 is excellent range)
-preset = "medium"        # Balance between encoding speed and compression efficiency
-
-# FFmpeg parameters for maximum quality
-quality_params = [
-    "-crf", str(crf),
-    "-preset", preset,
-    "-profile:v", "high",
-    "-level", "4.1",
-    "-pix_fmt", "yuv420p",
-    "-movflags", "+faststart"
-]
 
 class SubClippedVideoClip:
-    def __init__(self, file_path, start_time=None, end_time=None, width=None, height=None, duration=None):
+    def __init__(self, file_path, start_time=None, end_time=None, width=None, height=None, duration=None, transition=None, side=None):
         self.file_path = file_path
         self.start_time = start_time
         self.end_time = end_time
         self.width = width
         self.height = height
+        # concrete transition (VideoTransitionMode value, Shuffle already resolved) and slide side
+        self.transition = transition
+        self.side = side
         if duration is None:
             self.duration = end_time - start_time
         else:
             self.duration = duration
 
     def __str__(self):
-        return f"SubClippedVideoClip(file_path={self.file_path}, start_time={self.start_time}, end_time={self.end_time}, duration={self.duration}, width={self.width}, height={self.height})"
+        return f"SubClippedVideoClip(file_path={self.file_path}, start_time={self.start_time}, end_time={self.end_time}, duration={self.duration}, width={self.width}, height={self.height}, transition={self.transition})"
 
 
 def close_clip(clip):
@@ -136,6 +136,65 @@ def get_bgm_file(bgm_type: str = "random", bgm_file: str = ""):
     return ""
 
 
+def ken_burns_boxes(
+    img_w: int,
+    img_h: int,
+    video_width: int,
+    video_height: int,
+    duration: float,
+    pan_x: int = 0,
+    pan_y: int = 0,
+    zoom_start: float = 1.0,
+    zoom_end: float = 1.15,
+) -> np.ndarray:
+    """Source crop box (x1, y1, x2, y2) of every frame of a Ken Burns clip, one row per frame
+
+    Boxes are sub-pixel, so the zoom and pan move smoothly instead of in whole pixels.
+    """
+    n_frames = max(1, int(np.ceil(duration * fps)))
+    progress = np.arange(n_frames, dtype=np.float64) / fps / duration if duration > 0 else np.zeros(n_frames)
+    progress = np.clip(progress, 0.0, 1.0)
+    zoom = zoom_start + (zoom_end - zoom_start) * progress
+
+    crop_w = video_width / zoom
+    crop_h = video_height / zoom
+
+    # center crop with pan offset
+    offset_x = (img_w - crop_w) / 2 * pan_x * progress * 0.3
+    offset_y = (img_h - crop_h) / 2 * pan_y * progress * 0.3
+    x1 = np.clip(img_w / 2 + offset_x - crop_w / 2, 0, img_w - crop_w)
+    y1 = np.clip(img_h / 2 + offset_y - crop_h / 2, 0, img_h - crop_h)
+
+    return np.stack([x1, y1, x1 + crop_w, y1 + crop_h], axis=1)
+
+
+def ken_burns_clip(
+    img_path: str,
+    duration: float,
+    video_width: int,
+    video_height: int,
+    pan_x: int = 0,
+    pan_y: int = 0,
+) -> VideoClip:
+    """Image clip with a slow zoom and pan, one bilinear crop-and-resize per frame"""
+    img = Image.open(img_path).convert("RGB")
+    img_w, img_h = img.size
+
+    # Scale to cover: ensure image is larger than target in both dimensions,
+    # with an extra 25% of zoom headroom. Done once, frames only crop and zoom.
+    scale = max((video_width * 1.25) / img_w, (video_height * 1.25) / img_h)
+    img = img.resize((int(img_w * scale), int(img_h * scale)), Image.LANCZOS)
+
+    boxes = ken_burns_boxes(img.width, img.height, video_width, video_height, duration, pan_x, pan_y)
+
+    def make_frame(t):
+        box = boxes[min(int(t * fps), len(boxes) - 1)]
+        # the box is at most 15% smaller than the output, bilinear does not alias at this scale
+        return np.asarray(img.resize((video_width, video_height), Image.BILINEAR, box=tuple(box)))
+
+    return VideoClip(frame_function=make_frame, duration=duration)
+
+
 def combine_videos(
     combined_video_path: str,
     video_paths: List[str],
@@ -166,7 +225,6 @@ def combine_videos(
     # ──────────────────────────────────────────────────────────────
     if is_image_mode:
         logger.info("🖼️ Using IMAGE mode – creating Ken Burns slideshow")
-        from PIL import Image as PILImage
 
         processed_clips = []
         video_duration = 0
@@ -184,68 +242,24 @@ def combine_videos(
             idx += 1
 
             try:
-                # Load image and resize to cover target resolution
-                pil_img = PILImage.open(img_path).convert("RGB")
-                img_w, img_h = pil_img.size
-
-                # Scale to cover: ensure image is larger than target in both dimensions
-                scale_w = (video_width * 1.25) / img_w  # extra 25% for zoom headroom
-                scale_h = (video_height * 1.25) / img_h
-                scale = max(scale_w, scale_h)
-                new_w = int(img_w * scale)
-                new_h = int(img_h * scale)
-                pil_img = pil_img.resize((new_w, new_h), PILImage.LANCZOS)
-                img_array = np.array(pil_img)
-
                 # Determine this clip's duration (last clip might be shorter)
                 remaining = audio_duration - video_duration
                 this_dur = min(clip_dur, remaining + crossfade_dur) if remaining > 0 else clip_dur
 
                 # Ken Burns effect: slow zoom from 1.0× to 1.15× over clip duration
                 # with a gentle random pan direction
-                zoom_start, zoom_end = 1.0, 1.15
-                pan_x_dir = random.choice([-1, 0, 1])  # left / none / right
-                pan_y_dir = random.choice([-1, 0, 1])
-
-                def make_ken_burns_frame(get_frame, t, _img=img_array, _dur=this_dur,
-                                         _zs=zoom_start, _ze=zoom_end,
-                                         _px=pan_x_dir, _py=pan_y_dir,
-                                         _vw=video_width, _vh=video_height):
-                    """Apply Ken Burns zoom + pan for a single frame."""
-                    progress = t / _dur if _dur > 0 else 0
-                    zoom = _zs + (_ze - _zs) * progress
-
-                    h, w = _img.shape[:2]
-                    crop_w = int(_vw / zoom)
-                    crop_h = int(_vh / zoom)
-
-                    # Center crop with pan offset
-                    max_offset_x = (w - crop_w) // 2
-                    max_offset_y = (h - crop_h) // 2
-                    offset_x = int(max_offset_x * _px * progress * 0.3)
-                    offset_y = int(max_offset_y * _py * progress * 0.3)
-
-                    cx = w // 2 + offset_x
-                    cy = h // 2 + offset_y
-
-                    x1 = max(0, cx - crop_w // 2)
-                    y1 = max(0, cy - crop_h // 2)
-                    x2 = min(w, x1 + crop_w)
-                    y2 = min(h, y1 + crop_h)
-
-                    cropped = _img[y1:y2, x1:x2]
-
-                    # Resize to exact target resolution
-                    from PIL import Image as _PILImg
-                    result = _PILImg.fromarray(cropped).resize((_vw, _vh), _PILImg.LANCZOS)
-                    return np.array(result)
-
-                base_clip = ImageClip(img_array).with_duration(this_dur)
-                kb_clip = base_clip.transform(make_ken_burns_frame)
+                kb_clip = ken_burns_clip(
+                    img_path,
+                    this_dur,
+                    video_width,
+                    video_height,
+                    pan_x=random.choice([-1, 0, 1]),  # left / none / right
+                    pan_y=random.choice([-1, 0, 1]),
+                )
 
                 # Apply crossfade-in on all clips except the first
                 if processed_clips:
-                    kb_clip = kb_clip.with_effects([afx.CrossFadeIn(crossfade_dur)])
+                    kb_clip = kb_clip.with_effects([vfx.CrossFadeIn(crossfade_dur)])
 
                 processed_clips.append(kb_clip)
                 video_duration += this_dur - (crossfade_dur if processed_clips and len(processed_clips) > 1 else 0)
@@ -267,19 +281,19 @@ def combine_videos(
 
         logger.info(f"concatenating {len(processed_clips)} image clips")
         try:
-            final_clip = concatenate_videoclips(processed_clips, method="compose")
-            final_clip.write_videofile(
-                combined_video_path,
-                threads=threads,
-                logger=None,
-                temp_audiofile_path=output_dir,
-                audio_codec=audio_codec,
-                fps=fps,
-                codec=video_codec,
-                bitrate=video_bitrate,
-                audio_bitrate=audio_bitrate,
-                ffmpeg_params=quality_params,
-            )
+            # negative padding overlaps consecutive clips so the crossfades blend them
+            final_clip = concatenate_videoclips(processed_clips, method="compose", padding=-crossfade_dur)
+            with encoder_profiles.timed_encode("image slideshow", combined_video_path):
+                final_clip.write_videofile(
+                    combined_video_path,
+                    threads=threads,
+                    logger=None,
+                    temp_audiofile_path=output_dir,
+                    audio_codec=audio_codec,
+                    fps=fps,
+                    audio_bitrate=audio_bitrate,
+                    **encoder_profiles.encoder_settings(),
+                )
             for c in processed_clips:
                 close_clip(c)
             close_clip(final_clip)
@@ -290,32 +304,40 @@ def combine_videos(
         return combined_video_path
 
     # ──────────────────────────────────────────────────────────────
-    # VIDEO MODE (original logic below)
+    # VIDEO MODE: build a clip plan, then render it in a single pass
     # ──────────────────────────────────────────────────────────────
+    processed_clips = plan_clips(
+        video_paths,
+        audio_file,
+        video_concat_mode=video_concat_mode,
+        video_transition_mode=video_transition_mode,
+        max_clip_duration=max_clip_duration,
+        script=script,
+        params=params,
+    )
+    return render_clips(processed_clips, combined_video_path, video_width, video_height, threads)
 
-    aspect = VideoAspect(video_aspect)
-    video_width, video_height = aspect.to_resolution()
+
+def plan_clips(
+    video_paths: List[str],
+    audio_file: str,
+    video_concat_mode: VideoConcatMode = VideoConcatMode.random,
+    video_transition_mode: VideoTransitionMode = None,
+    max_clip_duration: int = 5,
+    script: str = "",
+    params: VideoParams = None,
+) -> List[SubClippedVideoClip]:
+    """Cut the video materials into the clips (source, start, end, transition) that cover the audio"""
+    audio_clip = AudioFileClip(audio_file)
+    audio_duration = audio_clip.duration
+    close_clip(audio_clip)
 
     # Check if semantic mode is enabled
     if video_concat_mode.value == "semantic" and script:
         logger.info("Using semantic video selection mode")
         
-        # Load video metadata
-        video_metadata = []
-        for video_path in video_paths:
-            metadata = semantic_video.load_video_metadata(video_path)
-            if metadata:
-                video_metadata.append(metadata)
-            else:
-                logger.debug(f"No metadata found for {video_path}, using filename")
-                filename = os.path.splitext(os.path.basename(video_path))[0]
-                metadata = {
-                    'video_path': video_path,
-                    'search_term': filename,
-                    'file_size': os.path.getsize(video_path) if os.path.exists(video_path) else 0,
-                    'created_at': os.path.getctime(video_path) if os.path.exists(video_path) else 0
-                }
-                video_metadata.append(metadata)
+        # Load video metadata from the material catalog in one query
+        video_metadata = semantic_video.get_video_metadata_list(video_paths)
         
         # Use semantic video selection
         selected_videos = semantic_video.select_videos_for_script(
@@ -333,7 +355,7 @@ def combine_videos(
             image_similarity_model=params.image_similarity_model if params else "clip-vit-base-patch32"
         )
         
-        # Process selected videos
+        # Plan selected videos
         processed_clips = []
         video_duration = 0
         max_reuse_limit = params.max_video_reuse if params and hasattr(params, 'max_video_reuse') and params.max_video_reuse is not None else None
@@ -346,80 +368,33 @@ def combine_videos(
             video_path = selection['video_path']
             target_duration = min(selection['duration'], max_clip_duration)
             
-            logger.debug(f"processing semantic clip {i+1}: {os.path.basename(video_path)}, target duration: {target_duration:.2f}s")
+            logger.debug(f"planning semantic clip {i+1}: {os.path.basename(video_path)}, target duration: {target_duration:.2f}s")
             
             try:
-                clip = VideoFileClip(video_path)
-                clip_duration = min(clip.duration, target_duration)
-                
-                # Random start time for variety
-                max_start = max(0, clip.duration - clip_duration)
-                start_time = random.uniform(0, max_start) if max_start > 0 else 0
-                
-                clip = clip.subclipped(start_time, start_time + clip_duration)
-                
-                # Resize clip if needed
-                clip_w, clip_h = clip.size
-                if clip_w != video_width or clip_h != video_height:
-                    clip_ratio = clip.w / clip.h
-                    video_ratio = video_width / video_height
-                    logger.debug(f"resizing clip, source: {clip_w}x{clip_h}, ratio: {clip_ratio:.2f}, target: {video_width}x{video_height}, ratio: {video_ratio:.2f}")
-                    
-                    if clip_ratio == video_ratio:
-                        clip = clip.resized(new_size=(video_width, video_height))
-                    else:
-                        if clip_ratio > video_ratio:
-                            scale_factor = video_width / clip_w
-                        else:
-                            scale_factor = video_height / clip_h
-
-                        new_width = int(clip_w * scale_factor)
-                        new_height = int(clip_h * scale_factor)
-
-                        background = ColorClip(size=(video_width, video_height), color=(0, 0, 0)).with_duration(clip_duration)
-                        clip_resized = clip.resized(new_size=(new_width, new_height)).with_position("center")
-                        clip = CompositeVideoClip([background, clip_resized])
-                
-                # Apply transitions if specified
-                if video_transition_mode and video_transition_mode.value != VideoTransitionMode.none.value:
-                    shuffle_side = random.choice(["left", "right", "top", "bottom"])
-                    if video_transition_mode.value == VideoTransitionMode.fade_in.value:
-                        clip = video_effects.fadein_transition(clip, 1)
-                    elif video_transition_mode.value == VideoTransitionMode.fade_out.value:
-                        clip = video_effects.fadeout_transition(clip, 1)
-                    elif video_transition_mode.value == VideoTransitionMode.slide_in.value:
-                        clip = video_effects.slidein_transition(clip, 1, shuffle_side)
-                    elif video_transition_mode.value == VideoTransitionMode.slide_out.value:
-                        clip = video_effects.slideout_transition(clip, 1, shuffle_side)
-                    elif video_transition_mode.value == VideoTransitionMode.shuffle.value:
-                        transition_funcs = [
-                            lambda c: video_effects.fadein_transition(c, 1),
-                            lambda c: video_effects.fadeout_transition(c, 1),
-                            lambda c: video_effects.slidein_transition(c, 1, shuffle_side),
-                            lambda c: video_effects.slideout_transition(c, 1, shuffle_side),
-                        ]
-                        shuffle_transition = random.choice(transition_funcs)
-                        clip = shuffle_transition(clip)
-                
-                # Write clip to temp file
-                clip_file = f"{output_dir}/temp-semantic-clip-{i+1}.mp4"
-                clip.write_videofile(
-                    clip_file, 
-                    logger=None, 
-                    fps=fps, 
-                    codec=video_codec,
-                    bitrate=video_bitrate,
-                    audio_bitrate=audio_bitrate,
-                    ffmpeg_params=quality_params
-                )
+                info = ffmpeg_renderer.probe_video(video_path)
+                source_duration = info["duration"]
+                clip_w, clip_h = info["width"], info["height"]
+
+                clip_duration = min(source_duration, target_duration)
                 
-                close_clip(clip)
+                # Varied start time, the same on every render of this sentence
+                max_start = max(0, source_duration - clip_duration)
+                start_time = semantic_start_time(video_path, selection.get('segment', ''), max_start)
                 
-                processed_clips.append(SubClippedVideoClip(file_path=clip_file, duration=clip_duration, width=clip_w, height=clip_h))
+                transition, side = _resolve_transition(video_transition_mode)
+                processed_clips.append(SubClippedVideoClip(
+                    file_path=video_path,
+                    start_time=start_time,
+                    end_time=start_time + clip_duration,
+                    width=clip_w,
+                    height=clip_h,
+                    transition=transition,
+                    side=side,
+                ))
                 video_duration += clip_duration
                 
             except Exception as e:
-                logger.error(f"failed to process semantic clip: {str(e)}")
+                logger.error(f"failed to plan semantic clip: {str(e)}")
         
     else:
         # Original random/sequential logic
@@ -427,10 +402,13 @@ def combine_videos(
         subclipped_items = []
         video_duration = 0
         for video_path in video_paths:
-            clip = VideoFileClip(video_path)
-            clip_duration = clip.duration
-            clip_w, clip_h = clip.size
-            close_clip(clip)
+            try:
+                info = ffmpeg_renderer.probe_video(video_path)
+            except Exception as e:
+                logger.error(f"failed to probe video {video_path}: {str(e)}")
+                continue
+            clip_duration = info["duration"]
+            clip_w, clip_h = info["width"], info["height"]
             
             start_time = 0
 
@@ -453,76 +431,11 @@ def combine_videos(
             if video_duration > audio_duration:
                 break
             
-            logger.debug(f"processing clip {i+1}: {subclipped_item.width}x{subclipped_item.height}, current duration: {video_duration:.2f}s, remaining: {audio_duration - video_duration:.2f}s")
+            logger.debug(f"planning clip {i+1}: {subclipped_item.width}x{subclipped_item.height}, current duration: {video_duration:.2f}s, remaining: {audio_duration - video_duration:.2f}s")
             
-            try:
-                clip = VideoFileClip(subclipped_item.file_path).subclipped(subclipped_item.start_time, subclipped_item.end_time)
-                clip_duration = clip.duration
-                # Not all videos are same size, so we need to resize them
-                clip_w, clip_h = clip.size
-                if clip_w != video_width or clip_h != video_height:
-                    clip_ratio = clip.w / clip.h
-                    video_ratio = video_width / video_height
-                    logger.debug(f"resizing clip, source: {clip_w}x{clip_h}, ratio: {clip_ratio:.2f}, target: {video_width}x{video_height}, ratio: {video_ratio:.2f}")
-                    
-                    if clip_ratio == video_ratio:
-                        clip = clip.resized(new_size=(video_width, video_height))
-                    else:
-                        if clip_ratio > video_ratio:
-                            scale_factor = video_width / clip_w
-                        else:
-                            scale_factor = video_height / clip_h
-
-                        new_width = int(clip_w * scale_factor)
-                        new_height = int(clip_h * scale_factor)
-
-                        background = ColorClip(size=(video_width, video_height), color=(0, 0, 0)).with_duration(clip_duration)
-                        clip_resized = clip.resized(new_size=(new_width, new_height)).with_position("center")
-                        clip = CompositeVideoClip([background, clip_resized])
-                        
-                shuffle_side = random.choice(["left", "right", "top", "bottom"])
-                if video_transition_mode and video_transition_mode.value == VideoTransitionMode.none.value:
-                    clip = clip
-                elif video_transition_mode and video_transition_mode.value == VideoTransitionMode.fade_in.value:
-                    clip = video_effects.fadein_transition(clip, 1)
-                elif video_transition_mode and video_transition_mode.value == VideoTransitionMode.fade_out.value:
-                    clip = video_effects.fadeout_transition(clip, 1)
-                elif video_transition_mode and video_transition_mode.value == VideoTransitionMode.slide_in.value:
-                    clip = video_effects.slidein_transition(clip, 1, shuffle_side)
-                elif video_transition_mode and video_transition_mode.value == VideoTransitionMode.slide_out.value:
-                    clip = video_effects.slideout_transition(clip, 1, shuffle_side)
-                elif video_transition_mode and video_transition_mode.value == VideoTransitionMode.shuffle.value:
-                    transition_funcs = [
-                        lambda c: video_effects.fadein_transition(c, 1),
-                        lambda c: video_effects.fadeout_transition(c, 1),
-                        lambda c: video_effects.slidein_transition(c, 1, shuffle_side),
-                        lambda c: video_effects.slideout_transition(c, 1, shuffle_side),
-                    ]
-                    shuffle_transition = random.choice(transition_funcs)
-                    clip = shuffle_transition(clip)
-
-                if clip.duration > max_clip_duration:
-                    clip = clip.subclipped(0, max_clip_duration)
-                    
-                # wirte clip to temp file
-                clip_file = f"{output_dir}/temp-clip-{i+1}.mp4"
-                clip.write_videofile(
-                    clip_file, 
-                    logger=None, 
-                    fps=fps, 
-                    codec=video_codec,
-                    bitrate=video_bitrate,
-                    audio_bitrate=audio_bitrate,
-                    ffmpeg_params=quality_params
-                )
-                
-                close_clip(clip)
-            
-                processed_clips.append(SubClippedVideoClip(file_path=clip_file, duration=clip.duration, width=clip_w, height=clip_h))
-                video_duration += clip.duration
-                
-            except Exception as e:
-                logger.error(f"failed to process clip: {str(e)}")
+            subclipped_item.transition, subclipped_item.side = _resolve_transition(video_transition_mode)
+            processed_clips.append(subclipped_item)
+            video_duration += subclipped_item.duration
     
     # loop processed clips until the video duration matches or exceeds the audio duration.
     if video_duration < audio_duration:
@@ -580,18 +493,157 @@ def combine_videos(
                     processed_clips.append(clip)
                     video_duration += clip.duration
                 logger.info(f"video duration: {video_duration:.2f}s, audio duration: {audio_duration:.2f}s, looped {len(processed_clips)-len(base_clips)} clips")
-     
-    # merge video clips using direct concatenation to avoid quality degradation
-    logger.info("starting clip merging process")
+
+    return processed_clips
+
+
+def render_clips(plan: List[SubClippedVideoClip], combined_video_path: str, video_width: int, video_height: int, threads: int = 2) -> str:
+    """Render a clip plan into the intermediate combined video, with MoviePy if FFmpeg fails"""
+    output_dir = os.path.dirname(combined_video_path)
+    logger.info("starting clip rendering process")
+    if not plan:
+        logger.warning("no clips available for merging")
+        return combined_video_path
+
+    try:
+        with encoder_profiles.timed_encode("combine videos", combined_video_path):
+            ffmpeg_renderer.render_clip_plan(
+                plan,
+                combined_video_path,
+                width=video_width,
+                height=video_height,
+                fps=fps,
+                encoder_args=ffmpeg_encoder_args(),
+                threads=threads,
+                workers=_clip_workers(threads),
+            )
+    except Exception as e:
+        logger.error(f"failed to render clip plan with ffmpeg: {str(e)}")
+        logger.warning("falling back to MoviePy clip rendering")
+        return _combine_with_moviepy(plan, combined_video_path, video_width, video_height, output_dir, threads)
+
+    logger.info("video combining completed")
+    return combined_video_path
+
+
+def ffmpeg_encoder_args(profile=None) -> List[str]:
+    """FFmpeg encoder arguments of an encoder profile, or of the intermediate format"""
+    return encoder_profiles.ffmpeg_args(encoder_profiles.encoder_settings(profile), fps)
+
+
+def semantic_start_time(video_path: str, segment: str, max_start: float) -> float:
+    """Start of a semantic clip, picked pseudo-randomly from the video and the sentence it illustrates
+
+    Re-rendering the same script cuts the same subclips, so they can be reused from the clip cache.
+    """
+    if max_start <= 0:
+        return 0
+    rng = random.Random(f"{os.path.basename(video_path)}|{segment}")
+    return round(rng.uniform(0, max_start), 1)
+
+
+def _clip_workers(threads: int) -> int:
+    """Number of subclips normalized concurrently, `max_clip_workers` from config
+
+    The pool is opt-in: one worker (the default) lets a single filter graph
+    decode the sources and encode every frame once. More workers normalize the
+    clips in parallel as separate segments first, which are encoded again into
+    the video, trading a second encode for wall time.
+    """
+    workers = config.app.get("max_clip_workers", 0) or 1
+    return max(1, min(int(workers), os.cpu_count() or 1))
+
+
+def _resolve_transition(video_transition_mode: VideoTransitionMode):
+    """Pick the concrete transition and slide side for one clip, resolving Shuffle"""
+    if not video_transition_mode or video_transition_mode.value == VideoTransitionMode.none.value:
+        return None, None
+
+    side = random.choice(["left", "right", "top", "bottom"])
+    transition = video_transition_mode.value
+    if transition == VideoTransitionMode.shuffle.value:
+        transition = random.choice([
+            VideoTransitionMode.fade_in.value,
+            VideoTransitionMode.fade_out.value,
+            VideoTransitionMode.slide_in.value,
+            VideoTransitionMode.slide_out.value,
+        ])
+    return transition, side
+
+
+def _render_subclip_moviepy(item: SubClippedVideoClip, clip_file: str, video_width: int, video_height: int):
+    """Cut, resize and apply the planned transition to one subclip with MoviePy"""
+    clip = VideoFileClip(item.file_path).subclipped(item.start_time, item.end_time)
+    clip_duration = clip.duration
+    # Not all videos are same size, so we need to resize them
+    clip_w, clip_h = clip.size
+    if clip_w != video_width or clip_h != video_height:
+        clip_ratio = clip.w / clip.h
+        video_ratio = video_width / video_height
+        logger.debug(f"resizing clip, source: {clip_w}x{clip_h}, ratio: {clip_ratio:.2f}, target: {video_width}x{video_height}, ratio: {video_ratio:.2f}")
+        
+        if clip_ratio == video_ratio:
+            clip = clip.resized(new_size=(video_width, video_height))
+        else:
+            if clip_ratio > video_ratio:
+                scale_factor = video_width / clip_w
+            else:
+                scale_factor = video_height / clip_h
+
+            new_width = int(clip_w * scale_factor)
+            new_height = int(clip_h * scale_factor)
+
+            background = ColorClip(size=(video_width, video_height), color=(0, 0, 0)).with_duration(clip_duration)
+            clip_resized = clip.resized(new_size=(new_width, new_height)).with_position("center")
+            clip = CompositeVideoClip([background, clip_resized])
+
+    if item.transition == VideoTransitionMode.fade_in.value:
+        clip = video_effects.fadein_transition(clip, 1)
+    elif item.transition == VideoTransitionMode.fade_out.value:
+        clip = video_effects.fadeout_transition(clip, 1)
+    elif item.transition == VideoTransitionMode.slide_in.value:
+        clip = video_effects.slidein_transition(clip, 1, item.side)
+    elif item.transition == VideoTransitionMode.slide_out.value:
+        clip = video_effects.slideout_transition(clip, 1, item.side)
+
+    clip.write_videofile(
+        clip_file, 
+        logger=None, 
+        fps=fps, 
+        audio_bitrate=audio_bitrate,
+        **encoder_profiles.encoder_settings(),
+    )
+    close_clip(clip)
+    return SubClippedVideoClip(file_path=clip_file, duration=clip_duration, width=clip_w, height=clip_h)
+
+
+def _combine_with_moviepy(plan, combined_video_path, video_width, video_height, output_dir, threads):
+    """Fallback renderer: encode each planned subclip, then concatenate them with MoviePy"""
+    processed_clips = []
+    rendered = {}
+    for i, item in enumerate(plan):
+        # looped plan items share the same object, render them only once
+        if id(item) not in rendered:
+            try:
+                rendered[id(item)] = _render_subclip_moviepy(
+                    item, f"{output_dir}/temp-clip-{i+1}.mp4", video_width, video_height
+                )
+            except Exception as e:
+                logger.error(f"failed to process clip: {str(e)}")
+                continue
+        processed_clips.append(rendered[id(item)])
+
     if not processed_clips:
         logger.warning("no clips available for merging")
         return combined_video_path
-    
+
+    clip_files = list({clip.file_path for clip in processed_clips})
+
     # if there is only one clip, use it directly
     if len(processed_clips) == 1:
         logger.info("using single clip directly")
         shutil.copy(processed_clips[0].file_path, combined_video_path)
-        delete_files([processed_clips[0].file_path])
+        delete_files(clip_files)
         logger.info("video combining completed")
         return combined_video_path
     
@@ -605,11 +657,9 @@ def combine_videos(
             clip = VideoFileClip(clip_info.file_path)
             clips_to_merge.append(clip)
         
-        # Concatenate all clips in single operation - NO QUALITY LOSS!
         logger.info("concatenating all clips in single operation")
         final_clip = concatenate_videoclips(clips_to_merge)
         
-        # Write final result with high quality settings
         logger.info("writing final concatenated video with high quality")
         final_clip.write_videofile(
             combined_video_path,
@@ -618,10 +668,8 @@ def combine_videos(
             temp_audiofile_path=output_dir,
             audio_codec=audio_codec,
             fps=fps,
-            codec=video_codec,
-            bitrate=video_bitrate,
             audio_bitrate=audio_bitrate,
-            ffmpeg_params=quality_params
+            **encoder_profiles.encoder_settings(),
         )
         
         # Clean up clips
@@ -636,7 +684,6 @@ def combine_videos(
         return _progressive_merge_fallback(processed_clips, combined_video_path, output_dir, threads)
     
     # clean temp files
-    clip_files = [clip.file_path for clip in processed_clips]
     delete_files(clip_files)
             
     logger.info("video combining completed")
@@ -675,10 +722,8 @@ def _progressive_merge_fallback(processed_clips, combined_video_path, output_dir
                 temp_audiofile_path=output_dir,
                 audio_codec=audio_codec,
                 fps=fps,
-                codec=video_codec,
-                bitrate=video_bitrate,
                 audio_bitrate=audio_bitrate,
-                ffmpeg_params=quality_params
+                **encoder_profiles.encoder_settings(),
             )
             close_clip(base_clip)
             close_clip(next_clip)
@@ -703,69 +748,24 @@ def _progressive_merge_fallback(processed_clips, combined_video_path, output_dir
 
 
 def wrap_text(text, max_width, font="Arial", fontsize=60):
-    # Create ImageFont
-    font = ImageFont.truetype(font, fontsize)
-
-    def get_text_size(inner_text):
-        inner_text = inner_text.strip()
-        left, top, right, bottom = font.getbbox(inner_text)
-        return right - left, bottom - top
-
-    width, height = get_text_size(text)
+    width, height = text_metrics.text_size(font, fontsize, text)
     if width <= max_width:
         return text, height
 
-    processed = True
-    _wrapped_lines_ = []
-    words = text.split(" ")
-    _txt_ = ""
-    
-    # Improved word wrapping with better line balancing
-    for word in words:
-        _before = _txt_
-        test_txt = _txt_ + f"{word} " if _txt_ else f"{word} "
-        _width, _height = get_text_size(test_txt)
-        
-        if _width <= max_width:
-            _txt_ = test_txt
-        else:
-            if _txt_.strip() == word.strip():
-                # Single word is too long, force break
-                processed = False
-                break
-            
-            # Add current line and start new line
-            _wrapped_lines_.append(_before.strip())
-            _txt_ = f"{word} "
-    
-    # Add remaining text
-    if _txt_.strip():
-        _wrapped_lines_.append(_txt_.strip())
-    
-    if processed:
+    # Word wrapping, linear in the number of words
+    _wrapped_lines_ = text_metrics.break_words(text.split(), font, fontsize, max_width)
+    if _wrapped_lines_ is not None:
         # Balance line lengths for better visual appearance
-        _wrapped_lines_ = _balance_line_lengths(_wrapped_lines_, font, max_width)
+        _wrapped_lines_ = _balance_line_lengths(
+            _wrapped_lines_, text_metrics.get_font(font, fontsize), max_width
+        )
         result = "\n".join(_wrapped_lines_)
         height = len(_wrapped_lines_) * height
         return result, height
 
-    # Fallback: character-by-character wrapping
-    _wrapped_lines_ = []
-    chars = list(text)
-    _txt_ = ""
-    for char in chars:
-        test_txt = _txt_ + char
-        _width, _height = get_text_size(test_txt)
-        if _width <= max_width:
-            _txt_ = test_txt
-        else:
-            if _txt_:
-                _wrapped_lines_.append(_txt_)
-            _txt_ = char
-    
-    if _txt_:
-        _wrapped_lines_.append(_txt_)
-    
+    # Fallback: character-by-character wrapping, a single word is too long
+    # (or the text has no spaces at all)
+    _wrapped_lines_ = text_metrics.break_chars(text, font, fontsize, max_width)
     result = "\n".join(_wrapped_lines_)
     height = len(_wrapped_lines_) * height
     return result, height
@@ -779,8 +779,7 @@ def _balance_line_lengths(lines, font, max_width):
         return lines
     
     def get_text_width(text):
-        left, top, right, bottom = font.getbbox(text.strip())
-        return right - left
+        return text_metrics.font_text_width(font, text)
     
     balanced_lines = []
     
@@ -790,7 +789,6 @@ def _balance_line_lengths(lines, font, max_width):
             next_line = lines[i + 1]
             
             # Try to balance by moving words between lines
-            words_current = line.split()
             words_next = next_line.split()
             
             # If current line is much shorter than max width and next line has words
@@ -838,94 +836,31 @@ def create_enhanced_subtitle_clips(enhanced_subtitle_path, params, video_width,
         else:  # center
             return clip.with_position(("center", "center"))
     
-    def create_word_highlighted_image(text, highlighted_word_indices, font_size, normal_color, highlight_color, stroke_color, stroke_width):
-        """Create an image with specific words highlighted"""
-        try:
-            font = ImageFont.truetype(font_path, font_size)
-        except:
-            font = ImageFont.load_default()
-        
-        # Clean text: remove commas but keep line breaks they indicate
-        # Replace comma + space with just space, and standalone commas with nothing
-        cleaned_text = text.replace(', ', ' ').replace(',', ' ')
-        
-        # Wrap text using the same logic
-        max_width = int(video_width * 0.9)
-        wrapped_txt, _ = wrap_text(
-            cleaned_text, max_width=max_width, font=font_path, fontsize=font_size
+    max_width = int(video_width * 0.9)
+    font_size = int(params.font_size)
+    normal_rgb = hex_to_rgb(params.text_fore_color)
+    highlight_rgb = hex_to_rgb(params.word_highlight_color)
+    stroke_rgb = hex_to_rgb(params.stroke_color) if params.stroke_color else None
+    stroke_width = int(params.stroke_width)
+
+    def create_word_highlighted_image(wrapped_text, highlighted_word_indices):
+        """Create an image with specific words highlighted, assembled from cached word sprites"""
+        return word_sprites.render_highlighted(
+            wrapped_text,
+            frozenset(highlighted_word_indices),
+            font_path,
+            font_size,
+            max_width,
+            normal_rgb,
+            highlight_rgb,
+            stroke_rgb,
+            stroke_width,
         )
-        
-        # Split into lines and words
-        lines = wrapped_txt.split('\n')
-        
-        # Calculate image dimensions
-        line_height = int(font_size * 1.3)
-        img_height = len(lines) * line_height + 40  # Add padding
-        img_width = max_width + 40  # Add padding
-        
-        # Create transparent image
-        img = Image.new('RGBA', (img_width, img_height), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(img)
-        
-        # Colors
-        normal_rgb = hex_to_rgb(normal_color)
-        highlight_rgb = hex_to_rgb(highlight_color)
-        stroke_rgb = hex_to_rgb(stroke_color) if stroke_color else None
-        
-        word_index = 0
-        y_pos = 20
-        
-        for line in lines:
-            words = line.split()
-            
-            # Calculate total line width for center alignment
-            line_width = 0
-            for word in words:
-                word_bbox = font.getbbox(word + ' ')
-                line_width += word_bbox[2] - word_bbox[0]
-            
-            # Center the line
-            x_pos = (img_width - line_width) // 2
-            x_pos = max(20, x_pos)  # Ensure minimum padding
-            
-            for word in words:
-                # Determine color for this word
-                word_color = highlight_rgb if word_index in highlighted_word_indices else normal_rgb
-                
-                # Draw word with stroke if specified
-                if stroke_rgb and stroke_width > 0:
-                    # Draw stroke by drawing text multiple times with offset
-                    stroke_w = int(stroke_width)
-                    for dx in range(-stroke_w, stroke_w + 1):
-                        for dy in range(-stroke_w, stroke_w + 1):
-                            if dx != 0 or dy != 0:
-                                draw.text((x_pos + dx, y_pos + dy), word, font=font, fill=stroke_rgb)
-                
-                # Draw main text
-                draw.text((x_pos, y_pos), word, font=font, fill=word_color)
-                
-                # Calculate next position
-                word_bbox = font.getbbox(word + ' ')
-                x_pos += word_bbox[2] - word_bbox[0]
-                word_index += 1
-            
-            y_pos += line_height
-        
-        return img
     
-    def create_subtitle_clip(text, highlighted_word_indices, start_time, duration, params):
+    def create_subtitle_clip(wrapped_text, highlighted_word_indices, start_time, duration, params):
         """Create a subtitle clip with specified highlighting"""
         try:
-            img = create_word_highlighted_image(
-                text=text,
-                highlighted_word_indices=highlighted_word_indices,
-                font_size=int(params.font_size),
-                normal_color=params.text_fore_color,
-                highlight_color=params.word_highlight_color,
-                stroke_color=params.stroke_color,
-                stroke_width=int(params.stroke_width)
-            )
-            
+            img = create_word_highlighted_image(wrapped_text, highlighted_word_indices)
             clip = ImageClip(np.array(img)).with_duration(duration).with_start(start_time)
             return position_clip(clip, params, video_height)
             
@@ -941,6 +876,13 @@ def create_enhanced_subtitle_clips(enhanced_subtitle_path, params, video_width,
         
         # Sort words by start time
         sorted_words = sorted(words, key=lambda w: w['start'])
+
+        # Clean text: remove commas but keep line breaks they indicate,
+        # then wrap it once for all the highlight states of this cue
+        cleaned_text = text.replace(', ', ' ').replace(',', ' ')
+        wrapped_text, _ = wrap_text(
+            cleaned_text, max_width=max_width, font=font_path, fontsize=font_size
+        )
         
         # Create word mapping to indices
         text_words = []
@@ -967,13 +909,13 @@ def create_enhanced_subtitle_clips(enhanced_subtitle_path, params, video_width,
             
             # Create segment before word (normal colors)
             if word_start > current_time:
-                clip = create_subtitle_clip(text, set(), current_time, word_start - current_time, params)
+                clip = create_subtitle_clip(wrapped_text, set(), current_time, word_start - current_time, params)
                 if clip:
                     text_clips.append(clip)
             
             # Create highlighted segment during word
             if word_index >= 0:
-                clip = create_subtitle_clip(text, {word_index}, word_start, word_end - word_start, params)
+                clip = create_subtitle_clip(wrapped_text, {word_index}, word_start, word_end - word_start, params)
                 if clip:
                     text_clips.append(clip)
             
@@ -981,7 +923,7 @@ def create_enhanced_subtitle_clips(enhanced_subtitle_path, params, video_width,
         
         # Create final normal segment if needed
         if current_time < end_time:
-            clip = create_subtitle_clip(text, set(), current_time, end_time - current_time, params)
+            clip = create_subtitle_clip(wrapped_text, set(), current_time, end_time - current_time, params)
             if clip:
                 text_clips.append(clip)
     
@@ -994,7 +936,14 @@ def generate_video(
     subtitle_path: str,
     output_file: str,
     params: VideoParams,
+    clip_plan: List[SubClippedVideoClip] = None,
 ):
+    """Burn the subtitles into the video and add the voice and background music
+
+    With a `clip_plan` the clips are decoded straight from their sources, so
+    every frame is encoded once. `video_path` is then only written as an
+    intermediate combined video if rendering from the plan fails.
+    """
     aspect = VideoAspect(params.video_aspect)
     video_width, video_height = aspect.to_resolution()
 
@@ -1069,7 +1018,6 @@ def generate_video(
             _clip = _clip.with_position(("center", "center"))
         return _clip
 
-    video_clip = VideoFileClip(video_path).without_audio()
     audio_clip = AudioFileClip(audio_path).with_effects(
         [afx.MultiplyVolume(params.voice_volume)]
     )
@@ -1081,6 +1029,8 @@ def generate_video(
             font_size=params.font_size,
         )
 
+    ass_file = ""
+    make_text_clips = None
     if subtitle_path and os.path.exists(subtitle_path):
         # Check if word highlighting is enabled and enhanced subtitles are available
         enhanced_subtitle_path = getattr(params, '_enhanced_subtitle_path', None)
@@ -1089,23 +1039,39 @@ def generate_video(
             enhanced_subtitle_path and
             os.path.exists(enhanced_subtitle_path)
         )
+        use_ass = config.app.get("subtitle_renderer", "sprite") == "ass"
+        ass_path = os.path.join(output_dir, "subtitle.ass")
         
-        if use_word_highlighting:
-            logger.info("Using enhanced subtitles with word highlighting")
-            text_clips = create_enhanced_subtitle_clips(
-                enhanced_subtitle_path, params, video_width, video_height, font_path
-            )
-        else:
-            # Traditional subtitle rendering
-            sub = SubtitlesClip(
-                subtitles=subtitle_path, encoding="utf-8", make_textclip=make_textclip
-            )
-            text_clips = []
-            for item in sub.subtitles:
-                clip = create_text_clip(subtitle_item=item)
-                text_clips.append(clip)
-        
-        video_clip = CompositeVideoClip([video_clip, *text_clips])
+        try:
+            if use_word_highlighting:
+                logger.info("Using enhanced subtitles with word highlighting")
+                make_text_clips = lambda: create_enhanced_subtitle_clips(
+                    enhanced_subtitle_path, params, video_width, video_height, font_path
+                )
+                if use_ass:
+                    ass_file = ass_subtitles.write_karaoke_ass(
+                        enhanced_subtitle_path, ass_path, params, font_path, video_width, video_height
+                    )
+            else:
+                # Traditional subtitle rendering
+                sub = SubtitlesClip(
+                    subtitles=subtitle_path, encoding="utf-8", make_textclip=make_textclip
+                )
+                make_text_clips = lambda: [create_text_clip(subtitle_item=item) for item in sub.subtitles]
+                if use_ass:
+                    ass_file = ass_subtitles.write_ass(
+                        sub.subtitles, ass_path, params, font_path, video_width, video_height
+                    )
+        except Exception as e:
+            logger.error(f"failed to write ASS subtitles, falling back to rasterized subtitles: {str(e)}")
+            ass_file = ""
+
+    if clip_plan:
+        video_clip = None
+        video_duration = sum(item.duration for item in clip_plan)
+    else:
+        video_clip = VideoFileClip(video_path).without_audio()
+        video_duration = video_clip.duration
 
     bgm_file = get_bgm_file(bgm_type=params.bgm_type, bgm_file=params.bgm_file)
     if bgm_file:
@@ -1114,30 +1080,143 @@ def generate_video(
                 [
                     afx.MultiplyVolume(params.bgm_volume),
                     afx.AudioFadeOut(3),
-                    afx.AudioLoop(duration=video_clip.duration),
+                    afx.AudioLoop(duration=video_duration),
                 ]
             )
             audio_clip = CompositeAudioClip([audio_clip, bgm_clip])
         except Exception as e:
             logger.error(f"failed to add bgm: {str(e)}")
 
-    video_clip = video_clip.with_audio(audio_clip)
-    video_clip.write_videofile(
-        output_file,
-        audio_codec=audio_codec,
-        temp_audiofile_path=output_dir,
-        threads=params.n_threads or 2,
-        logger=None,
-        fps=fps,
-        codec=video_codec,
-        bitrate=video_bitrate,
-        audio_bitrate=audio_bitrate,
-        ffmpeg_params=quality_params
-    )
+    if clip_plan:
+        try:
+            _render_clip_plan_video(clip_plan, audio_clip, ass_file, make_text_clips, output_file, params, video_duration)
+            return
+        except Exception as e:
+            logger.error(f"failed to render the final video from the clip plan: {str(e)}")
+            logger.warning("falling back to an intermediate combined video")
+            render_clips(clip_plan, video_path, video_width, video_height, params.n_threads or 2)
+            video_clip = VideoFileClip(video_path).without_audio()
+
+    if ass_file:
+        try:
+            _burn_ass_subtitles(video_clip, audio_clip, ass_file, output_file, params)
+            video_clip.close()
+            del video_clip
+            return
+        except Exception as e:
+            logger.error(f"failed to burn ASS subtitles, falling back to rasterized subtitles: {str(e)}")
+
+    if make_text_clips:
+        video_clip = subtitle_overlay.overlay_clips(video_clip, make_text_clips())
+
+    _write_final_video(video_clip.with_audio(audio_clip), output_file, params)
     video_clip.close()
     del video_clip
 
 
+def _render_clip_plan_video(plan, audio_clip, ass_file, make_text_clips, output_file, params: VideoParams, duration: float):
+    """Render the final video straight from the clip plan, encoding every frame once with the task's profile
+
+    FFmpeg renders the clips together with the ASS subtitles, rasterized
+    subtitles are blended by MoviePy into the frames of the plan instead.
+    """
+    video_width, video_height = VideoAspect(params.video_aspect).to_resolution()
+    threads = params.n_threads or 2
+    if ass_file or not make_text_clips:
+        _render_with_ffmpeg(
+            audio_clip,
+            output_file,
+            params,
+            ", libass" if ass_file else "",
+            lambda audio_file: ffmpeg_renderer.render_video(
+                plan,
+                audio_file,
+                output_file,
+                width=video_width,
+                height=video_height,
+                fps=fps,
+                encoder_args=ffmpeg_encoder_args(params.encoder_profile),
+                subtitle_file=ass_file,
+                fonts_dir=utils.font_dir(),
+                duration=duration,
+                threads=threads,
+                segment_encoder_args=ffmpeg_encoder_args(),
+                workers=_clip_workers(threads),
+            ),
+        )
+        return
+
+    reader = ffmpeg_renderer.ClipPlanReader(
+        plan,
+        video_width,
+        video_height,
+        fps,
+        threads,
+        work_dir=os.path.dirname(output_file),
+        segment_encoder_args=ffmpeg_encoder_args(),
+        workers=_clip_workers(threads),
+    )
+    try:
+        video_clip = VideoClip(frame_function=reader.get_frame, duration=duration)
+        video_clip = subtitle_overlay.overlay_clips(video_clip, make_text_clips())
+        _write_final_video(video_clip.with_audio(audio_clip), output_file, params)
+    finally:
+        reader.close()
+
+
+def _write_final_video(video_clip, output_file, params: VideoParams):
+    output_dir = os.path.dirname(output_file)
+    with encoder_profiles.timed_encode(f"final video ({encoder_profiles.profile_name(params.encoder_profile)} profile)", output_file):
+        video_clip.write_videofile(
+            output_file,
+            audio_codec=audio_codec,
+            temp_audiofile_path=output_dir,
+            threads=params.n_threads or 2,
+            logger=None,
+            fps=fps,
+            audio_bitrate=audio_bitrate,
+            **encoder_profiles.encoder_settings(params.encoder_profile),
+        )
+
+
+def _render_with_ffmpeg(audio_clip, output_file, params: VideoParams, stage: str, render):
+    """Mix the audio with MoviePy, then let `render(audio_file)` encode the final video with FFmpeg"""
+    output_dir = os.path.dirname(output_file)
+    temp_audio = os.path.join(output_dir, "temp-final-audio.m4a")
+    audio_clip.write_audiofile(
+        temp_audio,
+        fps=44100,
+        codec=audio_codec,
+        bitrate=audio_bitrate,
+        logger=None,
+    )
+    try:
+        with encoder_profiles.timed_encode(f"final video ({encoder_profiles.profile_name(params.encoder_profile)} profile{stage})", output_file):
+            render(temp_audio)
+    finally:
+        delete_files(temp_audio)
+
+
+def _burn_ass_subtitles(video_clip, audio_clip, ass_file, output_file, params: VideoParams):
+    """Mix the audio with MoviePy, then let FFmpeg render the ASS subtitles while encoding the video"""
+    _render_with_ffmpeg(
+        audio_clip,
+        output_file,
+        params,
+        ", libass",
+        lambda audio_file: ffmpeg_renderer.burn_subtitles(
+            video_clip.filename,
+            audio_file,
+            ass_file,
+            output_file,
+            ffmpeg_encoder_args(params.encoder_profile),
+            fonts_dir=utils.font_dir(),
+            duration=video_clip.duration,
+            threads=params.n_threads or 2,
+        ),
+    )
+
+
 def preprocess_video(materials: List[MaterialInfo], clip_duration=4):
     for material in materials:
         if not material.url:
@@ -1182,10 +1261,8 @@ def preprocess_video(materials: List[MaterialInfo], clip_duration=4):
                 video_file, 
                 fps=30, 
                 logger=None,
-                codec=video_codec,
-                bitrate=video_bitrate,
                 audio_bitrate=audio_bitrate,
-                ffmpeg_params=quality_params
+                **encoder_profiles.encoder_settings(EncoderProfile.standard),
             )
             close_clip(clip)
             material.url = video_file
@@ -1,8 +1,9 @@
 import asyncio
 import os
 import re
+import struct
 from datetime import datetime
-from typing import Union
+from typing import Iterator, Union
 from xml.sax.saxutils import unescape
 
 # Suppress warnings and handle CUDA library conflicts
@@ -28,6 +29,7 @@ from loguru import logger
 from moviepy.video.tools import subtitles
 
 from app.config import config
+from app.services.utils import conditionals_cache, model_registry
 from app.utils import utils
 
 # Import Chatterbox TTS and WhisperX if available
@@ -42,9 +44,7 @@ except ImportError as e:
     CHATTERBOX_AVAILABLE = False
     logger.warning(f"Chatterbox TTS or WhisperX not available: {e}")
 
-# Global Chatterbox model instance
-chatterbox_model = None
-whisperx_model = None
+# Chatterbox and WhisperX models live in the model registry
 
 # Import Qwen TTS if available
 try:
@@ -57,8 +57,7 @@ except ImportError as e:
     QWEN_TTS_AVAILABLE = False
     logger.warning(f"Qwen TTS not available: {e}")
 
-# Global Qwen model instance
-qwen_tts_model = None
+# Qwen models live in the model registry
 
 
 def ensure_submaker_compatibility(sub_maker):
@@ -1228,6 +1227,20 @@ def tts(
     return azure_tts_v1(text, voice_name, voice_rate, voice_file)
 
 
+def _load_qwen_tts_model(model_name: str):
+    logger.info("Loading Qwen TTS model (first run may download weights)...")
+    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
+
+    model = Qwen3TTSModel.from_pretrained(
+        model_name,
+        device_map=device,
+        dtype=dtype,
+    )
+    logger.info(f"Qwen TTS model loaded: {model_name} on {device}")
+    return model
+
+
 def qwen_tts(
     text: str,
     voice_name: str,
@@ -1267,64 +1280,51 @@ def qwen_tts(
     voice_info = parts[2]  # "name-Gender" e.g. "Default Voice-Neutral"
     voice_base_name = voice_info.split("-")[0]
 
-    global qwen_tts_model
+    if voice_type == "clone":
+        model_name = "Qwen/Qwen3-TTS-12Hz-1.7B-Base"
+    else:
+        model_name = "Qwen/Qwen3-TTS-12Hz-1.7B-CustomVoice"
 
     for i in range(3):
         try:
             logger.info(f"start qwen tts, voice: {voice_name}, try: {i + 1}")
 
-            # Load model if not already loaded
-            if qwen_tts_model is None:
-                logger.info("Loading Qwen TTS model (first run may download weights)...")
-                device = "cuda:0" if torch.cuda.is_available() else "cpu"
-                dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
-
+            # Load model if not already loaded, and keep it resident while it generates
+            with model_registry.using(f"qwen-tts:{model_name}", lambda: _load_qwen_tts_model(model_name)) as qwen_tts_model:
+                # Generate speech
                 if voice_type == "clone":
-                    model_name = "Qwen/Qwen3-TTS-12Hz-1.7B-Base"
+                    # Voice clone mode - look for reference audio
+                    reference_audio_dir = os.path.join(utils.root_dir(), "reference_audio")
+                    ref_audio_path = None
+
+                    # Search for matching reference audio file
+                    if os.path.exists(reference_audio_dir):
+                        for ext in ['.wav', '.mp3', '.flac', '.m4a']:
+                            candidate = os.path.join(reference_audio_dir, voice_base_name + ext)
+                            if os.path.exists(candidate):
+                                ref_audio_path = candidate
+                                break
+
+                    if not ref_audio_path:
+                        logger.error(f"Reference audio file not found for voice clone: {voice_base_name}")
+                        return None
+
+                    logger.info(f"Using reference audio: {ref_audio_path}")
+                    wavs, sr = qwen_tts_model.generate_voice_clone(
+                        text=text,
+                        language="Auto",
+                        ref_audio=ref_audio_path,
+                        ref_text="",
+                        x_vector_only_mode=True,
+                    )
                 else:
-                    model_name = "Qwen/Qwen3-TTS-12Hz-1.7B-CustomVoice"
-
-                qwen_tts_model = Qwen3TTSModel.from_pretrained(
-                    model_name,
-                    device_map=device,
-                    dtype=dtype,
-                )
-                logger.info(f"Qwen TTS model loaded: {model_name} on {device}")
-
-            # Generate speech
-            if voice_type == "clone":
-                # Voice clone mode - look for reference audio
-                reference_audio_dir = os.path.join(utils.root_dir(), "reference_audio")
-                ref_audio_path = None
-
-                # Search for matching reference audio file
-                if os.path.exists(reference_audio_dir):
-                    for ext in ['.wav', '.mp3', '.flac', '.m4a']:
-                        candidate = os.path.join(reference_audio_dir, voice_base_name + ext)
-                        if os.path.exists(candidate):
-                            ref_audio_path = candidate
-                            break
-
-                if not ref_audio_path:
-                    logger.error(f"Reference audio file not found for voice clone: {voice_base_name}")
-                    return None
-
-                logger.info(f"Using reference audio: {ref_audio_path}")
-                wavs, sr = qwen_tts_model.generate_voice_clone(
-                    text=text,
-                    language="Auto",
-                    ref_audio=ref_audio_path,
-                    ref_text="",
-                    x_vector_only_mode=True,
-                )
-            else:
-                # Default/custom voice mode
-                speaker = "Vivian"  # Default speaker
-                wavs, sr = qwen_tts_model.generate_custom_voice(
-                    text=text,
-                    language="Auto",
-                    speaker=speaker,
-                )
+                    # Default/custom voice mode
+                    speaker = "Vivian"  # Default speaker
+                    wavs, sr = qwen_tts_model.generate_custom_voice(
+                        text=text,
+                        language="Auto",
+                        speaker=speaker,
+                    )
 
             if wavs is None or len(wavs) == 0:
                 logger.warning(f"Qwen TTS returned empty audio, try: {i + 1}")
@@ -1712,12 +1712,126 @@ def chunk_text_for_chatterbox(text: str, max_chunk_size: int = 300) -> list:
     return chunks
 
 
+def _load_chatterbox_model(device: str):
+    logger.info("Loading Chatterbox TTS model...")
+    try:
+        model = ChatterboxTTS.from_pretrained(device=device)
+        logger.info("Chatterbox TTS model loaded successfully")
+        return model
+    except Exception as e:
+        logger.error(f"Failed to load Chatterbox TTS model: {e}")
+        if device != "cuda":
+            raise
+        logger.info("Falling back to CPU mode...")
+        model = ChatterboxTTS.from_pretrained(device="cpu")
+        logger.info("Chatterbox TTS model loaded successfully on CPU")
+        return model
+
+
+def _load_whisperx_model(device: str):
+    logger.info("Loading WhisperX model...")
+    # Use appropriate compute type for CPU
+    compute_type = "int8" if device == "cpu" else "float16"
+    try:
+        model = whisperx.load_model("base", device, compute_type=compute_type)
+        logger.info(f"WhisperX model loaded successfully on {device} with {compute_type}")
+        return model
+    except Exception as e:
+        logger.error(f"Failed to load WhisperX model on {device}: {e}")
+        if device != "cuda":
+            raise
+        logger.info("Falling back to CPU for WhisperX...")
+        model = whisperx.load_model("base", "cpu", compute_type="int8")
+        logger.info("WhisperX model loaded successfully on CPU with int8")
+        return model
+
+
+def chatterbox_device() -> str:
+    # Set CHATTERBOX_DEVICE=cuda environment variable to force GPU usage
+    force_device = os.environ.get("CHATTERBOX_DEVICE", "cpu").lower()
+    return "cuda" if force_device == "cuda" and torch.cuda.is_available() else "cpu"
+
+
+# names of the Chatterbox and WhisperX models in the model registry
+chatterbox_registry_name = "chatterbox"
+whisperx_registry_name = "whisperx:base"
+
+
+def load_chatterbox_model(device: str = ""):
+    """The Chatterbox TTS model, shared through the model registry"""
+    return model_registry.get_model(chatterbox_registry_name, lambda: _load_chatterbox_model(device or chatterbox_device()))
+
+
+def load_whisperx_model(device: str = ""):
+    """The WhisperX model used for word timestamps, shared through the model registry"""
+    return model_registry.get_model(whisperx_registry_name, lambda: _load_whisperx_model(device or chatterbox_device()))
+
+
+
+def _chatterbox_cfg_weight() -> float:
+    # 生成语音 (with improved pacing control)
+    # Lower cfg_weight for slower, more natural pacing
+    # Environment variable CHATTERBOX_CFG_WEIGHT can override (default 0.2 for very slow speech)
+    cfg_weight = float(os.environ.get("CHATTERBOX_CFG_WEIGHT", "0.2"))
+    logger.info(f"Using cfg_weight={cfg_weight} for speech pacing control")
+    return cfg_weight
+
+
+def _chatterbox_conditionals(chatterbox_model, voice_name: str):
+    """Speaker conditionals of a cloned voice, None for the default voice"""
+    parts = voice_name.split(":")
+    voice_type = parts[1]  # "default" or "clone"
+    voice_base_name = parts[2].split("-")[0]
+    if voice_type != "clone" or voice_base_name == "Voice Clone":
+        return None
+
+    # 查找参考音频文件
+    audio_prompt_path = None
+    reference_audio_dir = os.path.join(utils.root_dir(), "reference_audio")
+    for ext in ['.wav', '.mp3', '.flac', '.m4a']:
+        potential_path = os.path.join(reference_audio_dir, voice_base_name + ext)
+        if os.path.exists(potential_path):
+            audio_prompt_path = potential_path
+            break
+
+    if not audio_prompt_path:
+        logger.warning(f"Reference audio not found for {voice_base_name}, using default voice")
+        return None
+
+    logger.info(f"Using voice cloning with reference: {audio_prompt_path}")
+    # the reference voice is embedded once and reused by every chunk and task
+    return conditionals_cache.get_conditionals(chatterbox_model, audio_prompt_path)
+
+
+def _chatterbox_generate_batches(chunks: list, voice_name: str, batch_size: int) -> Union[list, None]:
+    """
+    Generate the speech of text chunks, batch_size chunks at a time in one batched Chatterbox pass
+
+    Returns one waveform per chunk, in order, or None if batched generation failed.
+    """
+    try:
+        with model_registry.pinned(chatterbox_registry_name):
+            chatterbox_model = load_chatterbox_model()
+            conds = _chatterbox_conditionals(chatterbox_model, voice_name)
+            cfg_weight = _chatterbox_cfg_weight()
+            texts = [preprocess_text_for_chatterbox(chunk) for chunk in chunks]
+            wavs = []
+            for start in range(0, len(texts), batch_size):
+                batch = texts[start:start + batch_size]
+                logger.info(f"Generating chunks {start + 1}-{start + len(batch)}/{len(texts)} in one batch")
+                wavs.extend(chatterbox_model.generate_batch(batch, conds=conds, cfg_weight=cfg_weight))
+            return wavs
+    except Exception as e:
+        logger.warning(f"Batched Chatterbox TTS failed, generating chunks one by one: {e}")
+        return None
+
 def chatterbox_tts(
     text: str,
     voice_name: str,
     voice_rate: float,
     voice_file: str,
     voice_volume: float = 1.0,
+    wav=None,
 ) -> Union[SubMaker, None]:
     """
     使用Chatterbox TTS + WhisperX生成语音和精确的单词时间戳
@@ -1728,10 +1842,24 @@ def chatterbox_tts(
         voice_rate: 语音速度（暂不支持调整）
         voice_file: 输出的音频文件路径
         voice_volume: 语音音量（暂不支持调整）
+        wav: 已生成的语音（如分块批量生成），为空时使用Chatterbox TTS生成
 
     Returns:
         SubMaker对象或None
     """
+    # keep the TTS and alignment models resident while they are in use
+    with model_registry.pinned(chatterbox_registry_name), model_registry.pinned(whisperx_registry_name):
+        return _chatterbox_tts(text, voice_name, voice_rate, voice_file, voice_volume, wav)
+
+
+def _chatterbox_tts(
+    text: str,
+    voice_name: str,
+    voice_rate: float,
+    voice_file: str,
+    voice_volume: float = 1.0,
+    wav=None,
+) -> Union[SubMaker, None]:
     if not CHATTERBOX_AVAILABLE:
         logger.error("Chatterbox TTS is not available. Please install chatterbox-tts and whisperx.")
         return None
@@ -1762,66 +1890,28 @@ def chatterbox_tts(
         return None
 
     voice_type = parts[1]  # "default" or "clone"
-    voice_info = parts[2]  # "name-Gender"
-    voice_base_name = voice_info.split("-")[0]
 
     # 获取设备 - Use CPU by default to avoid cuDNN version conflicts
-    # Set CHATTERBOX_DEVICE=cuda environment variable to force GPU usage
-    force_device = os.environ.get("CHATTERBOX_DEVICE", "cpu").lower()
-    if force_device == "cuda" and torch.cuda.is_available():
-        device = "cuda"
+    device = chatterbox_device()
+    if device == "cuda":
         logger.info(f"Using GPU device: {device} (forced via CHATTERBOX_DEVICE)")
     else:
-        device = "cpu"
         logger.info(f"Using CPU device (safe mode - set CHATTERBOX_DEVICE=cuda to use GPU)")
 
-    global chatterbox_model, whisperx_model
-
     try:
         # 1. 加载Chatterbox TTS模型
-        if chatterbox_model is None:
-            logger.info("Loading Chatterbox TTS model...")
-            try:
-                chatterbox_model = ChatterboxTTS.from_pretrained(device=device)
-                logger.info("Chatterbox TTS model loaded successfully")
-            except Exception as e:
-                logger.error(f"Failed to load Chatterbox TTS model: {e}")
-                if device == "cuda":
-                    logger.info("Falling back to CPU mode...")
-                    device = "cpu"
-                    chatterbox_model = ChatterboxTTS.from_pretrained(device=device)
-                    logger.info("Chatterbox TTS model loaded successfully on CPU")
-                else:
-                    raise
+        chatterbox_model = load_chatterbox_model(device)
+        device = str(getattr(chatterbox_model, "device", device))
 
         # 2. 生成语音
-        logger.info(f"Generating speech with Chatterbox TTS, type: {voice_type}")
-        
-        audio_prompt_path = None
-        if voice_type == "clone" and voice_base_name != "Voice Clone":
-            # 查找参考音频文件
-            reference_audio_dir = os.path.join(utils.root_dir(), "reference_audio")
-            for ext in ['.wav', '.mp3', '.flac', '.m4a']:
-                potential_path = os.path.join(reference_audio_dir, voice_base_name + ext)
-                if os.path.exists(potential_path):
-                    audio_prompt_path = potential_path
-                    break
-            
-            if audio_prompt_path:
-                logger.info(f"Using voice cloning with reference: {audio_prompt_path}")
+        if wav is None:
+            logger.info(f"Generating speech with Chatterbox TTS, type: {voice_type}")
+            conds = _chatterbox_conditionals(chatterbox_model, voice_name)
+            cfg_weight = _chatterbox_cfg_weight()
+            if conds is not None:
+                wav = chatterbox_model.generate(text, conds=conds, cfg_weight=cfg_weight)
             else:
-                logger.warning(f"Reference audio not found for {voice_base_name}, using default voice")
-
-        # 生成语音 (with improved pacing control)
-        # Lower cfg_weight for slower, more natural pacing
-        # Environment variable CHATTERBOX_CFG_WEIGHT can override (default 0.2 for very slow speech)
-        cfg_weight = float(os.environ.get("CHATTERBOX_CFG_WEIGHT", "0.2"))
-        logger.info(f"Using cfg_weight={cfg_weight} for speech pacing control")
-        
-        if audio_prompt_path:
-            wav = chatterbox_model.generate(text, audio_prompt_path=audio_prompt_path, cfg_weight=cfg_weight)
-        else:
-            wav = chatterbox_model.generate(text, cfg_weight=cfg_weight)
+                wav = chatterbox_model.generate(text, cfg_weight=cfg_weight)
 
         # 保存为临时WAV文件
         temp_wav_file = voice_file.replace('.mp3', '_temp.wav')
@@ -1830,23 +1920,7 @@ def chatterbox_tts(
         # 3. 使用WhisperX获取精确的单词时间戳
         logger.info("Generating word timestamps with WhisperX")
         
-        if whisperx_model is None:
-            logger.info("Loading WhisperX model...")
-            # Use appropriate compute type for CPU
-            compute_type = "int8" if device == "cpu" else "float16"
-            try:
-                whisperx_model = whisperx.load_model("base", device, compute_type=compute_type)
-                logger.info(f"WhisperX model loaded successfully on {device} with {compute_type}")
-            except Exception as e:
-                logger.error(f"Failed to load WhisperX model on {device}: {e}")
-                if device == "cuda":
-                    logger.info("Falling back to CPU for WhisperX...")
-                    device = "cpu"
-                    compute_type = "int8"
-                    whisperx_model = whisperx.load_model("base", device, compute_type=compute_type)
-                    logger.info(f"WhisperX model loaded successfully on CPU with {compute_type}")
-                else:
-                    raise
+        whisperx_model = load_whisperx_model(device)
 
         # 转录音频获取单词时间戳
         audio = whisperx.load_audio(temp_wav_file)
@@ -2034,6 +2108,12 @@ def chatterbox_tts_chunked(
         # If only one chunk, use regular processing
         return chatterbox_tts(chunks[0], voice_name, voice_rate, voice_file, voice_volume)
     
+    # Chunks are generated CHATTERBOX_BATCH_SIZE at a time in one batched pass, 1 disables batching
+    batch_size = max(1, int(os.environ.get("CHATTERBOX_BATCH_SIZE", "4")))
+    chunk_wavs = _chatterbox_generate_batches(chunks, voice_name, batch_size) if batch_size > 1 else None
+    if chunk_wavs is None:
+        chunk_wavs = [None] * len(chunks)
+
     # Generate audio for each chunk
     temp_audio_files = []
     all_sub_makers = []
@@ -2047,7 +2127,7 @@ def chatterbox_tts_chunked(
             chunk_file = voice_file.replace('.mp3', f'_chunk_{i}.mp3')
             
             # Generate TTS for this chunk
-            chunk_result = chatterbox_tts(chunk, voice_name, voice_rate, chunk_file, voice_volume)
+            chunk_result = chatterbox_tts(chunk, voice_name, voice_rate, chunk_file, voice_volume, wav=chunk_wavs[i])
             
             if chunk_result:
                 chunk_audio_file = getattr(chunk_result, '_actual_audio_file', chunk_file)
@@ -2121,6 +2201,42 @@ def chatterbox_tts_chunked(
                     logger.warning(f"Could not remove temporary file {temp_file}: {e}")
 
 
+
+def wav_stream_header(sample_rate: int, channels: int = 1, bits_per_sample: int = 16) -> bytes:
+    """Header of a PCM WAV stream whose length is not known yet, the sizes are set to the maximum"""
+    byte_rate = sample_rate * channels * bits_per_sample // 8
+    block_align = channels * bits_per_sample // 8
+    return (
+        b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, block_align, bits_per_sample)
+        + b"data" + struct.pack("<I", 0xFFFFFFFF)
+    )
+
+
+def chatterbox_tts_stream(text: str, voice_name: str) -> Iterator[bytes]:
+    """
+    Speech of text with a Chatterbox voice as a 24 kHz 16-bit mono WAV byte stream
+
+    Audio is yielded chunk by chunk while it is being synthesized, so playback can start after the first
+    second of speech is generated. Long texts are split like chatterbox_tts_chunked and spoken one after another.
+    No subtitles are generated.
+    """
+    text = preprocess_text_for_chatterbox(text.strip())
+    chunk_threshold = int(os.environ.get("CHATTERBOX_CHUNK_THRESHOLD", "600"))
+    chunks = chunk_text_for_chatterbox(text, max_chunk_size=300) if len(text) > chunk_threshold else [text]
+
+    # the model stays resident until the stream ends or the client goes away
+    with model_registry.pinned(chatterbox_registry_name):
+        chatterbox_model = load_chatterbox_model()
+        conds = _chatterbox_conditionals(chatterbox_model, voice_name)
+        cfg_weight = _chatterbox_cfg_weight()
+
+        yield wav_stream_header(chatterbox_model.sr)
+        for i, chunk in enumerate(chunks):
+            logger.info(f"Streaming chunk {i + 1}/{len(chunks)} ({len(chunk)} chars)")
+            for wav in chatterbox_model.generate_stream(chunk, conds=conds, cfg_weight=cfg_weight):
+                yield (wav.clamp(-1, 1) * 32767).to(torch.int16).numpy().tobytes()
+
 def combine_audio_files(audio_files: list, output_file: str) -> str:
     """
     Combine multiple audio files into a single file
@@ -18,7 +18,7 @@ import numpy as np
 import torch
 import torchaudio as ta
 from functools import lru_cache
-from typing import Optional
+from typing import Callable, List, Optional
 
 from ..s3tokenizer import S3_SR, SPEECH_VOCAB_SIZE, S3Tokenizer
 from .const import S3GEN_SR
@@ -313,7 +313,10 @@ class S3Token2Wav(S3Token2Mel):
         n_cfm_timesteps = n_cfm_timesteps or (2 if self.meanflow else 10)
         noise = None
         if self.meanflow:
-            noise = torch.randn(1, 80, speech_tokens.size(-1) * 2, dtype=self.dtype, device=self.device)
+            noise = torch.randn(
+                torch.atleast_2d(speech_tokens).size(0), 80, speech_tokens.size(-1) * 2,
+                dtype=self.dtype, device=self.device,
+            )
         output_mels = super().forward(
             speech_tokens, speech_token_lens=speech_token_lens, ref_wav=ref_wav, ref_sr=ref_sr, ref_dict=ref_dict,
             n_cfm_timesteps=n_cfm_timesteps, finalize=finalize, noised_mels=noise,
@@ -360,3 +363,136 @@ class S3Token2Wav(S3Token2Mel):
         output_wavs[:, :len(self.trim_fade)] *= self.trim_fade
 
         return output_wavs, output_sources
+
+    @torch.inference_mode()
+    def inference_batch(
+        self,
+        speech_tokens: List[torch.Tensor],
+        ref_dict: dict,
+        n_cfm_timesteps=None,
+    ) -> List[torch.Tensor]:
+        """
+        Vocode several token sequences of the same speaker in one padded batch.
+
+        Returns one (1, num_samples) waveform per sequence, in order. Empty sequences give empty waveforms.
+        """
+        speech_tokens = [torch.atleast_1d(tokens.squeeze()).to(self.device) for tokens in speech_tokens]
+        wavs = [torch.zeros(1, 0, device=self.device, dtype=self.dtype) for _ in speech_tokens]
+        indices = [i for i, tokens in enumerate(speech_tokens) if tokens.numel() > 0]
+        if not indices:
+            return wavs
+
+        token_lens = torch.tensor([speech_tokens[i].numel() for i in indices], dtype=torch.long, device=self.device)
+        batch = torch.zeros(len(indices), int(token_lens.max()), dtype=torch.long, device=self.device)
+        for row, i in enumerate(indices):
+            batch[row, :token_lens[row]] = speech_tokens[i]
+
+        output_mels = self.flow_inference(
+            batch,
+            speech_token_lens=token_lens,
+            ref_dict=ref_dict,
+            n_cfm_timesteps=n_cfm_timesteps,
+            finalize=True,
+        )
+        output_mels = output_mels.to(dtype=self.dtype)
+        output_wavs, _ = self.hift_inference(output_mels, None)
+
+        # padded frames are vocoded too, cut every waveform back to the mels of its own tokens
+        samples_per_mel = output_wavs.size(-1) // output_mels.size(-1)
+        mels_per_token = output_mels.size(-1) // batch.size(1)
+        for row, i in enumerate(indices):
+            wav = output_wavs[row:row + 1, :int(token_lens[row]) * mels_per_token * samples_per_mel].clone()
+            # NOTE: ad-hoc method to reduce "spillover" from the reference clip.
+            wav[:, :len(self.trim_fade)] *= self.trim_fade[:wav.size(1)]
+            wavs[i] = wav
+        return wavs
+
+
+class S3GenStreamer:
+    """
+    Vocodes speech tokens while they are still being generated.
+
+    Every `vocode()` call runs the flow and HiFT over a window of the newest tokens plus up to `context_tokens`
+    tokens before them, so each piece of audio is computed with some left context instead of from scratch.
+    Until the last call, the flow holds back the final `pre_lookahead_len` tokens (they need lookahead) and the
+    last `crossfade_samples` of audio are kept, then crossfaded with the next window's version of them.
+
+    `postprocess` (e.g. a watermarker) is applied to the audio of the whole window before any of it is cut out
+    and crossfaded, so it always sees the left context and the chunk edges are smoothed after it ran.
+    """
+
+    def __init__(
+        self,
+        s3gen: S3Token2Wav,
+        ref_dict: dict,
+        context_tokens: int = 50,
+        crossfade_samples: int = S3GEN_SR // 50,
+        n_cfm_timesteps=None,
+        postprocess: Optional[Callable[[torch.Tensor], torch.Tensor]] = None,
+    ):
+        self.s3gen = s3gen
+        self.ref_dict = ref_dict
+        self.context_tokens = context_tokens
+        self.crossfade_samples = crossfade_samples
+        self.n_cfm_timesteps = n_cfm_timesteps
+        self.postprocess = postprocess
+        self.tokens = []
+        self.n_tokens = 0
+        # tokens whose mels are final, and samples already returned
+        self.vocoded_tokens = 0
+        self.emitted_samples = 0
+        self.samples_per_token = 0
+        self.tail = None
+
+    def push(self, speech_tokens: torch.Tensor):
+        """Add (n,) new speech tokens"""
+        speech_tokens = torch.atleast_1d(speech_tokens.squeeze()).to(self.s3gen.device)
+        self.tokens.append(speech_tokens)
+        self.n_tokens += speech_tokens.numel()
+
+    @torch.inference_mode()
+    def vocode(self, finalize: bool = False) -> torch.Tensor:
+        """The (1, num_samples) audio that follows what was returned before; `finalize` after the last token"""
+        flow = self.s3gen.flow
+        empty = torch.zeros(1, 0, device=self.s3gen.device, dtype=self.s3gen.dtype)
+        lookahead = 0 if finalize else flow.pre_lookahead_len
+        if self.n_tokens - lookahead <= self.vocoded_tokens:
+            if finalize and self.tail is not None:
+                tail, self.tail = self.tail, None
+                return tail
+            return empty
+
+        tokens = torch.cat(self.tokens)
+        window_start = max(0, self.vocoded_tokens - self.context_tokens)
+        if self.samples_per_token:
+            # the window must at least reach back to the audio not returned yet
+            window_start = min(window_start, self.emitted_samples // self.samples_per_token)
+        window = tokens[window_start:].unsqueeze(0)
+        output_mels = self.s3gen.flow_inference(
+            window,
+            ref_dict=self.ref_dict,
+            n_cfm_timesteps=self.n_cfm_timesteps,
+            finalize=finalize,
+        ).to(dtype=self.s3gen.dtype)
+        wav, _ = self.s3gen.hift_inference(output_mels, None)
+        if window_start == 0:
+            # NOTE: ad-hoc method to reduce "spillover" from the reference clip.
+            wav[:, :len(self.s3gen.trim_fade)] *= self.s3gen.trim_fade[:wav.size(1)]
+
+        self.samples_per_token = flow.token_mel_ratio * (wav.size(1) // output_mels.size(-1))
+        if self.postprocess is not None:
+            wav = self.postprocess(wav)
+        new = wav[:, self.emitted_samples - window_start * self.samples_per_token:]
+        self.vocoded_tokens = window_start + output_mels.size(-1) // flow.token_mel_ratio
+
+        if self.tail is not None:
+            n = min(self.tail.size(1), new.size(1))
+            fade_in = torch.linspace(0, 1, n, device=new.device, dtype=new.dtype)
+            new = new.clone()
+            new[:, :n] = self.tail[:, :n] * (1 - fade_in) + new[:, :n] * fade_in
+            self.tail = None
+
+        if not finalize and self.crossfade_samples > 0 and new.size(1) > self.crossfade_samples:
+            new, self.tail = new[:, :-self.crossfade_samples], new[:, -self.crossfade_samples:]
+        self.emitted_samples += new.size(1)
+        return new
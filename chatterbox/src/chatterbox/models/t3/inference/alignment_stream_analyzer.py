@@ -60,6 +60,7 @@ class AlignmentStreamAnalyzer:
         # using it for all layers slows things down too much. We can apply it to just one layer
         # by intercepting the kwargs and adding a forward hook (credit: jrm)
         self.last_aligned_attns = []
+        self._hook_handles = []
         for i, (layer_idx, head_idx) in enumerate(LLAMA_ALIGNED_HEADS):
             self.last_aligned_attns += [None]
             self._add_attention_spy(tfmr, i, layer_idx, head_idx)
@@ -79,12 +80,25 @@ class AlignmentStreamAnalyzer:
                 step_attention = output[1].cpu()  # (B, n_heads, T0, Ti)
                 self.last_aligned_attns[buffer_idx] = step_attention[0, head_idx]  # (T0, Ti)
 
+        def request_attentions_hook(module, args, kwargs):
+            """
+            Ask only this layer for its attention weights; the other layers keep the SDPA kernel.
+            NOTE: without `output_attentions=True` on the model, the SDPA causal mask may be dropped, so the
+            prefill (more than one query) must still be run with `output_attentions=True`.
+            """
+            kwargs["output_attentions"] = True
+            return args, kwargs
+
         target_layer = tfmr.layers[layer_idx].self_attn
-        # Register hook and store the handle
-        target_layer.register_forward_hook(attention_forward_hook)
-        if hasattr(tfmr, 'config') and hasattr(tfmr.config, 'output_attentions'):
-            self.original_output_attentions = tfmr.config.output_attentions
-            tfmr.config.output_attentions = True
+        # Register hooks and store the handles, the model is shared with later inference calls
+        self._hook_handles.append(target_layer.register_forward_pre_hook(request_attentions_hook, with_kwargs=True))
+        self._hook_handles.append(target_layer.register_forward_hook(attention_forward_hook))
+
+    def close(self):
+        """Remove the attention spies from the transformer"""
+        for handle in self._hook_handles:
+            handle.remove()
+        self._hook_handles = []
 
     def step(self, logits, next_token=None):
         """
@@ -0,0 +1,94 @@
+"""
+Building blocks of the T3 sampling loops that avoid per-step reallocation:
+
+- `TokenBuffer`: generated ids in a tensor preallocated for `max_new_tokens`, instead of a `torch.cat` per step.
+- `TokenCountRepetitionPenalty`: the HF repetition penalty computed from a per-token count vector updated in
+  place, instead of gathering over the whole history every step.
+- `static_kv_cache`: a KV cache allocated once for the prompt and every new token, instead of HF's growing
+  dynamic cache. It is opt-in: the allocation covers `max_new_tokens` rather than the real length, and only a
+  compiled model gains speed from the fixed shapes.
+
+They produce the same values as the HF processors and dynamic cache they replace.
+"""
+import logging
+from typing import Optional
+
+import torch
+from torch import Tensor
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBuffer:
+    def __init__(self, batch_size: int, capacity: int, device, initial: Optional[Tensor] = None):
+        """
+        :param capacity: the most tokens the buffer will hold, including `initial`.
+        :param initial: optional (batch_size, n) tokens to start with, e.g. the BOS token.
+        """
+        self._ids = torch.empty(batch_size, capacity, dtype=torch.long, device=device)
+        self.length = 0
+        if initial is not None:
+            self.append(initial)
+
+    def append(self, tokens: Tensor):
+        """Append (batch_size, n) tokens in place"""
+        n = tokens.size(1)
+        assert self.length + n <= self._ids.size(1), "token buffer is full"
+        self._ids[:, self.length:self.length + n] = tokens
+        self.length += n
+
+    @property
+    def ids(self) -> Tensor:
+        """(batch_size, length) view of the tokens so far, no copy"""
+        return self._ids[:, :self.length]
+
+    def __len__(self):
+        return self.length
+
+
+class TokenCountRepetitionPenalty:
+    """
+    Same as `transformers.RepetitionPenaltyLogitsProcessor`, which penalizes every token that occurs in
+    `input_ids` once, but the occurrences are kept as a (batch_size, vocab_size) count vector that callers
+    update with each new token. The `input_ids` passed to `__call__` are ignored, so it can stand in for the
+    HF processor in a `LogitsProcessorList`.
+    """
+
+    def __init__(self, penalty: float, batch_size: int, vocab_size: int, device):
+        if not penalty > 0:
+            raise ValueError(f"`penalty` has to be a strictly positive float, but is {penalty}")
+        self.penalty = penalty
+        self.counts = torch.zeros(batch_size, vocab_size, dtype=torch.long, device=device)
+
+    def update(self, tokens: Tensor):
+        """Count (batch_size, n) more tokens"""
+        self.counts.scatter_add_(1, tokens, torch.ones_like(tokens))
+
+    def reset(self):
+        self.counts.zero_()
+
+    def __call__(self, input_ids: Optional[Tensor], scores: Tensor) -> Tensor:
+        if self.penalty == 1.0:
+            return scores
+        penalized = torch.where(scores < 0, scores * self.penalty, scores / self.penalty)
+        return torch.where(self.counts > 0, penalized, scores)
+
+
+def static_kv_cache(config, batch_size: int, max_cache_len: int, device, dtype) -> Optional["Cache"]:
+    """
+    A static KV cache for `max_cache_len` positions, or None (use the dynamic cache) if this version of
+    transformers cannot build one for the model.
+    """
+    try:
+        from transformers import StaticCache
+    except ImportError:
+        return None
+    try:
+        # transformers < 4.48 needs the batch size up front, later versions allocate on first update
+        return StaticCache(
+            config=config, max_batch_size=batch_size, max_cache_len=max_cache_len, device=device, dtype=dtype,
+        )
+    except Exception as e:
+        logger.warning(f"static KV cache unavailable, falling back to the dynamic cache: {e}")
+        return None
@@ -76,8 +76,11 @@ class T3HuggingfaceBackend(LlamaPreTrainedModel, GenerationMixin):
         past_key_values: Optional[torch.Tensor]=None,
         use_cache=True,
         output_attentions=False,
-        output_hidden_states=True,
+        output_hidden_states=False,
         return_dict=True,
+        attention_mask: Optional[torch.Tensor]=None,
+        position_ids: Optional[torch.Tensor]=None,
+        cache_position: Optional[torch.Tensor]=None,
     ):
         """
         This is a method used by huggingface's generate() method.
@@ -85,22 +88,30 @@ class T3HuggingfaceBackend(LlamaPreTrainedModel, GenerationMixin):
 
         :param inputs_embeds: (B, S, C) float32 tensor of conditioning inputs. If past key values are given,
         S should be 1.
+        :param attention_mask: optional (B, past + S) mask of the non-padding positions, for left-padded batches.
+        :param position_ids: optional (B, S) positions of the inputs, required along with a padded `attention_mask`.
+        :param cache_position: optional (S,) cache slots of the inputs, required along with a static KV cache.
         """
         is_large_input = inputs_embeds.size(1) != 1
-        has_cache = past_key_values is not None and len(past_key_values) > 0
+        has_cache = past_key_values is not None and (
+            # a preallocated static cache has all its layers before anything is cached
+            past_key_values.get_seq_length() if hasattr(past_key_values, "get_seq_length") else len(past_key_values)
+        ) > 0
         assert not (is_large_input and has_cache)
         assert return_dict
-        assert output_hidden_states
 
         tfmr_out = self.model(
             inputs_embeds=inputs_embeds,
             past_key_values=past_key_values,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            cache_position=cache_position,
             use_cache=use_cache,
             output_attentions=output_attentions,
             output_hidden_states=output_hidden_states,
             return_dict=True,
         )
-        hidden_states = tfmr_out.hidden_states[-1]  # (B, seq, dim)
+        hidden_states = tfmr_out.last_hidden_state  # (B, seq, dim)
 
         logits = self.speech_head(hidden_states)
         # assert inputs_embeds.size(0) == 1 # (disabled for CFG)
@@ -12,7 +12,6 @@ from torch import nn, Tensor
 from transformers import LlamaModel, LlamaConfig, GPT2Config, GPT2Model
 from transformers.generation.logits_process import (
     LogitsProcessorList,
-    RepetitionPenaltyLogitsProcessor,
     TemperatureLogitsWarper,
     TopKLogitsWarper,
     TopPLogitsWarper,
@@ -25,6 +24,7 @@ from .modules.t3_config import T3Config
 from .llama_configs import LLAMA_CONFIGS
 from .inference.t3_hf_backend import T3HuggingfaceBackend
 from .inference.alignment_stream_analyzer import AlignmentStreamAnalyzer
+from .inference.decoding import TokenBuffer, TokenCountRepetitionPenalty, static_kv_cache
 from ..utils import AttrDict
 
 
@@ -224,7 +224,7 @@ class T3(nn.Module):
         return loss_text, loss_speech
 
     @torch.inference_mode()
-    def inference(
+    def inference_stream(
         self,
         *,
         t3_cond: T3Cond,
@@ -245,10 +245,17 @@ class T3(nn.Module):
         length_penalty=1.0,
         repetition_penalty=1.2,
         cfg_weight=0.5,
+        use_static_cache=False,
     ):
         """
+        Like `inference`, but yields every sampled speech token as soon as it is sampled, as a (1, 1) tensor.
+        The last token is the EOS token, unless `max_new_tokens` ran out first.
+
         Args:
             text_tokens: a 1D (unbatched) or 2D (batched) tensor.
+            use_static_cache: preallocate the KV cache for the prompt and all `max_new_tokens` (about 240 KB per
+                position and row in fp32) instead of growing it with the tokens actually generated. Every step
+                then attends over the whole allocation, so this only pays off with a compiled model.
         """
         # Validate / sanitize inputs
         assert prepend_prompt_speech_tokens is None, "not implemented"
@@ -326,90 +333,307 @@ class T3(nn.Module):
         # Combine condition and BOS token for the initial input
         inputs_embeds = torch.cat([embeds, bos_embed], dim=1)
 
-        # Track generated token ids; start with the BOS token.
-        generated_ids = bos_token.clone()
-        predicted = []  # To store the predicted tokens
+        # Track generated token ids in a preallocated buffer; start with the BOS token.
+        max_new_tokens = max_new_tokens or self.hp.max_speech_tokens
+        generated = TokenBuffer(1, max_new_tokens + 1, device, initial=bos_token)
 
         # Instantiate the logits processors.
-        top_p_warper = TopPLogitsWarper(top_p=top_p)
         min_p_warper = MinPLogitsWarper(min_p=min_p)
         top_p_warper = TopPLogitsWarper(top_p=top_p)
-        repetition_penalty_processor = RepetitionPenaltyLogitsProcessor(penalty=float(repetition_penalty))
+        repetition_penalty_processor = TokenCountRepetitionPenalty(
+            float(repetition_penalty), 1, self.speech_head.out_features, device,
+        )
+        repetition_penalty_processor.update(bos_token)
+
+        # Attention maps are only needed by the alignment analyzer, which spies on a few layers itself.
+        # Without it, every layer runs SDPA and no per-layer attentions or hidden states are materialized.
+        alignment_stream_analyzer = self.patched_model.alignment_stream_analyzer
+
+        # The KV cache is allocated once for the prompt and every token that may be generated
+        prompt_len = inputs_embeds.size(1)
+        past = None
+        if use_static_cache:
+            past = static_kv_cache(
+                self.cfg, inputs_embeds.size(0), prompt_len + max_new_tokens, device, inputs_embeds.dtype,
+            )
 
-        # ---- Initial Forward Pass (no kv_cache yet) ----
+        # ---- Initial Forward Pass ----
         output = self.patched_model(
             inputs_embeds=inputs_embeds,
-            past_key_values=None,
+            past_key_values=past,
+            cache_position=torch.arange(prompt_len, device=device),
             use_cache=True,
-            output_attentions=True,
-            output_hidden_states=True,
+            # keeps the causal mask for the spied (eager) layers of the multi-token prefill
+            output_attentions=alignment_stream_analyzer is not None,
             return_dict=True,
         )
         # Initialize kv_cache with the full context.
         past = output.past_key_values
 
-        # ---- Generation Loop using kv_cache ----
-        for i in tqdm(range(max_new_tokens), desc="Sampling", dynamic_ncols=True):
-            logits_step = output.logits[:, -1, :]
-            # CFG combine  → (1, V)
-            cond   = logits_step[0:1, :]
-            uncond = logits_step[1:2, :]
-            cfg = torch.as_tensor(cfg_weight, device=cond.device, dtype=cond.dtype)
-            logits = cond + cfg * (cond - uncond)
+        # the caller may stop consuming tokens at any point
+        try:
+            # ---- Generation Loop using kv_cache ----
+            for i in tqdm(range(max_new_tokens), desc="Sampling", dynamic_ncols=True):
+                logits_step = output.logits[:, -1, :]
+                # CFG combine  → (1, V)
+                cond   = logits_step[0:1, :]
+                uncond = logits_step[1:2, :]
+                cfg = torch.as_tensor(cfg_weight, device=cond.device, dtype=cond.dtype)
+                logits = cond + cfg * (cond - uncond)
             
-            # Apply alignment stream analyzer integrity checks
-            if self.patched_model.alignment_stream_analyzer is not None:
-                if logits.dim() == 1:            # guard in case something upstream squeezed
-                    logits = logits.unsqueeze(0) # (1, V)
-                # Pass the last generated token for repetition tracking
-                last_token = generated_ids[0, -1].item() if len(generated_ids[0]) > 0 else None
-                logits = self.patched_model.alignment_stream_analyzer.step(logits, next_token=last_token)  # (1, V)
-
-            # Apply repetition penalty
-            ids_for_proc = generated_ids[:1, ...]   # batch = 1
-            logits = repetition_penalty_processor(ids_for_proc, logits)  # expects (B,V)
+                # Apply alignment stream analyzer integrity checks
+                if alignment_stream_analyzer is not None:
+                    if logits.dim() == 1:            # guard in case something upstream squeezed
+                        logits = logits.unsqueeze(0) # (1, V)
+                    # Pass the last generated token for repetition tracking
+                    last_token = generated.ids[0, -1].item() if len(generated) > 0 else None
+                    logits = alignment_stream_analyzer.step(logits, next_token=last_token)  # (1, V)
+
+                # Apply repetition penalty
+                ids_for_proc = generated.ids   # batch = 1
+                logits = repetition_penalty_processor(ids_for_proc, logits)  # expects (B,V)
             
-            # Apply temperature scaling.
-            if temperature != 1.0:
-                logits = logits / temperature
+                # Apply temperature scaling.
+                if temperature != 1.0:
+                    logits = logits / temperature
                 
-            # Apply min_p and top_p filtering
-            logits = min_p_warper(ids_for_proc, logits)
-            logits = top_p_warper(ids_for_proc, logits)
+                # Apply min_p and top_p filtering
+                logits = min_p_warper(ids_for_proc, logits)
+                logits = top_p_warper(ids_for_proc, logits)
+
+                # Convert logits to probabilities and sample the next token.
+                probs = torch.softmax(logits, dim=-1)
+                next_token = torch.multinomial(probs, num_samples=1)  # shape: (B, 1)
+
+                generated.append(next_token)
+                repetition_penalty_processor.update(next_token)
+                yield next_token
+
+                # Check for EOS token.
+                if next_token.view(-1) == self.hp.stop_speech_token:
+                    logger.info(f"✅ EOS token detected! Stopping generation at step {i+1}")
+                    break
+
+                # Get embedding for the new token.
+                next_token_embed = self.speech_emb(next_token)
+                next_token_embed = next_token_embed + self.speech_pos_emb.get_fixed_embedding(i + 1)
+
+                #  For CFG
+                next_token_embed = torch.cat([next_token_embed, next_token_embed])
+
+                # Forward pass with only the new token and the cached past.
+                output = self.patched_model(
+                    inputs_embeds=next_token_embed,
+                    past_key_values=past,
+                    cache_position=torch.tensor([prompt_len + i], device=device),
+                    return_dict=True,
+                )
+                # Update the kv_cache.
+                past = output.past_key_values
+        finally:
+            if alignment_stream_analyzer is not None:
+                alignment_stream_analyzer.close()
 
-            # Convert logits to probabilities and sample the next token.
-            probs = torch.softmax(logits, dim=-1)
-            next_token = torch.multinomial(probs, num_samples=1)  # shape: (B, 1)
+    @torch.inference_mode()
+    def inference(
+        self,
+        *,
+        t3_cond: T3Cond,
+        text_tokens: Tensor,
+        initial_speech_tokens: Optional[Tensor]=None,
+
+        # misc conditioning
+        prepend_prompt_speech_tokens: Optional[Tensor]=None,
+
+        # HF generate args
+        num_return_sequences=1,
+        max_new_tokens=None,
+        stop_on_eos=True,
+        do_sample=True,
+        temperature=0.8,
+        top_p=0.95,
+        min_p=0.05,
+        length_penalty=1.0,
+        repetition_penalty=1.2,
+        cfg_weight=0.5,
+        use_static_cache=False,
+    ):
+        """
+        Args:
+            text_tokens: a 1D (unbatched) or 2D (batched) tensor.
+            use_static_cache: preallocate the KV cache for the prompt and all `max_new_tokens` (about 240 KB per
+                position and row in fp32) instead of growing it with the tokens actually generated. Every step
+                then attends over the whole allocation, so this only pays off with a compiled model.
+        """
+        predicted = list(self.inference_stream(
+            t3_cond=t3_cond,
+            text_tokens=text_tokens,
+            initial_speech_tokens=initial_speech_tokens,
+            prepend_prompt_speech_tokens=prepend_prompt_speech_tokens,
+            num_return_sequences=num_return_sequences,
+            max_new_tokens=max_new_tokens,
+            stop_on_eos=stop_on_eos,
+            do_sample=do_sample,
+            temperature=temperature,
+            top_p=top_p,
+            min_p=min_p,
+            length_penalty=length_penalty,
+            repetition_penalty=repetition_penalty,
+            cfg_weight=cfg_weight,
+            use_static_cache=use_static_cache,
+        ))
+        # Concatenate all predicted tokens along the sequence dimension.
+        return torch.cat(predicted, dim=1)  # shape: (B, num_tokens)
 
-            predicted.append(next_token)
-            generated_ids = torch.cat([generated_ids, next_token], dim=1)
+    @torch.inference_mode()
+    def inference_batch(
+        self,
+        *,
+        t3_cond: T3Cond,
+        text_tokens: List[Tensor],
+        max_new_tokens=None,
+        temperature=0.8,
+        top_p=0.95,
+        min_p=0.05,
+        repetition_penalty=1.2,
+        cfg_weight=0.5,
+        use_static_cache=False,
+    ) -> List[Tensor]:
+        """
+        Decode the speech tokens of several text chunks together, as one left-padded batch.
+
+        Args:
+            text_tokens: one tensor per chunk, shaped like the `text_tokens` of `inference` (two rows for CFG).
+            use_static_cache: preallocate the KV cache for the prompt and all `max_new_tokens` (about 240 KB per
+                position and row in fp32) instead of growing it with the tokens actually generated. Every step
+                then attends over the whole allocation, so this only pays off with a compiled model.
+
+        Returns the speech tokens of every chunk in order, each (1, num_tokens) and ending with the EOS token
+        unless `max_new_tokens` ran out first.
+        """
+        if self.hp.is_multilingual:
+            # the alignment stream analyzer follows a single sequence
+            return [
+                self.inference(
+                    t3_cond=t3_cond, text_tokens=tokens, max_new_tokens=max_new_tokens, temperature=temperature,
+                    top_p=top_p, min_p=min_p, repetition_penalty=repetition_penalty, cfg_weight=cfg_weight,
+                )
+                for tokens in text_tokens
+            ]
+
+        max_new_tokens = max_new_tokens or self.hp.max_speech_tokens
+        n_chunks = len(text_tokens)
+        device = self.device
+
+        # per chunk: (n_rows, len, dim) embeddings of [cond, text, start of speech], followed by the BOS embedding
+        bos_token = torch.tensor([[self.hp.start_speech_token]], dtype=torch.long, device=device)
+        bos_embed = self.speech_emb(bos_token) + self.speech_pos_emb.get_fixed_embedding(0)
+        chunk_embeds = []
+        for tokens in text_tokens:
+            _ensure_BOT_EOT(tokens, self.hp)
+            tokens = torch.atleast_2d(tokens).to(dtype=torch.long, device=device)
+            embeds, _ = self.prepare_input_embeds(
+                t3_cond=t3_cond,
+                text_tokens=tokens,
+                speech_tokens=self.hp.start_speech_token * torch.ones_like(tokens[:, :1]),
+                cfg_weight=cfg_weight,
+            )
+            chunk_embeds.append(torch.cat([embeds, bos_embed.expand(embeds.size(0), -1, -1)], dim=1))
+        n_rows = chunk_embeds[0].size(0)
+        assert all(embeds.size(0) == n_rows for embeds in chunk_embeds), "chunks must agree on CFG"
+        use_cfg = n_rows == 2
+
+        # rows are [cond of every chunk, uncond of every chunk], left-padded so that they all end together
+        # the attention mask is allocated for every token that may be generated, and filled in step by step
+        rows = [embeds[r] for r in range(n_rows) for embeds in chunk_embeds]
+        max_len = max(row.size(0) for row in rows)
+        inputs_embeds = rows[0].new_zeros(len(rows), max_len, rows[0].size(-1))
+        full_attention_mask = torch.zeros(len(rows), max_len + max_new_tokens, dtype=torch.long, device=device)
+        for i, row in enumerate(rows):
+            inputs_embeds[i, max_len - row.size(0):] = row
+            full_attention_mask[i, max_len - row.size(0):max_len] = 1
+        attention_mask = full_attention_mask[:, :max_len]
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+        # positions of the first speech token, each later token is one further
+        next_positions = attention_mask.sum(-1, keepdim=True)
+
+        patched_model = T3HuggingfaceBackend(
+            config=self.cfg,
+            llama=self.tfmr,
+            speech_enc=self.speech_emb,
+            speech_head=self.speech_head,
+        )
 
-            # Check for EOS token.
-            if next_token.view(-1) == self.hp.stop_speech_token:
-                logger.info(f"✅ EOS token detected! Stopping generation at step {i+1}")
+        generated = TokenBuffer(n_chunks, max_new_tokens + 1, device, initial=bos_token.repeat(n_chunks, 1))
+        finished = torch.zeros(n_chunks, dtype=torch.bool, device=device)
+        lengths = torch.zeros(n_chunks, dtype=torch.long, device=device)
+
+        min_p_warper = MinPLogitsWarper(min_p=min_p)
+        top_p_warper = TopPLogitsWarper(top_p=top_p)
+        repetition_penalty_processor = TokenCountRepetitionPenalty(
+            float(repetition_penalty), n_chunks, self.speech_head.out_features, device,
+        )
+        repetition_penalty_processor.update(generated.ids)
+
+        past = None
+        if use_static_cache:
+            past = static_kv_cache(self.cfg, len(rows), max_len + max_new_tokens, device, inputs_embeds.dtype)
+
+        output = patched_model(
+            inputs_embeds=inputs_embeds,
+            past_key_values=past,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            cache_position=torch.arange(max_len, device=device),
+            use_cache=True,
+            return_dict=True,
+        )
+        past = output.past_key_values
+
+        for i in tqdm(range(max_new_tokens), desc="Sampling (batch)", dynamic_ncols=True):
+            logits = output.logits[:, -1, :]
+            if use_cfg:
+                cond, uncond = logits[:n_chunks], logits[n_chunks:]
+                cfg = torch.as_tensor(cfg_weight, device=cond.device, dtype=cond.dtype)
+                logits = cond + cfg * (cond - uncond)
+
+            logits = repetition_penalty_processor(generated.ids, logits)
+            if temperature != 1.0:
+                logits = logits / temperature
+            logits = min_p_warper(generated.ids, logits)
+            logits = top_p_warper(generated.ids, logits)
+
+            probs = torch.softmax(logits, dim=-1)
+            next_token = torch.multinomial(probs, num_samples=1)  # (n_chunks, 1)
+            # finished chunks keep emitting EOS, which is cut off below
+            next_token = next_token.masked_fill(finished.unsqueeze(1), self.hp.stop_speech_token)
+
+            generated.append(next_token)
+            repetition_penalty_processor.update(next_token)
+            lengths += (~finished).long()
+            finished |= next_token.view(-1) == self.hp.stop_speech_token
+            if finished.all():
+                logger.info(f"✅ EOS token detected for all {n_chunks} chunks at step {i+1}")
                 break
 
-            # Get embedding for the new token.
             next_token_embed = self.speech_emb(next_token)
             next_token_embed = next_token_embed + self.speech_pos_emb.get_fixed_embedding(i + 1)
+            if use_cfg:
+                next_token_embed = torch.cat([next_token_embed, next_token_embed])
 
-            #  For CFG
-            next_token_embed = torch.cat([next_token_embed, next_token_embed])
-
-            # Forward pass with only the new token and the cached past.
-            output = self.patched_model(
+            full_attention_mask[:, max_len + i] = 1
+            output = patched_model(
                 inputs_embeds=next_token_embed,
                 past_key_values=past,
-                output_attentions=True,
-                output_hidden_states=True,
+                attention_mask=full_attention_mask[:, :max_len + i + 1],
+                position_ids=next_positions + i,
+                cache_position=torch.tensor([max_len + i], device=device),
                 return_dict=True,
             )
-            # Update the kv_cache.
             past = output.past_key_values
 
-        # Concatenate all predicted tokens along the sequence dimension.
-        predicted_tokens = torch.cat(predicted, dim=1)  # shape: (B, num_tokens)
-        return predicted_tokens
+        predicted_tokens = generated.ids[:, 1:]  # (n_chunks, num_tokens)
+        return [predicted_tokens[n:n + 1, :lengths[n]] for n in range(n_chunks)]
 
     @torch.inference_mode()
     def inference_turbo(self, t3_cond, text_tokens, temperature=0.8, top_k=1000, top_p=0.95, repetition_penalty=1.2,
@@ -422,8 +646,13 @@ class T3(nn.Module):
             logits_processors.append(TopKLogitsWarper(top_k))
         if top_p < 1.0:
             logits_processors.append(TopPLogitsWarper(top_p))
+        # counts of the tokens seen by the penalty, kept up to date below instead of rescanning the history
+        repetition_penalty_processor = None
         if repetition_penalty != 1.0:
-            logits_processors.append(RepetitionPenaltyLogitsProcessor(repetition_penalty))
+            repetition_penalty_processor = TokenCountRepetitionPenalty(
+                repetition_penalty, text_tokens.size(0), self.speech_head.out_features, text_tokens.device,
+            )
+            logits_processors.append(repetition_penalty_processor)
 
 
         speech_start_token = self.hp.start_speech_token * torch.ones_like(text_tokens[:, :1])
@@ -434,7 +663,7 @@ class T3(nn.Module):
             cfg_weight=0.0,
         )
 
-        generated_speech_tokens = []
+        generated = TokenBuffer(text_tokens.size(0), max_gen_len + 1, text_tokens.device)
 
         llm_outputs = self.tfmr(
             inputs_embeds=embeds,
@@ -447,11 +676,17 @@ class T3(nn.Module):
         speech_hidden = hidden_states[:, -1:]
         speech_logits = self.speech_head(speech_hidden)
 
+        # the first step is penalized for the start token, later steps for the generated tokens only
+        if repetition_penalty_processor is not None:
+            repetition_penalty_processor.update(speech_start_token)
         processed_logits = logits_processors(speech_start_token, speech_logits[:, -1, :])
         probs = F.softmax(processed_logits, dim=-1)
         next_speech_token = torch.multinomial(probs, num_samples=1)
 
-        generated_speech_tokens.append(next_speech_token)
+        generated.append(next_speech_token)
+        if repetition_penalty_processor is not None:
+            repetition_penalty_processor.reset()
+            repetition_penalty_processor.update(next_speech_token)
         current_speech_token = next_speech_token
 
         for _ in tqdm(range(max_gen_len)):
@@ -467,8 +702,7 @@ class T3(nn.Module):
             past_key_values = llm_outputs.past_key_values
             speech_logits = self.speech_head(hidden_states)
 
-            input_ids = torch.cat(generated_speech_tokens, dim=1)
-            processed_logits = logits_processors(input_ids, speech_logits[:, -1, :])
+            processed_logits = logits_processors(generated.ids, speech_logits[:, -1, :])
             if torch.all(processed_logits == -float("inf")):
                 print("Warning: All logits are -inf")
                 break
@@ -476,12 +710,14 @@ class T3(nn.Module):
             probs = F.softmax(processed_logits, dim=-1)
             next_speech_token = torch.multinomial(probs, num_samples=1)
 
-            generated_speech_tokens.append(next_speech_token)
+            generated.append(next_speech_token)
+            if repetition_penalty_processor is not None:
+                repetition_penalty_processor.update(next_speech_token)
             current_speech_token = next_speech_token
             if torch.all(next_speech_token == self.hp.stop_speech_token):
                 break
 
-        all_tokens = torch.cat(generated_speech_tokens, dim=1)
+        all_tokens = generated.ids
 
         # Remove EOS token if present
         if all_tokens.size(1) > 0 and all_tokens[0, -1] == self.hp.stop_speech_token:
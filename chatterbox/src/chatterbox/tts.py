@@ -9,8 +9,8 @@ from huggingface_hub import hf_hub_download
 from safetensors.torch import load_file
 
 from .models.t3 import T3
-from .models.s3tokenizer import S3_SR, drop_invalid_tokens
-from .models.s3gen import S3GEN_SR, S3Gen
+from .models.s3tokenizer import S3_SR, SPEECH_VOCAB_SIZE, drop_invalid_tokens
+from .models.s3gen import S3GEN_SR, S3Gen, S3GenStreamer
 from .models.tokenizers import EnTokenizer
 from .models.voice_encoder import VoiceEncoder
 from .models.t3.modules.cond_enc import T3Cond
@@ -180,6 +180,10 @@ class ChatterboxTTS:
         return cls.from_local(Path(local_path).parent, device)
 
     def prepare_conditionals(self, wav_fpath, exaggeration=0.5):
+        self.conds = self.get_conditionals(wav_fpath, exaggeration=exaggeration)
+
+    def get_conditionals(self, wav_fpath, exaggeration=0.5) -> Conditionals:
+        """Conditionals of a reference voice, without making them the default of the model"""
         ## Load reference wav
         s3gen_ref_wav, _sr = librosa.load(wav_fpath, sr=S3GEN_SR)
 
@@ -203,33 +207,31 @@ class ChatterboxTTS:
             cond_prompt_speech_tokens=t3_cond_prompt_tokens,
             emotion_adv=exaggeration * torch.ones(1, 1, 1),
         ).to(device=self.device)
-        self.conds = Conditionals(t3_cond, s3gen_ref_dict)
+        return Conditionals(t3_cond, s3gen_ref_dict)
 
-    def generate(
-        self,
-        text,
-        repetition_penalty=1.2,
-        min_p=0.05,
-        top_p=1.0,
-        audio_prompt_path=None,
-        exaggeration=0.5,
-        cfg_weight=0.5,
-        temperature=0.8,
-    ):
-        if audio_prompt_path:
-            self.prepare_conditionals(audio_prompt_path, exaggeration=exaggeration)
-        else:
-            assert self.conds is not None, "Please `prepare_conditionals` first or specify `audio_prompt_path`"
+    def _resolve_conditionals(self, audio_prompt_path, exaggeration, conds: Conditionals = None) -> Conditionals:
+        # `conds` (e.g. from a cache) are used for this call only and left untouched
+        if conds is None:
+            if audio_prompt_path:
+                self.prepare_conditionals(audio_prompt_path, exaggeration=exaggeration)
+            else:
+                assert self.conds is not None, "Please `prepare_conditionals` first or specify `audio_prompt_path`"
+            conds = self.conds
 
         # Update exaggeration if needed
-        if exaggeration != self.conds.t3.emotion_adv[0, 0, 0]:
-            _cond: T3Cond = self.conds.t3
-            self.conds.t3 = T3Cond(
-                speaker_emb=_cond.speaker_emb,
-                cond_prompt_speech_tokens=_cond.cond_prompt_speech_tokens,
-                emotion_adv=exaggeration * torch.ones(1, 1, 1),
-            ).to(device=self.device)
+        if exaggeration != conds.t3.emotion_adv[0, 0, 0]:
+            _cond: T3Cond = conds.t3
+            conds = Conditionals(
+                T3Cond(
+                    speaker_emb=_cond.speaker_emb,
+                    cond_prompt_speech_tokens=_cond.cond_prompt_speech_tokens,
+                    emotion_adv=exaggeration * torch.ones(1, 1, 1),
+                ).to(device=self.device),
+                conds.gen,
+            )
+        return conds
 
+    def _text_tokens(self, text, cfg_weight):
         # Norm and tokenize text
         text = punc_norm(text)
         text_tokens = self.tokenizer.text_to_tokens(text).to(self.device)
@@ -241,10 +243,26 @@ class ChatterboxTTS:
         eot = self.t3.hp.stop_text_token
         text_tokens = F.pad(text_tokens, (1, 0), value=sot)
         text_tokens = F.pad(text_tokens, (0, 1), value=eot)
+        return text_tokens
+
+    def generate(
+        self,
+        text,
+        repetition_penalty=1.2,
+        min_p=0.05,
+        top_p=1.0,
+        audio_prompt_path=None,
+        exaggeration=0.5,
+        cfg_weight=0.5,
+        temperature=0.8,
+        conds: Conditionals = None,
+    ):
+        conds = self._resolve_conditionals(audio_prompt_path, exaggeration, conds)
+        text_tokens = self._text_tokens(text, cfg_weight)
 
         with torch.inference_mode():
             speech_tokens = self.t3.inference(
-                t3_cond=self.conds.t3,
+                t3_cond=conds.t3,
                 text_tokens=text_tokens,
                 max_new_tokens=1000,  # TODO: use the value in config
                 temperature=temperature,
@@ -265,8 +283,117 @@ class ChatterboxTTS:
 
             wav, _ = self.s3gen.inference(
                 speech_tokens=speech_tokens,
-                ref_dict=self.conds.gen,
+                ref_dict=conds.gen,
             )
             wav = wav.squeeze(0).detach().cpu().numpy()
             watermarked_wav = self.watermarker.apply_watermark(wav, sample_rate=self.sr)
         return torch.from_numpy(watermarked_wav).unsqueeze(0)
+
+    def generate_batch(
+        self,
+        texts,
+        repetition_penalty=1.2,
+        min_p=0.05,
+        top_p=1.0,
+        audio_prompt_path=None,
+        exaggeration=0.5,
+        cfg_weight=0.5,
+        temperature=0.8,
+        conds: Conditionals = None,
+    ):
+        """
+        Like `generate`, for several texts of the same voice at once: the speech tokens of all texts are
+        decoded in one padded T3 batch and vocoded in one S3Gen batch. Returns one wav per text, in order.
+        """
+        if len(texts) == 0:
+            return []
+        conds = self._resolve_conditionals(audio_prompt_path, exaggeration, conds)
+        text_tokens = [self._text_tokens(text, cfg_weight) for text in texts]
+
+        with torch.inference_mode():
+            batch_tokens = self.t3.inference_batch(
+                t3_cond=conds.t3,
+                text_tokens=text_tokens,
+                max_new_tokens=1000,  # TODO: use the value in config
+                temperature=temperature,
+                cfg_weight=cfg_weight,
+                repetition_penalty=repetition_penalty,
+                min_p=min_p,
+                top_p=top_p,
+            )
+            speech_tokens = []
+            for tokens in batch_tokens:
+                tokens = drop_invalid_tokens(tokens[0])
+                speech_tokens.append(tokens[tokens < 6561].to(self.device))
+
+            wavs = self.s3gen.inference_batch(speech_tokens, ref_dict=conds.gen)
+            results = []
+            for wav in wavs:
+                wav = wav.squeeze(0).detach().cpu().numpy()
+                watermarked_wav = self.watermarker.apply_watermark(wav, sample_rate=self.sr)
+                results.append(torch.from_numpy(watermarked_wav).unsqueeze(0))
+        return results
+
+    @torch.inference_mode()
+    def generate_stream(
+        self,
+        text,
+        repetition_penalty=1.2,
+        min_p=0.05,
+        top_p=1.0,
+        audio_prompt_path=None,
+        exaggeration=0.5,
+        cfg_weight=0.5,
+        temperature=0.8,
+        conds: Conditionals = None,
+        first_chunk_tokens=10,
+        chunk_tokens=25,
+        context_tokens=50,
+        crossfade=0.02,
+    ):
+        """
+        Like `generate`, but yields the speech as (1, num_samples) chunks while it is being generated.
+
+        The first chunk is vocoded after `first_chunk_tokens` speech tokens (25 tokens are one second) to start
+        playback early, the following ones every `chunk_tokens` tokens. Every chunk is vocoded with up to
+        `context_tokens` earlier tokens and joined to the previous one with a `crossfade` (seconds) overlap.
+        The watermark is applied to each whole window before the crossfade, so it also covers the joins.
+        """
+        conds = self._resolve_conditionals(audio_prompt_path, exaggeration, conds)
+        text_tokens = self._text_tokens(text, cfg_weight)
+        streamer = S3GenStreamer(
+            self.s3gen, conds.gen, context_tokens=context_tokens, crossfade_samples=int(crossfade * self.sr),
+            postprocess=self._watermark_chunk,
+        )
+
+        pending = 0
+        target = first_chunk_tokens
+        for token in self.t3.inference_stream(
+            t3_cond=conds.t3,
+            text_tokens=text_tokens,
+            max_new_tokens=1000,  # TODO: use the value in config
+            temperature=temperature,
+            cfg_weight=cfg_weight,
+            repetition_penalty=repetition_penalty,
+            min_p=min_p,
+            top_p=top_p,
+        ):
+            # special tokens (SOS/EOS) are not vocoded, the token stream ends after EOS
+            if token.item() >= SPEECH_VOCAB_SIZE:
+                continue
+            streamer.push(token.view(-1))
+            pending += 1
+            if pending >= target:
+                pending, target = 0, chunk_tokens
+                wav = streamer.vocode()
+                if wav.size(1) > 0:
+                    yield wav
+
+        wav = streamer.vocode(finalize=True)
+        if wav.size(1) > 0:
+            yield wav
+
+    def _watermark_chunk(self, wav):
+        wav = wav.squeeze(0).detach().cpu().numpy()
+        watermarked_wav = self.watermarker.apply_watermark(wav, sample_rate=self.sr)
+        return torch.from_numpy(watermarked_wav).unsqueeze(0)
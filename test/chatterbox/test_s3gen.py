@@ -0,0 +1,95 @@
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+import torch
+
+# add the chatterbox sources to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "chatterbox" / "src"))
+
+from chatterbox.models.s3gen.s3gen import S3GenStreamer
+
+token_mel_ratio = 2
+hop_samples = 3
+samples_per_token = token_mel_ratio * hop_samples
+
+
+class StubS3Gen:
+    """Flow and HiFT stand-ins whose audio for a token is the token value, wherever the window starts"""
+
+    def __init__(self, pre_lookahead_len=3):
+        self.flow = SimpleNamespace(pre_lookahead_len=pre_lookahead_len, token_mel_ratio=token_mel_ratio)
+        self.device = torch.device("cpu")
+        self.dtype = torch.float32
+        self.trim_fade = torch.zeros(0)
+        self.windows = []
+
+    def flow_inference(self, speech_tokens, ref_dict=None, n_cfm_timesteps=None, finalize=False):
+        self.windows.append(speech_tokens.size(1))
+        tokens = speech_tokens[0] if finalize else speech_tokens[0, :-self.flow.pre_lookahead_len]
+        mels = tokens.float().repeat_interleave(token_mel_ratio)
+        return mels.view(1, 1, -1).repeat(1, 80, 1)
+
+    def hift_inference(self, speech_feat, cache_source=None):
+        return speech_feat[:, 0].repeat_interleave(hop_samples, dim=1), None
+
+
+class TestS3GenStreamer(unittest.TestCase):
+    def stream(self, tokens, chunk, **kwargs):
+        s3gen = StubS3Gen()
+        streamer = S3GenStreamer(s3gen, ref_dict={}, **kwargs)
+        chunks = []
+        for start in range(0, len(tokens), chunk):
+            streamer.push(tokens[start:start + chunk])
+            chunks.append(streamer.vocode())
+            yield streamer, s3gen, chunks
+        chunks.append(streamer.vocode(finalize=True))
+        yield streamer, s3gen, chunks
+
+    def test_bookkeeping(self):
+        tokens = torch.arange(1, 41)
+        crossfade = 4
+        for streamer, s3gen, chunks in self.stream(tokens, 7, context_tokens=5, crossfade_samples=crossfade):
+            if streamer.tail is None:
+                continue
+            # everything vocoded is returned, except the held back crossfade tail
+            self.assertEqual(streamer.vocoded_tokens, streamer.n_tokens - s3gen.flow.pre_lookahead_len)
+            self.assertEqual(streamer.tail.size(1), crossfade)
+            self.assertEqual(streamer.emitted_samples, streamer.vocoded_tokens * samples_per_token - crossfade)
+            self.assertEqual(sum(c.size(1) for c in chunks), streamer.emitted_samples)
+
+        self.assertIsNone(streamer.tail)
+        self.assertEqual(streamer.vocoded_tokens, len(tokens))
+        self.assertEqual(streamer.samples_per_token, samples_per_token)
+        self.assertEqual(streamer.emitted_samples, len(tokens) * samples_per_token)
+        expected = tokens.float().repeat_interleave(samples_per_token).unsqueeze(0)
+        torch.testing.assert_close(torch.cat(chunks, dim=1), expected)
+
+    def test_context_window(self):
+        tokens = torch.arange(1, 41)
+        for _, s3gen, _ in self.stream(tokens, 10, context_tokens=5, crossfade_samples=0):
+            pass
+        # the first window starts at the beginning, later ones reach back `context_tokens` before the new tokens
+        self.assertEqual(s3gen.windows, [10, 18, 18, 18, 8])
+
+    def test_postprocess_before_crossfade(self):
+        tokens = torch.arange(1, 31)
+        windows = []
+
+        def postprocess(wav):
+            windows.append(wav.size(1))
+            return wav * 2
+
+        for _, s3gen, chunks in self.stream(tokens, 10, context_tokens=5, crossfade_samples=4, postprocess=postprocess):
+            pass
+        # applied to the audio of every whole window, the crossfade blends the processed versions
+        lookahead = s3gen.flow.pre_lookahead_len
+        vocoded = [n - lookahead for n in s3gen.windows[:-1]] + s3gen.windows[-1:]
+        self.assertEqual(windows, [n * samples_per_token for n in vocoded])
+        expected = 2 * tokens.float().repeat_interleave(samples_per_token).unsqueeze(0)
+        torch.testing.assert_close(torch.cat(chunks, dim=1), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import torch
+
+# add the chatterbox sources to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "chatterbox" / "src"))
+
+from transformers.generation.logits_process import MinPLogitsWarper, RepetitionPenaltyLogitsProcessor, TopPLogitsWarper
+
+from chatterbox.models.t3 import llama_configs
+from chatterbox.models.t3.inference.decoding import TokenCountRepetitionPenalty
+from chatterbox.models.t3.inference.t3_hf_backend import T3HuggingfaceBackend
+from chatterbox.models.t3.modules.cond_enc import T3Cond
+from chatterbox.models.t3.modules.t3_config import T3Config
+from chatterbox.models.t3.t3 import T3
+
+tiny_llama_config = dict(
+    llama_configs.LLAMA_520M_CONFIG_DICT,
+    hidden_size=64,
+    intermediate_size=128,
+    num_hidden_layers=2,
+    num_attention_heads=4,
+    num_key_value_heads=4,
+    head_dim=16,
+    torch_dtype="float32",
+)
+
+sampling = dict(temperature=0.8, top_p=0.95, min_p=0.05, repetition_penalty=1.2, cfg_weight=0.5)
+
+
+def tiny_t3() -> T3:
+    hp = T3Config.english_only()
+    hp.llama_config_name = "tiny"
+    hp.use_perceiver_resampler = False
+    with mock.patch.dict(llama_configs.LLAMA_CONFIGS, {"tiny": tiny_llama_config}):
+        torch.manual_seed(0)
+        return T3(hp).eval()
+
+
+def text_tokens(t3: T3, length: int) -> torch.Tensor:
+    """CFG pair (two rows) of random text tokens between the start and stop tokens"""
+    tokens = torch.randint(1, t3.hp.start_text_token, (length,), generator=torch.Generator().manual_seed(length))
+    tokens = torch.cat([torch.tensor([t3.hp.start_text_token]), tokens, torch.tensor([t3.hp.stop_text_token])])
+    return tokens.unsqueeze(0).repeat(2, 1)
+
+
+def reference_inference(t3: T3, t3_cond: T3Cond, tokens: torch.Tensor, max_new_tokens: int) -> torch.Tensor:
+    """The sampler `T3.inference` used before its buffers and caches were preallocated"""
+    embeds, _ = t3.prepare_input_embeds(
+        t3_cond=t3_cond, text_tokens=tokens, speech_tokens=t3.hp.start_speech_token * torch.ones_like(tokens[:, :1]),
+        cfg_weight=sampling["cfg_weight"],
+    )
+    bos_token = torch.tensor([[t3.hp.start_speech_token]])
+    bos_embed = t3.speech_emb(bos_token) + t3.speech_pos_emb.get_fixed_embedding(0)
+    inputs_embeds = torch.cat([embeds, torch.cat([bos_embed, bos_embed])], dim=1)
+    model = T3HuggingfaceBackend(config=t3.cfg, llama=t3.tfmr, speech_enc=t3.speech_emb, speech_head=t3.speech_head)
+    penalty = RepetitionPenaltyLogitsProcessor(penalty=sampling["repetition_penalty"])
+    min_p = MinPLogitsWarper(min_p=sampling["min_p"])
+    top_p = TopPLogitsWarper(top_p=sampling["top_p"])
+
+    generated_ids = bos_token.clone()
+    output = model(inputs_embeds=inputs_embeds, past_key_values=None, use_cache=True, return_dict=True)
+    for i in range(max_new_tokens):
+        cond, uncond = output.logits[0:1, -1], output.logits[1:2, -1]
+        logits = cond + sampling["cfg_weight"] * (cond - uncond)
+        logits = penalty(generated_ids, logits) / sampling["temperature"]
+        logits = top_p(generated_ids, min_p(generated_ids, logits))
+        next_token = torch.multinomial(torch.softmax(logits, dim=-1), num_samples=1)
+        generated_ids = torch.cat([generated_ids, next_token], dim=1)
+        if next_token.view(-1) == t3.hp.stop_speech_token:
+            break
+        next_embed = t3.speech_emb(next_token) + t3.speech_pos_emb.get_fixed_embedding(i + 1)
+        output = model(inputs_embeds=torch.cat([next_embed, next_embed]), past_key_values=output.past_key_values, return_dict=True)
+    return generated_ids[:, 1:]
+
+
+def reference_inference_batch(t3: T3, t3_cond: T3Cond, chunks, max_new_tokens: int):
+    """The sampler `T3.inference_batch` used before its buffers, masks and caches were preallocated"""
+    bos_token = torch.tensor([[t3.hp.start_speech_token]])
+    bos_embed = t3.speech_emb(bos_token) + t3.speech_pos_emb.get_fixed_embedding(0)
+    chunk_embeds = []
+    for tokens in chunks:
+        embeds, _ = t3.prepare_input_embeds(
+            t3_cond=t3_cond, text_tokens=tokens, speech_tokens=t3.hp.start_speech_token * torch.ones_like(tokens[:, :1]),
+            cfg_weight=sampling["cfg_weight"],
+        )
+        chunk_embeds.append(torch.cat([embeds, bos_embed.expand(2, -1, -1)], dim=1))
+    rows = [embeds[r] for r in range(2) for embeds in chunk_embeds]
+    max_len = max(row.size(0) for row in rows)
+    inputs_embeds = rows[0].new_zeros(len(rows), max_len, rows[0].size(-1))
+    attention_mask = torch.zeros(len(rows), max_len, dtype=torch.long)
+    for i, row in enumerate(rows):
+        inputs_embeds[i, max_len - row.size(0):] = row
+        attention_mask[i, max_len - row.size(0):] = 1
+    model = T3HuggingfaceBackend(config=t3.cfg, llama=t3.tfmr, speech_enc=t3.speech_emb, speech_head=t3.speech_head)
+    penalty = RepetitionPenaltyLogitsProcessor(penalty=sampling["repetition_penalty"])
+    min_p = MinPLogitsWarper(min_p=sampling["min_p"])
+    top_p = TopPLogitsWarper(top_p=sampling["top_p"])
+
+    n = len(chunks)
+    generated_ids = bos_token.repeat(n, 1)
+    output = model(
+        inputs_embeds=inputs_embeds, attention_mask=attention_mask,
+        position_ids=(attention_mask.cumsum(-1) - 1).clamp(min=0), use_cache=True, return_dict=True,
+    )
+    for i in range(max_new_tokens):
+        cond, uncond = output.logits[:n, -1], output.logits[n:, -1]
+        logits = cond + sampling["cfg_weight"] * (cond - uncond)
+        logits = penalty(generated_ids, logits) / sampling["temperature"]
+        logits = top_p(generated_ids, min_p(generated_ids, logits))
+        next_token = torch.multinomial(torch.softmax(logits, dim=-1), num_samples=1)
+        generated_ids = torch.cat([generated_ids, next_token], dim=1)
+        next_embed = t3.speech_emb(next_token) + t3.speech_pos_emb.get_fixed_embedding(i + 1)
+        attention_mask = torch.cat([attention_mask, attention_mask.new_ones(len(rows), 1)], dim=1)
+        output = model(
+            inputs_embeds=torch.cat([next_embed, next_embed]), past_key_values=output.past_key_values,
+            attention_mask=attention_mask, position_ids=attention_mask.sum(-1, keepdim=True) - 1, return_dict=True,
+        )
+    return [generated_ids[c:c + 1, 1:] for c in range(n)]
+
+
+class TestT3Sampling(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.t3 = tiny_t3()
+        cls.t3_cond = T3Cond(speaker_emb=torch.randn(1, 256), emotion_adv=0.5 * torch.ones(1, 1, 1))
+
+    def test_repetition_penalty(self):
+        """test that the count-based penalty matches the HF processor over the whole history"""
+        ids = torch.randint(0, 50, (3, 40))
+        scores = torch.randn(3, 50)
+        penalty = TokenCountRepetitionPenalty(1.3, 3, 50, "cpu")
+        penalty.update(ids)
+        expected = RepetitionPenaltyLogitsProcessor(penalty=1.3)(ids, scores.clone())
+        torch.testing.assert_close(penalty(None, scores), expected)
+
+    def test_inference_matches_reference(self):
+        """test that the sampler draws the same tokens as before at the same seed, with either cache"""
+        tokens = text_tokens(self.t3, 12)
+        torch.manual_seed(1)
+        expected = reference_inference(self.t3, self.t3_cond, tokens, max_new_tokens=24)
+        for use_static_cache in (False, True):
+            torch.manual_seed(1)
+            predicted = self.t3.inference(
+                t3_cond=self.t3_cond, text_tokens=tokens, max_new_tokens=24, use_static_cache=use_static_cache, **sampling,
+            )
+            self.assertTrue(torch.equal(predicted, expected), f"use_static_cache={use_static_cache}")
+
+    def test_inference_batch_matches_reference(self):
+        """test that the batched sampler draws the same tokens as before at the same seed, with either cache"""
+        chunks = [text_tokens(self.t3, 12), text_tokens(self.t3, 7)]
+        torch.manual_seed(2)
+        expected = reference_inference_batch(self.t3, self.t3_cond, chunks, max_new_tokens=16)
+        for use_static_cache in (False, True):
+            torch.manual_seed(2)
+            predicted = self.t3.inference_batch(
+                t3_cond=self.t3_cond, text_tokens=chunks, max_new_tokens=16, use_static_cache=use_static_cache, **sampling,
+            )
+            for tokens, reference in zip(predicted, expected):
+                self.assertTrue(torch.equal(tokens, reference), f"use_static_cache={use_static_cache}")
+
+
+if __name__ == "__main__":
+    unittest.main()
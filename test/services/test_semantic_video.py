@@ -0,0 +1,203 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+# add project root to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from app.services import semantic_video
+from app.services.utils import embedding_store, ffmpeg_renderer, material_catalog, material_index, model_registry
+from app.services.utils.embedding_cache import EmbeddingCache
+from app.services.utils.sqlite_db import LocalConnection
+
+
+class TestSemanticVideoService(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _temp_catalog(self):
+        """point the material catalog at a database in the temp dir instead of storage/cache_videos"""
+        connection = LocalConnection(os.path.join(self.temp_dir.name, "materials.db"), material_catalog._schema)
+        return mock.patch.object(material_catalog, "_conn", connection)
+
+    def test_embedding_store(self):
+        """test that stored embeddings are reused and the store stays bounded"""
+        store = embedding_store.EmbeddingStore(os.path.join(self.temp_dir.name, "embeddings.db"), max_entries=3)
+        encoded = []
+
+        def encode(texts):
+            encoded.extend(texts)
+            return np.array([[len(text), 1.0] for text in texts])
+
+        vectors = store.encode("model", ["ocean waves", "city", "ocean waves"], encode)
+        self.assertEqual(vectors.shape, (3, 2))
+        self.assertEqual(encoded, ["ocean waves", "city"])
+
+        # whitespace variants share a key, other models do not
+        vectors = store.encode("model", [" ocean  waves", "city"], encode)
+        self.assertEqual(encoded, ["ocean waves", "city"])
+        self.assertEqual(tuple(vectors[0]), (11.0, 1.0))
+        store.encode("other-model", ["city"], encode)
+        self.assertEqual(encoded[-1], "city")
+
+        store.encode("model", ["forest", "desert"], encode)
+        self.assertEqual(store.count(), 3)
+
+    def test_material_catalog(self):
+        """test that metadata lives in the catalog and legacy sidecars are imported"""
+        video_paths = [os.path.join(self.temp_dir.name, f"vid-{i}.mp4") for i in range(3)]
+        for video_path in video_paths:
+            with open(video_path, "wb") as f:
+                f.write(b"video")
+        legacy = {"video_path": video_paths[0], "search_term": "ocean waves", "thumbnail_url": "https://example.com/0.jpg"}
+        with open(semantic_video.get_metadata_path(video_paths[0]), "w", encoding="utf-8") as f:
+            json.dump(legacy, f)
+
+        with self._temp_catalog():
+            semantic_video.save_video_metadata(video_paths[1], "city night", {"preview_images": ["a.jpg", "b.jpg"]})
+            metadata = semantic_video.get_video_metadata_list(video_paths)
+
+            self.assertEqual([m["search_term"] for m in metadata], ["ocean waves", "city night", "vid-2"])
+            self.assertEqual(metadata[0]["thumbnail_url"], "https://example.com/0.jpg")
+            self.assertEqual(metadata[1]["preview_images"], ["a.jpg", "b.jpg"])
+            self.assertIsNone(semantic_video.load_video_metadata(video_paths[2]))
+
+            rows = material_catalog.list_directory(self.temp_dir.name)
+            self.assertEqual(len(rows), 2)
+            self.assertEqual(rows[0]["embedding_key"], embedding_store.text_key(rows[0]["search_term"]))
+
+            material_catalog.remove(video_paths)
+            self.assertEqual(material_catalog.list_directory(self.temp_dir.name), [])
+
+    def test_frame_embeddings(self):
+        """test that keyframes are sampled at CLIP size and their embeddings stored per model"""
+        frames = ffmpeg_renderer.sample_keyframes(str(Path(__file__).parent.parent / "resources" / "1.png.mp4"))
+        self.assertEqual(frames.shape[1:], (224, 224, 3))
+        self.assertGreaterEqual(len(frames), 1)
+
+        video_path = os.path.join(self.temp_dir.name, "vid-0.mp4")
+        embeddings = np.random.rand(len(frames), 8).astype(np.float32)
+        with self._temp_catalog():
+            material_catalog.save_frame_embeddings(video_path, "clip", embeddings)
+            stored = material_catalog.frame_embeddings([video_path], "clip")
+            np.testing.assert_array_equal(stored[os.path.abspath(video_path)], embeddings)
+            self.assertEqual(material_catalog.frame_embeddings([video_path], "other-clip"), {})
+
+            material_catalog.remove([video_path])
+            self.assertEqual(material_catalog.frame_embeddings([video_path], "clip"), {})
+
+    def test_material_index_model(self):
+        """test that the local index is rebuilt when another semantic model is requested"""
+        rows = [{"video_path": os.path.join(self.temp_dir.name, "vid-0.mp4"), "search_term": "ocean", "updated_at": 1.0}]
+        dims = {"small": 2, "large": 3}
+        encoded = []
+
+        def encode_texts(texts, model_name=None):
+            encoded.append(model_name)
+            return np.ones((len(texts), dims[model_name]), dtype=np.float32)
+
+        index = material_index.MaterialIndex(self.temp_dir.name)
+        index._imported = True
+        with mock.patch.object(material_catalog, "list_directory", lambda directory, since=0: [r for r in rows if r["updated_at"] > since]), \
+                mock.patch.object(material_catalog, "metadata", dict), \
+                mock.patch.object(semantic_video, "encode_texts", encode_texts):
+            index.refresh("small")
+            self.assertEqual(index.embeddings.shape, (1, 2))
+            index.refresh("large")
+            self.assertEqual((index.model_name, index.embeddings.shape), ("large", (1, 3)))
+            self.assertEqual(len(index.query(["sea"], min_similarity=0)[0]), 1)
+        self.assertEqual(encoded, ["small", "large", "large"])
+
+    def test_similarity_matrix_model(self):
+        """test that sentences and search terms are encoded with the requested model"""
+        loaded = []
+
+        def load_model(model_name="all-mpnet-base-v2"):
+            loaded.append(model_name)
+            return model_name
+
+        def encode_batch(model, texts, batch_size=32):
+            return np.ones((len(texts), 2), dtype=np.float32) / np.sqrt(2)
+
+        # another task loaded a different model last
+        with mock.patch.object(semantic_video, "_model_name", "large"), \
+                mock.patch.object(semantic_video, "load_model", load_model), \
+                mock.patch.object(semantic_video, "_encode_batch", encode_batch), \
+                mock.patch.object(embedding_store, "enabled", lambda: False):
+            matrix = semantic_video.similarity_matrix(["the sea"], [{"search_term": "ocean"}], model_name="small")
+        self.assertEqual(matrix.shape, (1, 1))
+        self.assertEqual(loaded, ["small", "small"])
+
+    def test_assign_videos(self):
+        """test that reuse only happens where it beats the best unused video"""
+        similarity = np.array([[0.9, 0.1], [0.8, 0.2], [0.85, 0.1]])
+        self.assertEqual(semantic_video.assign_videos(similarity, max_video_reuse=2), [0, 1, 0])
+        # without reuse the third selection is left without a video
+        self.assertEqual(semantic_video.assign_videos(similarity, max_video_reuse=1).count(None), 1)
+
+    def test_embedding_cache(self):
+        """test that the cache evicts by bytes and falls back to its disk tier"""
+        store = embedding_store.EmbeddingStore(os.path.join(self.temp_dir.name, "embeddings.db"))
+        vector = np.ones(4, dtype=np.float32)
+        cache = EmbeddingCache("clip-image", max_bytes=2 * vector.nbytes, disk_store=lambda: store)
+
+        for i in range(3):
+            cache.put(f"url-{i}", vector * i)
+        self.assertNotIn("url-0", cache)
+        self.assertEqual(len(cache), 2)
+
+        self.assertEqual(cache.get("url-2")[0], 2.0)
+        self.assertEqual(cache.get("url-0")[0], 0.0)
+        self.assertIsNone(cache.get("url-3"))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["disk_hits"], stats["misses"]), (1, 1, 1))
+        # loading url-0 from disk evicted url-1, the least recently used entry
+        self.assertEqual(stats["evictions"], 2)
+        self.assertNotIn("url-1", cache)
+        self.assertLessEqual(stats["bytes"], stats["max_bytes"])
+
+    def test_model_registry(self):
+        """test that models load once and the least recently used ones are evicted over budget"""
+        registry = model_registry.ModelRegistry(max_bytes=2 * 1024)
+        loads = []
+
+        def loader(name):
+            def load():
+                loads.append(name)
+                return np.zeros(1024, dtype=np.uint8)
+            return load
+
+        self.assertIs(registry.get("a", loader("a")), registry.get("a", loader("a")))
+        registry.get("b", loader("b"))
+        with registry.using("a", loader("a")):
+            # b is the only model that may be evicted while a is in use
+            registry.get("c", loader("c"))
+            self.assertTrue(registry.is_loaded("a"))
+            self.assertFalse(registry.is_loaded("b"))
+        self.assertEqual(loads, ["a", "b", "c"])
+        self.assertEqual(registry.stats()["evictions"], 1)
+        self.assertLessEqual(registry.resident_bytes(), 2 * 1024)
+
+        # models idle for too long are unloaded whenever any model is requested, unless pinned
+        registry = model_registry.ModelRegistry(idle_timeout=60)
+        registry.get("a", loader("a"))
+        registry.get("b", loader("b"))
+        for name in ("a", "b"):
+            registry._entries[name].last_used -= 120
+        with registry.pinned("b"):
+            registry.get("c", loader("c"))
+            self.assertFalse(registry.is_loaded("a"))
+            self.assertTrue(registry.is_loaded("b"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,14 +2,28 @@
 import unittest
 import os
 import sys
+import tempfile
+from unittest import mock
 from pathlib import Path
+import numpy as np
 from moviepy import (
     VideoFileClip,
 )
 # add project root to python path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
-from app.models.schema import MaterialInfo
+from app.models.schema import EncoderProfile, MaterialInfo, VideoConcatMode, VideoParams
 from app.services import video as vd
+from app.services.utils import (
+    ass_subtitles,
+    clip_cache,
+    encoder_profiles,
+    ffmpeg_renderer,
+    material_catalog,
+    subtitle_overlay,
+    text_metrics,
+    word_sprites,
+)
+from app.services.utils.sqlite_db import LocalConnection
 from app.utils import utils
 
 resources_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "resources")
@@ -81,5 +95,262 @@ class TestVideoService(unittest.TestCase):
         except Exception as e:
             self.fail(f"test wrap_text failed: {str(e)}")
 
+    def test_break_lines(self):
+        """test the prefix-sum line breakers"""
+        font_path = os.path.join(utils.font_dir(), "Charm-Bold.ttf")
+        word_width = text_metrics.advance(font_path, 30, "word")
+        space_width = text_metrics.advance(font_path, 30, " ")
+
+        # exactly three words fit on a line
+        max_width = 3 * word_width + 2 * space_width
+        lines = text_metrics.break_words(["word"] * 7, font_path, 30, max_width)
+        self.assertEqual(lines, ["word word word", "word word word", "word"])
+        self.assertIsNone(text_metrics.break_words(["word", "extraordinary"], font_path, 30, word_width))
+
+        lines = text_metrics.break_chars("中文换行处理", font_path, 30, 2 * text_metrics.advance(font_path, 30, "中"))
+        self.assertEqual(lines, ["中文", "换行", "处理"])
+
+    def test_build_filter_graph(self):
+        """test the single-pass filter graph built from a clip plan"""
+        plan = [
+            vd.SubClippedVideoClip(file_path="a.mp4", start_time=0, end_time=4, width=1080, height=1920),
+            vd.SubClippedVideoClip(file_path="b.mp4", start_time=2, end_time=5, width=1920, height=1080, transition="FadeIn"),
+            vd.SubClippedVideoClip(file_path="c.mp4", start_time=0, end_time=3, width=1080, height=1920, transition="SlideIn", side="left"),
+        ]
+        graph = ffmpeg_renderer.build_filter_graph(plan, 1080, 1920, 30)
+        print(graph)
+
+        self.assertIn("[0:v]scale=1080:1920", graph)
+        self.assertIn("fade=t=in:st=0:d=1", graph)
+        self.assertIn("[bg2][fg2]overlay", graph)
+        self.assertTrue(graph.endswith("[v0][v1][v2]concat=n=3:v=1:a=0[outv]"))
+
+        args = ffmpeg_renderer.build_input_args(plan)
+        self.assertEqual(args.count("-i"), 3)
+        self.assertEqual(args[args.index("b.mp4") - 2], "3.000")
+
+    def test_render_video(self):
+        """test that the plan, subtitles and audio are rendered into the final video in one pass"""
+        plan = [
+            vd.SubClippedVideoClip(file_path=os.path.join(resources_dir, "2.png.mp4"), start_time=0, end_time=2),
+            vd.SubClippedVideoClip(file_path=os.path.join(resources_dir, "3.png.mp4"), start_time=1, end_time=2, transition="FadeIn"),
+        ]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            audio_file = os.path.join(temp_dir, "audio.m4a")
+            ffmpeg_renderer.run_ffmpeg(["-f", "lavfi", "-i", "sine=frequency=440:duration=4", "-c:a", "aac", audio_file])
+            subtitle_file = os.path.join(temp_dir, "subtitle.srt")
+            with open(subtitle_file, "w", encoding="utf-8") as f:
+                f.write("1\n00:00:00,000 --> 00:00:02,000\nhello\n\n")
+            output_file = os.path.join(temp_dir, "final.mp4")
+
+            ffmpeg_renderer.render_video(
+                plan, audio_file, output_file, 216, 384, vd.fps, vd.ffmpeg_encoder_args(EncoderProfile.draft),
+                subtitle_file=subtitle_file, fonts_dir=utils.font_dir(), duration=3,
+            )
+            info = ffmpeg_renderer.probe_video(output_file, cache=False)
+            self.assertEqual((info["width"], info["height"]), (216, 384))
+            self.assertAlmostEqual(info["duration"], 3, delta=0.1)
+            clip = VideoFileClip(output_file)
+            self.assertIsNotNone(clip.audio)
+            clip.close()
+
+            # with a worker pool the clips are normalized as segments first, which are removed afterwards
+            with mock.patch.dict(vd.config.app, {"enable_clip_cache": False}):
+                ffmpeg_renderer.render_video(
+                    plan, audio_file, output_file, 216, 384, vd.fps, vd.ffmpeg_encoder_args(EncoderProfile.draft),
+                    duration=3, segment_encoder_args=vd.ffmpeg_encoder_args(), workers=2,
+                )
+            self.assertAlmostEqual(ffmpeg_renderer.probe_video(output_file, cache=False)["duration"], 3, delta=0.1)
+            self.assertEqual(sorted(os.listdir(temp_dir)), ["audio.m4a", "final.mp4", "subtitle.srt"])
+
+            # the rasterized subtitle path reads the same frames from the plan
+            reader = ffmpeg_renderer.ClipPlanReader(plan, 216, 384, vd.fps)
+            try:
+                first = reader.get_frame(0).copy()
+                self.assertEqual(first.shape, (384, 216, 3))
+                self.assertEqual(reader.get_frame(2.5).shape, (384, 216, 3))
+                self.assertEqual(reader.index, int(2.5 * vd.fps))
+                # past the end, the last frame is repeated
+                self.assertIs(reader.get_frame(10), reader.frame)
+                self.assertEqual(reader.index, 3 * vd.fps - 1)
+                # going back restarts the decoder
+                np.testing.assert_array_equal(reader.get_frame(0), first)
+            finally:
+                reader.close()
+
+    def test_generate_video_from_plan(self):
+        """test that rasterized subtitles are blended into the frames read from the plan"""
+        plan = [vd.SubClippedVideoClip(file_path=os.path.join(resources_dir, "2.png.mp4"), start_time=0, end_time=2)]
+        params = VideoParams(
+            video_subject="test",
+            video_aspect="9:16",
+            bgm_type="",
+            subtitle_enabled=True,
+            font_name="Charm-Bold.ttf",
+            encoder_profile=EncoderProfile.draft,
+        )
+        with tempfile.TemporaryDirectory() as temp_dir:
+            audio_file = os.path.join(temp_dir, "audio.m4a")
+            ffmpeg_renderer.run_ffmpeg(["-f", "lavfi", "-i", "sine=frequency=440:duration=2", "-c:a", "aac", audio_file])
+            subtitle_file = os.path.join(temp_dir, "subtitle.srt")
+            with open(subtitle_file, "w", encoding="utf-8") as f:
+                f.write("1\n00:00:00,000 --> 00:00:01,000\nhello\n\n")
+            combined_file = os.path.join(temp_dir, "combined-1.mp4")
+            output_file = os.path.join(temp_dir, "final-1.mp4")
+
+            with mock.patch.dict(vd.config.app, {"subtitle_renderer": "sprite"}):
+                vd.generate_video(combined_file, audio_file, subtitle_file, output_file, params, clip_plan=plan)
+
+            # no intermediate combined video was written
+            self.assertFalse(os.path.exists(combined_file))
+            clip = VideoFileClip(output_file)
+            self.assertEqual(tuple(clip.size), (1080, 1920))
+            self.assertAlmostEqual(clip.duration, 2, delta=0.1)
+            # the subtitle is drawn in the first second only
+            self.assertFalse(np.array_equal(clip.get_frame(0.5), clip.get_frame(1.5)))
+            clip.close()
+
+    def test_clip_cache(self):
+        """test that a second combine_videos run with the default config reuses the cached subclip"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_dir = os.path.join(temp_dir, "cache_clips")
+            os.makedirs(cache_dir)
+            audio_file = os.path.join(temp_dir, "audio.m4a")
+            ffmpeg_renderer.run_ffmpeg(["-f", "lavfi", "-i", "sine=frequency=440:duration=5", "-c:a", "aac", audio_file])
+            connection = LocalConnection(os.path.join(temp_dir, "materials.db"), material_catalog._schema)
+            lookups = []
+
+            def get(key, ext):
+                lookups.append(cache_get(key, ext))
+                return lookups[-1]
+
+            cache_get = clip_cache.get
+            with mock.patch.dict(vd.config.app, {"max_clip_workers": 0, "enable_clip_cache": True}), \
+                    mock.patch.object(clip_cache, "cache_dir", return_value=cache_dir), \
+                    mock.patch.object(material_catalog, "_conn", connection), \
+                    mock.patch.object(clip_cache, "put", wraps=clip_cache.put) as put, \
+                    mock.patch.object(clip_cache, "get", side_effect=get):
+                for i in range(2):
+                    # the 2s subclip of the 3s video is looped to cover the audio
+                    output_file = os.path.join(temp_dir, f"combined-{i+1}.mp4")
+                    vd.combine_videos(
+                        output_file, [os.path.join(resources_dir, "2.png.mp4")], audio_file,
+                        video_concat_mode=VideoConcatMode.sequential, max_clip_duration=2,
+                    )
+                    self.assertAlmostEqual(ffmpeg_renderer.probe_video(output_file, cache=False)["duration"], 6, delta=0.1)
+
+            # normalized once into the cache on the first run, read from it on the second
+            self.assertEqual(put.call_count, 1)
+            self.assertEqual(os.listdir(cache_dir), [os.path.basename(lookups[-1])])
+            self.assertTrue(all(path is None for path in lookups[:-1]))
+
+    def test_semantic_start_time(self):
+        """test that semantic cuts are varied per sentence but stable across renders"""
+        start = vd.semantic_start_time("/videos/a.mp4", "ocean waves", 10)
+        self.assertEqual(start, vd.semantic_start_time("/other/a.mp4", "ocean waves", 10))
+        self.assertTrue(0 <= start <= 10)
+        starts = {vd.semantic_start_time("/videos/a.mp4", f"sentence {i}", 10) for i in range(5)}
+        self.assertGreater(len(starts), 1)
+        self.assertEqual(vd.semantic_start_time("/videos/a.mp4", "ocean waves", 0), 0)
+
+    def test_ken_burns_boxes(self):
+        """test the precomputed ken burns crop boxes"""
+        boxes = vd.ken_burns_boxes(1350, 2400, 1080, 1920, duration=5, pan_x=1, pan_y=-1)
+        print(boxes[0], boxes[-1])
+
+        self.assertEqual(boxes.shape, (5 * vd.fps, 4))
+        # first frame is a centered 1080x1920 crop
+        self.assertEqual(tuple(boxes[0]), (135.0, 240.0, 1215.0, 2160.0))
+        # zooming in shrinks the box, panning keeps it inside the image
+        widths = boxes[:, 2] - boxes[:, 0]
+        self.assertTrue((widths[1:] < widths[:-1]).all())
+        self.assertTrue((boxes[:, :2] >= 0).all())
+        self.assertTrue((boxes[:, 2] <= 1350).all() and (boxes[:, 3] <= 2400).all())
+
+        clip = vd.ken_burns_clip(self.test_img_path, 2, 1080, 1920, pan_x=-1)
+        self.assertEqual(clip.get_frame(1.5).shape, (1920, 1080, 3))
+
+    def test_subtitle_track(self):
+        """test the time index and blending of rasterized subtitle cues"""
+        red = np.zeros((2, 4, 4), dtype=np.uint8)
+        red[:, :, 0] = 255
+        red[:, :, 3] = 128
+        sprites = [
+            subtitle_overlay.SubtitleSprite(0, 10, 0, 0, red),
+            subtitle_overlay.SubtitleSprite(2, 3, 0, 0, red),
+            subtitle_overlay.SubtitleSprite(4, 5, 0, 0, red),
+        ]
+        track = subtitle_overlay.SubtitleTrack(sprites)
+
+        self.assertEqual(track.active(2.5), [sprites[0], sprites[1]])
+        self.assertEqual(track.active(3.5), [sprites[0]])
+        self.assertEqual(track.active(10), [])
+
+        frame = np.zeros((4, 8, 3), dtype=np.uint8)
+        blended = track.blend(frame, 4.5)
+        # two half transparent red layers on black
+        self.assertEqual(tuple(blended[0, 0]), (192, 0, 0))
+        self.assertEqual(tuple(blended[3, 7]), (0, 0, 0))
+        self.assertEqual(frame.max(), 0)
+
+    def test_word_highlight_sprites(self):
+        """test that highlight states are assembled from cached word sprites"""
+        font_path = os.path.join(utils.font_dir(), "Charm-Bold.ttf")
+        wrapped = "hello world\nhello again"
+        style = (font_path, 40, 500, (255, 255, 255), (255, 0, 0), (0, 0, 0), 2)
+
+        word_sprites.word_sprite.cache_clear()
+        normal = word_sprites.render_highlighted(wrapped, frozenset(), *style)
+        highlighted = word_sprites.render_highlighted(wrapped, frozenset({2}), *style)
+
+        self.assertEqual(normal.size, highlighted.size)
+        # "hello" is drawn once per color, the second line reuses the sprite
+        info = word_sprites.word_sprite.cache_info()
+        self.assertEqual(info.misses, 4)
+        self.assertEqual(info.hits, 1)
+        self.assertNotEqual(normal.tobytes(), highlighted.tobytes())
+
+    def test_ass_format_time(self):
+        self.assertEqual(ass_subtitles.format_time(3725.456), "1:02:05.46")
+        self.assertEqual(ass_subtitles.escape_text("a {b}\nc"), "a (b)\\Nc")
+
+    def test_karaoke_text(self):
+        """test the ASS event text compiled from an enhanced subtitle cue"""
+        cue = {
+            "start_time": 1.0,
+            "end_time": 2.5,
+            "text": "hello world",
+            "lines": ["hello", "world"],
+            "words": [
+                {"word": "world.", "start": 1.6, "end": 2.5},
+                {"word": "Hello", "start": 1.0, "end": 1.5},
+            ],
+        }
+        text = ass_subtitles.karaoke_text(cue, "#FFFFFF", "#FF0000")
+        self.assertIn("\\t(0,1,\\1c&H0000FF&)\\t(500,501,\\1c&HFFFFFF&)}hello", text)
+        self.assertIn("\\N{\\1c&HFFFFFF&\\t(600,601,", text)
+
+        text = ass_subtitles.karaoke_text(cue, "#FFFFFF", "#FF0000", fill=True)
+        self.assertEqual(text, "{\\1c&H0000FF&\\2c&HFFFFFF&}{\\kf50}hello \\N{\\k10}{\\kf90}world")
+
+    def test_encoder_profiles(self):
+        """test the encoder arguments of the profiles and of intermediates"""
+        draft = vd.ffmpeg_encoder_args(EncoderProfile.draft)
+        self.assertEqual(draft[draft.index("-preset") + 1], "veryfast")
+        self.assertIn("-tune", draft)
+
+        standard = vd.ffmpeg_encoder_args("standard")
+        self.assertEqual(standard[standard.index("-crf") + 1], "18")
+        self.assertNotIn("-tune", standard)
+
+        # intermediates are 4:2:0 High profile, like stream-copied clips, and carry no bitrate target
+        intermediate = vd.ffmpeg_encoder_args()
+        self.assertNotIn("-qp", intermediate)
+        self.assertEqual(intermediate[intermediate.index("-profile:v") + 1], "high")
+        self.assertEqual(intermediate[intermediate.index("-pix_fmt") + 1], "yuv420p")
+        self.assertNotIn("-b:v", intermediate)
+
+        self.assertEqual(encoder_profiles.get_profile("unknown"), encoder_profiles.profiles["standard"])
+
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file
@@ -1,7 +1,9 @@
 import asyncio
+import io
 import unittest
 import os
 import sys
+import wave
 from pathlib import Path
 
 # add project root to python path
@@ -101,6 +103,15 @@ class TestVoiceService(unittest.TestCase):
 
         self.loop.run_until_complete(_do())
 
+    def test_wav_stream_header(self):
+        # the header of a streamed WAV has no length, players read the PCM data that follows until the end
+        pcm = b"\x01\x00\xff\x7f" * 100
+        with wave.open(io.BytesIO(vs.wav_stream_header(24000) + pcm)) as wav:
+            self.assertEqual(wav.getframerate(), 24000)
+            self.assertEqual(wav.getnchannels(), 1)
+            self.assertEqual(wav.getsampwidth(), 2)
+            self.assertEqual(wav.readframes(1000), pcm)
+
 if __name__ == "__main__":
     # python -m unittest test.services.test_voice.TestVoiceService.test_azure_tts_v1
     # python -m unittest test.services.test_voice.TestVoiceService.test_azure_tts_v2